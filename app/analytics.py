@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, func, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import DailyStat, EmotionHistory, PHQ9History, Report, User
+
+# 내보내기는 이 행 수씩 끊어 읽는다 (메모리에는 한 청크만 둔다)
+EXPORT_CHUNK = int(os.getenv("ANALYTICS_EXPORT_CHUNK", "1000"))
+NO_COHORT = "(none)"
+
+HISTORY = {"phq9": PHQ9History, "emotion": EmotionHistory}
+EXPORT_COLUMNS = {
+    "phq9": ("phq9_history_id", "user_id", "conversation_id", "score", "level", "created_at"),
+    "emotion": ("emotion_history_id", "user_id", "conversation_id", "emotion", "depressed", "created_at"),
+}
+
+
+async def _new_rows(db: AsyncSession, model, rows: list) -> list:
+    # 이미 들어간 request_key는 건너뛴다 (쓰기 큐 재시도 멱등성)
+    if not rows:
+        return []
+    keys = [row["request_key"] for row in rows]
+    existing = set((await db.execute(select(model.request_key).where(model.request_key.in_(keys)))).scalars())
+    return [row for row in rows if row["request_key"] not in existing]
+
+
+async def record_history(db: AsyncSession, emotions: list, phq9: list) -> int:
+    """감정/PHQ-9 기록을 추가하고 같은 트랜잭션에서 사용자별, 코호트별 일별 집계를 더한다.
+
+    새로 들어간 기록만 집계하므로 같은 작업이 다시 반영되어도 숫자가 두 번 오르지 않는다. commit은 호출자가 한다.
+    """
+    emotions = await _new_rows(db, EmotionHistory, emotions)
+    phq9 = await _new_rows(db, PHQ9History, phq9)
+    if not emotions and not phq9:
+        return 0
+    if emotions:
+        await db.execute(insert(EmotionHistory), emotions)
+    if phq9:
+        await db.execute(insert(PHQ9History), phq9)
+
+    user_ids = {row["user_id"] for row in emotions + phq9}
+    cohorts = dict((await db.execute(select(User.user_id, User.business_type).where(User.user_id.in_(user_ids)))).all())
+    deltas = defaultdict(lambda: [0, 0])  # (scope, scope_key, day, metric) -> [count, total]
+
+    def add(row, metric, value=0):
+        day = row["created_at"].date()
+        for scope, key in (("user", str(row["user_id"])), ("cohort", cohorts.get(row["user_id"]) or NO_COHORT)):
+            delta = deltas[(scope, key, day, metric)]
+            delta[0] += 1
+            delta[1] += value
+
+    for row in emotions:
+        add(row, "turns")
+        add(row, f"emotion:{row['emotion']}")
+        if row.get("depressed"):
+            add(row, "depressed")
+    for row in phq9:
+        add(row, "phq9", row["score"])
+    await bump_daily_stats(db, deltas)
+    return len(emotions) + len(phq9)
+
+
+async def bump_daily_stats(db: AsyncSession, deltas: dict):
+    """(scope, scope_key, day, metric)별 증가분을 더한다. 있는 행은 count = count + n으로 갱신한다."""
+    table = DailyStat.__table__
+    c = table.c
+    keys = list(deltas)
+    existing = set((await db.execute(
+        select(c.scope, c.scope_key, c.day, c.metric).where(tuple_(c.scope, c.scope_key, c.day, c.metric).in_(keys))
+    )).all())
+    updates = [
+        {"k_scope": k[0], "k_key": k[1], "k_day": k[2], "k_metric": k[3], "d_count": d[0], "d_total": d[1]}
+        for k, d in deltas.items() if k in existing
+    ]
+    inserts = [
+        {"scope": k[0], "scope_key": k[1], "day": k[2], "metric": k[3], "count": d[0], "total": d[1]}
+        for k, d in deltas.items() if k not in existing
+    ]
+    if updates:
+        await db.execute(
+            table.update()
+            .where(c.scope == bindparam("k_scope"), c.scope_key == bindparam("k_key"),
+                   c.day == bindparam("k_day"), c.metric == bindparam("k_metric"))
+            .values(count=c.count + bindparam("d_count"), total=c.total + bindparam("d_total")),
+            updates,
+        )
+    if inserts:
+        # 다른 워커가 같은 키를 먼저 넣었으면 IntegrityError로 배치가 롤백되고 쓰기 큐가 다시 시도한다
+        await db.execute(table.insert(), inserts)
+
+
+def _row_dict(columns, row) -> dict:
+    return {
+        name: value.isoformat() if isinstance(value, (datetime, date)) else value
+        for name, value in zip(columns, row)
+    }
+
+
+async def list_history(db: AsyncSession, kind: str, user_id: int, before: int = None, limit: int = 50) -> dict:
+    """사용자의 PHQ-9/감정 기록을 최신순으로 limit개. 다음 페이지는 next_before를 before로 넘긴다."""
+    model = HISTORY[kind]
+    columns = EXPORT_COLUMNS[kind]
+    id_column = getattr(model, columns[0])
+    query = select(*(getattr(model, name) for name in columns)).where(model.user_id == user_id)
+    if before is not None:
+        query = query.where(id_column < before)
+    rows = (await db.execute(query.order_by(id_column.desc()).limit(limit + 1))).all()
+    return {
+        "items": [_row_dict(columns, row) for row in rows[:limit]],
+        "next_before": rows[limit - 1][0] if len(rows) > limit else None,
+    }
+
+
+def _empty_stats() -> dict:
+    return {"turns": 0, "depressed": 0, "phq9_count": 0, "phq9_avg": None, "emotions": {}}
+
+
+def _apply_metric(item: dict, metric: str, count: int, total: int):
+    if metric.startswith("emotion:"):
+        item["emotions"][metric[len("emotion:"):]] = count
+    elif metric == "phq9":
+        item["phq9_count"] = count
+        item["phq9_avg"] = round(total / count, 2) if count else None
+    else:
+        item[metric] = count
+
+
+def _stat_filters(scope: str, key: str, start: date = None, end: date = None) -> list:
+    filters = [DailyStat.scope == scope, DailyStat.scope_key == key]
+    if start is not None:
+        filters.append(DailyStat.day >= start)
+    if end is not None:
+        filters.append(DailyStat.day <= end)
+    return filters
+
+
+async def daily_stats(db: AsyncSession, scope: str, key: str, start: date = None, end: date = None,
+                      before: date = None, limit: int = 31) -> dict:
+    """일별 턴 수, 우울 턴 수, 감정 분포, PHQ-9 평균을 최근 날짜부터 limit일씩."""
+    filters = _stat_filters(scope, key, start, end)
+    day_query = select(DailyStat.day).where(*filters).distinct()
+    if before is not None:
+        day_query = day_query.where(DailyStat.day < before)
+    days = (await db.execute(day_query.order_by(DailyStat.day.desc()).limit(limit + 1))).scalars().all()
+    page = days[:limit]
+    if not page:
+        return {"items": [], "next_before": None}
+    by_day = {day: {"day": day.isoformat(), **_empty_stats()} for day in page}
+    rows = await db.execute(
+        select(DailyStat.day, DailyStat.metric, DailyStat.count, DailyStat.total)
+        .where(*filters[:2], DailyStat.day.between(page[-1], page[0]))
+    )
+    for day, metric, count, total in rows:
+        _apply_metric(by_day[day], metric, count, total)
+    return {
+        "items": [by_day[day] for day in page],
+        "next_before": page[-1].isoformat() if len(days) > limit else None,
+    }
+
+
+async def summarize(db: AsyncSession, scope: str, key: str, start: date = None, end: date = None) -> dict:
+    """기간 전체 합계. 일별 집계 행만 더하므로 기록 테이블을 읽지 않는다."""
+    filters = _stat_filters(scope, key, start, end)
+    rows = await db.execute(
+        select(DailyStat.metric, func.sum(DailyStat.count), func.sum(DailyStat.total), func.min(DailyStat.day), func.max(DailyStat.day))
+        .where(*filters).group_by(DailyStat.metric)
+    )
+    result = {"scope": scope, "key": key, **_empty_stats(), "first_day": None, "last_day": None}
+    for metric, count, total, first_day, last_day in rows:
+        _apply_metric(result, metric, int(count), int(total))
+        result["first_day"] = min(filter(None, [result["first_day"], first_day.isoformat()]))
+        result["last_day"] = max(filter(None, [result["last_day"], last_day.isoformat()]))
+    return result
+
+
+async def create_export_report(db: AsyncSession, user_id: int, kind: str, fmt: str, start: date = None, end: date = None) -> Report:
+    report = Report(
+        user_id=user_id,
+        report_type=f"{kind}_export",
+        title=f"{kind} history export ({fmt})",
+        content_data={
+            "kind": kind, "format": fmt, "status": "running", "rows": 0,
+            "start": start.isoformat() if start else None, "end": end.isoformat() if end else None,
+        },
+    )
+    db.add(report)
+    await db.commit()
+    return report
+
+
+def _encode(fmt: str, columns, rows, first: bool) -> str:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(_row_dict(columns, row).values() for row in rows)
+        return buffer.getvalue()
+    body = ",\n".join(json.dumps(_row_dict(columns, row), ensure_ascii=False) for row in rows)
+    return body if first else ",\n" + body
+
+
+async def export_history(read_session, write_session, report_id: int, kind: str, user_id: int, fmt: str,
+                         start: date = None, end: date = None, chunk: int = None):
+    """기록을 id 순으로 chunk행씩 읽어 CSV 또는 JSON 배열 조각으로 내보낸다.
+
+    청크마다 짧은 세션을 열고 닫으므로 느린 클라이언트가 커넥션을 잡고 있지 않는다.
+    끝나면(중간에 끊겨도) Report.content_data에 행 수와 상태를 남긴다.
+    """
+    model = HISTORY[kind]
+    columns = EXPORT_COLUMNS[kind]
+    id_column = getattr(model, columns[0])
+    query = select(*(getattr(model, name) for name in columns)).where(model.user_id == user_id)
+    if start is not None:
+        query = query.where(model.created_at >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        query = query.where(model.created_at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    chunk = chunk or EXPORT_CHUNK
+    after, exported, status = 0, 0, "aborted"
+    try:
+        yield (",".join(columns) + "\r\n") if fmt == "csv" else "[\n"
+        while True:
+            async with read_session() as db:
+                rows = (await db.execute(query.where(id_column > after).order_by(id_column).limit(chunk))).all()
+            if not rows:
+                break
+            yield _encode(fmt, columns, rows, first=exported == 0)
+            exported += len(rows)
+            after = rows[-1][0]
+        if fmt == "json":
+            yield "\n]\n"
+        status = "done"
+    except Exception:
+        status = "failed"
+        raise
+    finally:
+        async with write_session() as db:
+            report = await db.get(Report, report_id)
+            if report is not None:
+                report.content_data = {**report.content_data, "status": status, "rows": exported}
+                await db.commit()
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from app.metrics import track_provider
+
+_SPACES = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s.!?~…。,]+$")
+
+def normalize_text(text: str) -> str:
+    # "잠이 안 와요..", " 잠이  안 와요 " 같은 표기 차이를 같은 키로 모은다
+    text = unicodedata.normalize("NFKC", text).strip().lower()
+    text = _SPACES.sub(" ", text)
+    return _TRAILING_PUNCT.sub("", text)
+
+
+class LRUTTLCache:
+    """크기 제한(LRU)과 만료 시간(TTL)이 있는 스레드 안전 캐시."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and time.time() - item[1] <= self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, stored_at: float = None):
+        with self._lock:
+            self._data[key] = (value, stored_at or time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _SavedLatency:
+    """미스 때의 평균 소요 시간(EWMA)으로 히트가 절약한 시간을 추정한다."""
+
+    def __init__(self):
+        self.avg_miss_ms = 0.0
+        self.saved_ms = 0.0
+
+    def record_miss(self, elapsed_ms: float):
+        if self.avg_miss_ms == 0.0:
+            self.avg_miss_ms = elapsed_ms
+        else:
+            self.avg_miss_ms = 0.9 * self.avg_miss_ms + 0.1 * elapsed_ms
+
+    def record_hit(self):
+        self.saved_ms += self.avg_miss_ms
+
+
+def _stats(cache: LRUTTLCache, latency: _SavedLatency) -> dict:
+    total = cache.hits + cache.misses
+    return {
+        "size": len(cache),
+        "maxsize": cache.maxsize,
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "hit_ratio": round(cache.hits / total, 4) if total else 0.0,
+        "avg_miss_ms": round(latency.avg_miss_ms, 2),
+        "saved_ms": round(latency.saved_ms, 2),
+    }
+
+
+class CachedEmbeddings(Embeddings):
+    """정규화된 입력 텍스트를 키로 쿼리 임베딩을 캐시하는 Embeddings 래퍼.
+
+    persist_path를 주면 시작 시 불러오고 save() 호출 시 파일에 기록한다.
+    문서 임베딩(embed_documents)은 캐시하지 않는다.
+    같은 텍스트에 대한 동시 aembed_query 호출(검색과 감정 분류 등)은 한 번의 API 호출로 합친다.
+    """
+
+    def __init__(self, base: Embeddings, maxsize: int = 2048, ttl: float = 86400, persist_path: str = None):
+        self.base = base
+        self.cache = LRUTTLCache(maxsize, ttl)
+        self.latency = _SavedLatency()
+        self.persist_path = persist_path
+        self._inflight = {}
+        if persist_path:
+            self.load()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with track_provider("embedding"):
+            return self.base.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        with track_provider("embedding"):
+            return await self.base.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_text(text)
+        vector = self.cache.get(key)
+        if vector is not None:
+            self.latency.record_hit()
+            return vector
+        start = time.perf_counter()
+        with track_provider("embedding"):
+            vector = self.base.embed_query(text)  # 키는 정규화된 텍스트지만 임베딩은 원문으로
+        self.latency.record_miss((time.perf_counter() - start) * 1000)
+        self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_text(text)
+        vector = self.cache.get(key)
+        if vector is not None:
+            self.latency.record_hit()
+            return vector
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # 먼저 시작한 호출을 기다린다. 그 호출이 취소됐으면(요청 연결 끊김 등) 직접 다시 요청한다
+            await asyncio.wait([inflight])
+            if inflight.cancelled():
+                return await self.aembed_query(text)
+            self.latency.record_hit()
+            return inflight.result()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        start = time.perf_counter()
+        try:
+            with track_provider("embedding"):
+                vector = await self.base.aembed_query(text)
+        except BaseException as e:
+            # 취소(CancelledError)도 결과를 정해야 기다리는 쪽이 멈추지 않는다
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # 기다리는 쪽이 없어도 경고가 남지 않도록 소비
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        self.latency.record_miss((time.perf_counter() - start) * 1000)
+        self.cache.set(key, vector)
+        future.set_result(vector)
+        return vector
+
+    def load(self):
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        now = time.time()
+        for key, vector, stored_at in entries:
+            if now - stored_at <= self.cache.ttl:
+                self.cache.set(key, vector, stored_at)
+
+    def save(self):
+        if not self.persist_path:
+            return
+        entries = [[key, vector, stored_at] for key, (vector, stored_at) in self.cache.items()]
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.persist_path)
+
+    def stats(self) -> dict:
+        return _stats(self.cache, self.latency)
+
+
+class RetrievalCache:
+    """(컬렉션 버전, 정규화된 질의)를 키로 검색 결과 문서를 캐시한다.
+
+    컬렉션 내용이 바뀌면 bump_version()으로 이전 결과를 모두 무효화한다.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, version: str = "1"):
+        self.cache = LRUTTLCache(maxsize, ttl)
+        self.latency = _SavedLatency()
+        self.version = version
+
+    def bump_version(self, version: str = None):
+        self.version = version or str(time.time())
+        self.cache.clear()
+
+    async def aget_or_retrieve(self, query: str, retrieve):
+        key = (self.version, normalize_text(query))
+        docs = self.cache.get(key)
+        if docs is not None:
+            self.latency.record_hit()
+            return docs
+        start = time.perf_counter()
+        docs = await retrieve(query)
+        self.latency.record_miss((time.perf_counter() - start) * 1000)
+        self.cache.set(key, docs)
+        return docs
+
+    def stats(self) -> dict:
+        return {"version": self.version, **_stats(self.cache, self.latency)}
@@ -1,55 +1,122 @@
-from sqlalchemy.orm import Session
-from app.models import User, Conversation, Message, PHQ9Result
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import User, Conversation, Message, PHQ9Result, ConversationSummary
+from app.session_cache import entity_cache, defer_invalidation
 from datetime import datetime
 
-def create_message(db: Session, conversation_id: int, sender_type: str, agent_type: str, content: str):
-    msg = Message(
-        conversation_id=conversation_id,
-        sender_type=sender_type,
-        agent_type=agent_type,
-        content=content,
-        created_at=datetime.now()
+# commit=False면 세션에 추가만 하고, 턴 전체의 쓰기를 호출자가 한 번에 commit한다
+
+async def get_recent_messages(db: AsyncSession, conversation_id: int, after_message_id: int = 0, limit: int = 40):
+    """after_message_id 이후 메시지 중 최근 limit개를 (message_id, sender_type, content) 최신순으로"""
+    result = await db.execute(
+        select(Message.message_id, Message.sender_type, Message.content)
+        .where(Message.conversation_id == conversation_id, Message.message_id > after_message_id)
+        .order_by(Message.message_id.desc())
+        .limit(limit)
     )
-    db.add(msg)
-    db.commit()
-    db.refresh(msg)
-    return msg
-
-def get_conversation_history(db: Session, conversation_id: int, limit=6):
-    messages = (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation_id)
+    return result.all()
+
+async def get_messages_between(db: AsyncSession, conversation_id: int, after_message_id: int, upto_message_id: int, limit: int = 40):
+    """after_message_id 다음부터 upto_message_id까지 중 오래된 limit개를 (message_id, sender_type, content) 순서대로"""
+    result = await db.execute(
+        select(Message.message_id, Message.sender_type, Message.content)
+        .where(
+            Message.conversation_id == conversation_id,
+            Message.message_id > after_message_id,
+            Message.message_id <= upto_message_id,
+        )
         .order_by(Message.message_id)
-        .all()
+        .limit(limit)
     )
-    history = []
-    for m in messages[-limit:]:
-        prefix = "Human" if m.sender_type == "user" else "AI"
-        history.append(f"{prefix}: {m.content}")
-    return "\n".join(history)
-
-def save_or_update_phq9_result(db: Session, user_id: int, score: int, level: str):
-    now = datetime.now()
-    result = db.query(PHQ9Result).filter_by(user_id=user_id).first()
-    if result:
-        result.score = score
-        result.level = level
-        result.updated_at = now
+    return result.all()
+
+async def get_conversation_summary(db: AsyncSession, conversation_id: int):
+    return await db.get(ConversationSummary, conversation_id)
+
+async def save_conversation_summary(db: AsyncSession, conversation_id: int, summary: str, last_message_id: int, commit: bool = True):
+    row = await db.get(ConversationSummary, conversation_id)
+    if row:
+        row.summary = summary
+        row.last_message_id = last_message_id
     else:
-        result = PHQ9Result(
-            user_id=user_id,
-            score=score,
-            level=level,
-            updated_at=now
-        )
-        db.add(result)
-    db.commit()
-    return result
+        row = ConversationSummary(conversation_id=conversation_id, summary=summary, last_message_id=last_message_id)
+        db.add(row)
+    if commit:
+        await db.commit()
+    return row
+
+async def insert_messages(db: AsyncSession, rows: list):
+    """여러 메시지를 한 번의 INSERT로 넣는다. 이미 들어간 request_key는 건너뛴다 (재시도 멱등성)."""
+    keys = [row["request_key"] for row in rows]
+    existing = set((await db.execute(select(Message.request_key).where(Message.request_key.in_(keys)))).scalars())
+    new_rows = [row for row in rows if row["request_key"] not in existing]
+    if new_rows:
+        await db.execute(insert(Message), new_rows)
+    return len(new_rows)
+
+async def upsert_phq9_results(db: AsyncSession, rows: list, only_newer: bool = True) -> int:
+    """사용자별 PHQ-9 결과를 덮어쓴다. 같은 사용자가 여러 번 나오면 updated_at이 가장 늦은 값이 남는다.
 
-def get_latest_phq9_by_user(db: Session, user_id: int):
-    return db.query(PHQ9Result).filter_by(user_id=user_id).first()
+    only_newer면 저장된 updated_at보다 늦은 값만 반영한다 (늦게 재시도된 이전 작업이 새 점수를 덮지 않도록).
+    점수와 단계가 저장된 값과 같은 사용자는 UPDATE도 캐시 무효화도 하지 않는다. 바뀐 사용자 수를 돌려준다.
+    """
+    latest = {}
+    for row in rows:
+        current = latest.get(row["user_id"])
+        if current is None or row["updated_at"] >= current["updated_at"]:
+            latest[row["user_id"]] = row
+    existing = {
+        r.user_id: r
+        for r in (await db.execute(select(PHQ9Result).where(PHQ9Result.user_id.in_(list(latest))))).scalars()
+    }
+    changed = 0
+    for user_id, row in latest.items():
+        result = existing.get(user_id)
+        if result and only_newer and result.updated_at is not None and row["updated_at"] <= result.updated_at:
+            continue
+        if result and (result.score, result.level) == (row["score"], row["level"]):
+            continue
+        changed += 1
+        if result:
+            result.score = row["score"]
+            result.level = row["level"]
+            result.updated_at = row["updated_at"]
+        else:
+            db.add(PHQ9Result(**row))
+        defer_invalidation(db, "phq9", str(user_id))
+    return changed
 
-def create_user(db: Session, email: str, password: str, nickname: str = "", business_type: str = ""):
+async def get_latest_phq9_by_user(db: AsyncSession, user_id: int):
+    return (await db.execute(select(PHQ9Result).filter_by(user_id=user_id))).scalars().first()
+
+async def get_phq9_snapshot(db: AsyncSession, user_id: int) -> dict:
+    # 결과가 없는 사용자도 빈 dict로 캐시해 매 턴 SELECT하지 않는다
+    async def load():
+        phq9 = await get_latest_phq9_by_user(db, user_id)
+        if not phq9:
+            return {}
+        return {"score": phq9.score, "level": phq9.level, "updated_at": phq9.updated_at.isoformat()}
+    return await entity_cache.get_or_load("phq9", str(user_id), load)
+
+async def get_conversation(db: AsyncSession, conversation_id: int, user_id: int):
+    return (
+        await db.execute(select(Conversation).filter_by(conversation_id=conversation_id, user_id=user_id))
+    ).scalars().first()
+
+async def conversation_belongs_to(db: AsyncSession, conversation_id: int, user_id: int) -> bool:
+    # 소유자는 바뀌지 않으므로 있는 경우만 캐시한다 (없음은 곧 생성될 수 있어 캐시하지 않음)
+    async def load():
+        return True if await get_conversation(db, conversation_id, user_id) else None
+    return bool(await entity_cache.get_or_load("conv", f"{conversation_id}:{user_id}", load))
+
+async def create_conversation(db: AsyncSession, user_id: int):
+    conv = Conversation(user_id=user_id, started_at=datetime.now())
+    db.add(conv)
+    await db.commit()
+    await entity_cache.set("conv", f"{conv.conversation_id}:{user_id}", True)
+    return conv
+
+async def create_user(db: AsyncSession, email: str, password: str, nickname: str = "", business_type: str = ""):
     user = User(
         email=email,
         password=password,
@@ -57,14 +124,22 @@ def create_user(db: Session, email: str, password: str, nickname: str = "", busi
         business_type=business_type,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
     return user
 
-def get_user_by_social(db: Session, provider: str, social_id: str):
-    return db.query(User).filter(User.provider == provider, User.social_id == social_id).first()
+async def get_user_by_social(db: AsyncSession, provider: str, social_id: str):
+    return (
+        await db.execute(select(User).where(User.provider == provider, User.social_id == social_id))
+    ).scalars().first()
+
+async def get_social_user(db: AsyncSession, provider: str, social_id: str):
+    """(provider, social_id) -> {"user_id", "email"} 또는 None"""
+    async def load():
+        user = await get_user_by_social(db, provider, social_id)
+        return {"user_id": user.user_id, "email": user.email} if user else None
+    return await entity_cache.get_or_load("social", f"{provider}:{social_id}", load)
 
-def create_user_social(db: Session, provider: str, social_id: str, email: str, nickname: str = "", access_token=None):
+async def create_user_social(db: AsyncSession, provider: str, social_id: str, email: str, nickname: str = "", access_token=None):
     user = User(
         email=email,
         password=None,  # 소셜 로그인은 비밀번호 없음
@@ -74,6 +149,6 @@ def create_user_social(db: Session, provider: str, social_id: str, email: str, n
         access_token=access_token
     )
     db.add(user)
-    db.commit()
-    db.refresh(user) 
-    return user
\ No newline at end of file
+    await db.commit()
+    await entity_cache.set("social", f"{provider}:{social_id}", {"user_id": user.user_id, "email": user.email})
+    return user
@@ -0,0 +1,201 @@
+import asyncio
+import math
+from typing import List, NamedTuple, Optional
+
+EMOTION_LABELS = ["긍정", "중립", "슬픔", "우울", "불안", "분노", "행복", "기타"]
+
+
+def normalize_label(text: str) -> str:
+    """LLM이 돌려준 감정 문자열("우울", "감정: 불안", "슬픔입니다.")을 EMOTION_LABELS 중 하나로. 없으면 "기타".
+
+    기록(emotion_history)과 일별 집계(emotion:<레이블>)에는 이 레이블만 들어간다.
+    """
+    text = (text or "").strip()
+    if text in EMOTION_LABELS:
+        return text
+    found = [(text.find(label), label) for label in EMOTION_LABELS if label in text]
+    return min(found)[1] if found else "기타"
+
+
+class EmotionResult(NamedTuple):
+    label: str
+    confidence: float
+    backend: str
+
+
+class EmotionClassifier:
+    """감정 분류기 인터페이스. 레이블은 EMOTION_LABELS 중 하나."""
+
+    name = "base"
+
+    async def classify(self, text: str) -> EmotionResult:
+        raise NotImplementedError
+
+    async def classify_batch(self, texts: List[str]) -> List[EmotionResult]:
+        return list(await asyncio.gather(*(self.classify(t) for t in texts)))
+
+
+# 키워드 -> 가중치. 어간 위주로 적어 활용형(우울해요, 우울했어요...)도 잡는다
+EMOTION_LEXICON = {
+    "우울": {"우울": 2.0, "무기력": 1.5, "의욕이 없": 1.5, "공허": 1.0, "죽고 싶": 2.0, "자살": 2.0,
+             "살기 싫": 2.0, "의미가 없": 1.0, "절망": 1.5, "아무것도 하기 싫": 1.5},
+    "슬픔": {"슬프": 2.0, "슬퍼": 2.0, "눈물": 1.5, "울었": 1.0, "울고": 1.0, "그리워": 1.0,
+             "외로": 1.0, "서운": 1.0, "상실": 1.0},
+    "불안": {"불안": 2.0, "걱정": 1.5, "초조": 1.5, "두려": 1.5, "무서": 1.0, "긴장": 1.0,
+             "두근": 1.0, "공황": 2.0, "잠이 안": 1.0, "잠을 못": 1.0},
+    "분노": {"화가 나": 2.0, "화나": 2.0, "짜증": 1.5, "분노": 2.0, "억울": 1.0, "열받": 1.5, "빡치": 1.5},
+    "행복": {"행복": 2.0, "기뻐": 2.0, "기쁘": 2.0, "신나": 1.5, "설레": 1.0},
+    "긍정": {"괜찮아": 1.0, "나아졌": 1.5, "좋아졌": 1.5, "감사": 1.0, "다행": 1.0, "희망": 1.5},
+}
+
+
+class LexiconEmotionClassifier(EmotionClassifier):
+    """키워드 사전 기반 CPU 분류기. 외부 호출이 없다."""
+
+    name = "lexicon"
+
+    def __init__(self, lexicon: dict = None):
+        self.lexicon = lexicon or EMOTION_LEXICON
+
+    def classify_sync(self, text: str) -> EmotionResult:
+        scores = {}
+        for label, keywords in self.lexicon.items():
+            score = sum(weight for keyword, weight in keywords.items() if keyword in text)
+            if score:
+                scores[label] = score
+        if not scores:
+            return EmotionResult("중립", 0.4, self.name)
+        label, top = max(scores.items(), key=lambda kv: kv[1])
+        return EmotionResult(label, top / (sum(scores.values()) + 0.5), self.name)
+
+    async def classify(self, text: str) -> EmotionResult:
+        return self.classify_sync(text)
+
+    async def classify_batch(self, texts: List[str]) -> List[EmotionResult]:
+        return [self.classify_sync(t) for t in texts]
+
+
+# 레이블별 대표 문장. 임베딩 평균(centroid)을 레이블 프로토타입으로 쓴다
+EMOTION_PROTOTYPES = {
+    "긍정": ["요즘은 좀 나아진 것 같아요", "조금씩 희망이 보여요", "괜찮아요, 잘 지내고 있어요"],
+    "중립": ["그냥 평범한 하루였어요", "별일 없이 지냈어요", "특별히 느끼는 건 없어요"],
+    "슬픔": ["너무 슬퍼서 눈물이 나요", "소중한 사람을 잃어서 마음이 아파요", "외롭고 서글퍼요"],
+    "우울": ["아무것도 하기 싫고 무기력해요", "매일 우울하고 살아갈 의미를 모르겠어요", "하루 종일 침대에서 못 일어나겠어요"],
+    "불안": ["불안해서 잠이 안 와요", "가슴이 두근거리고 계속 걱정돼요", "무슨 일이 생길까 봐 초조해요"],
+    "분노": ["너무 화가 나서 참을 수가 없어요", "짜증 나서 미칠 것 같아요", "억울하고 분해요"],
+    "행복": ["정말 행복해요", "기뻐서 날아갈 것 같아요", "요즘 너무 즐겁고 신나요"],
+    "기타": ["PHQ-9 검사는 어떻게 하나요?", "상담은 어떻게 진행되나요?", "이 서비스는 무료인가요?"],
+}
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class EmbeddingEmotionClassifier(EmotionClassifier):
+    """질의 임베딩과 레이블 프로토타입의 코사인 유사도로 분류한다.
+
+    embedder는 검색과 같은 CachedEmbeddings를 받으므로, 검색용으로 계산한
+    질의 임베딩을 그대로 재사용한다 (추가 API 호출 없음).
+    """
+
+    name = "embedding"
+
+    def __init__(self, embedder, prototypes: dict = None, temperature: float = 0.05):
+        self.embedder = embedder
+        self.prototypes = prototypes or EMOTION_PROTOTYPES
+        self.temperature = temperature
+        self._centroids = None
+        self._lock = asyncio.Lock()
+
+    async def _get_centroids(self):
+        if self._centroids is None:
+            async with self._lock:
+                if self._centroids is None:
+                    labels = list(self.prototypes)
+                    sentences = [s for label in labels for s in self.prototypes[label]]
+                    vectors = await self.embedder.aembed_documents(sentences)
+                    centroids, i = {}, 0
+                    for label in labels:
+                        group = vectors[i:i + len(self.prototypes[label])]
+                        i += len(group)
+                        centroids[label] = _normalize([sum(col) / len(group) for col in zip(*group)])
+                    self._centroids = centroids
+        return self._centroids
+
+    def _classify_vector(self, centroids, vector) -> EmotionResult:
+        vector = _normalize(vector)
+        sims = {label: sum(a * b for a, b in zip(vector, c)) for label, c in centroids.items()}
+        top = max(sims.values())
+        weights = {label: math.exp((s - top) / self.temperature) for label, s in sims.items()}
+        label = max(weights, key=weights.get)
+        return EmotionResult(label, weights[label] / sum(weights.values()), self.name)
+
+    async def classify(self, text: str) -> EmotionResult:
+        centroids = await self._get_centroids()
+        vector = await self.embedder.aembed_query(text)
+        return self._classify_vector(centroids, vector)
+
+    async def classify_batch(self, texts: List[str]) -> List[EmotionResult]:
+        centroids = await self._get_centroids()
+        vectors = await self.embedder.aembed_documents(texts)  # 한 번의 배치 요청
+        return [self._classify_vector(centroids, v) for v in vectors]
+
+
+class LLMEmotionClassifier(EmotionClassifier):
+    """기존 analyze_emotion(LLM 호출)을 감싼다."""
+
+    name = "llm"
+
+    def __init__(self, analyze):
+        self.analyze = analyze
+
+    async def classify(self, text: str) -> EmotionResult:
+        return EmotionResult(normalize_label(await self.analyze(text)), 1.0, self.name)
+
+
+class FallbackEmotionClassifier(EmotionClassifier):
+    """primary의 confidence가 threshold 미만일 때만 fallback(LLM)을 호출한다."""
+
+    def __init__(self, primary: EmotionClassifier, fallback: Optional[EmotionClassifier], threshold: float = 0.5):
+        self.primary = primary
+        self.fallback = fallback
+        self.threshold = threshold
+        self.name = f"{primary.name}+{fallback.name}" if fallback else primary.name
+        self.fallback_count = 0
+        self.total_count = 0
+
+    async def _resolve(self, text: str, result: EmotionResult) -> EmotionResult:
+        self.total_count += 1
+        if self.fallback is None or result.confidence >= self.threshold:
+            return result
+        self.fallback_count += 1
+        return await self.fallback.classify(text)
+
+    async def classify(self, text: str) -> EmotionResult:
+        return await self._resolve(text, await self.primary.classify(text))
+
+    async def classify_batch(self, texts: List[str]) -> List[EmotionResult]:
+        results = await self.primary.classify_batch(texts)
+        return list(await asyncio.gather(*(self._resolve(t, r) for t, r in zip(texts, results))))
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "threshold": self.threshold,
+            "classified": self.total_count,
+            "fallback_calls": self.fallback_count,
+        }
+
+
+def build_emotion_classifier(backend: str, embedder, analyze, threshold: float = 0.5) -> FallbackEmotionClassifier:
+    """backend: "embedding" | "lexicon" | "llm". 로컬 백엔드는 LLM을 fallback으로 둔다."""
+    llm = LLMEmotionClassifier(analyze)
+    if backend == "llm":
+        return FallbackEmotionClassifier(llm, None)
+    if backend == "lexicon":
+        return FallbackEmotionClassifier(LexiconEmotionClassifier(), llm, threshold)
+    if backend == "embedding":
+        return FallbackEmotionClassifier(EmbeddingEmotionClassifier(embedder), llm, threshold)
+    raise ValueError(f"알 수 없는 감정 분류 백엔드: {backend}")
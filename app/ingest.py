@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.memory import estimate_tokens
+from app.vector_store import default_index_path, write_chroma, write_local_index
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".jsonl")
+
+
+def content_hash(text: str) -> str:
+    # 공백 차이만 있는 청크는 같은 문서로 본다. 청크 id로도 쓴다
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:32]
+
+
+def iter_files(paths):
+    """(체크포인트 키, 파일 경로). 키는 인자로 받은 디렉터리 기준 상대 경로라서 실행 위치와 무관하다
+    (파일을 직접 주면 파일 이름)."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield os.path.basename(path), path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(SUPPORTED_EXTENSIONS):
+                    file_path = os.path.join(root, name)
+                    yield os.path.relpath(file_path, path).replace(os.sep, "/"), file_path
+
+
+def read_documents(path: str, data: bytes):
+    """파일 하나를 (본문, 메타데이터) 목록으로 읽는다. jsonl은 줄마다 {"text", "metadata"} 문서 하나."""
+    text = data.decode("utf-8", errors="replace")
+    if not path.endswith(".jsonl"):
+        return [(text, {})]
+    documents = []
+    for line in text.splitlines():
+        if line.strip():
+            row = json.loads(line)
+            documents.append((row.get("text") or row.get("page_content") or "", row.get("metadata") or {}))
+    return documents
+
+
+def token_counter(stub: bool = False):
+    """임베딩 토큰 수 계산 함수. tiktoken 인코딩을 받을 수 없으면(오프라인) 근사치를 쓴다."""
+    if not stub:
+        try:
+            import tiktoken
+
+            encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+            return lambda text: len(encoding.encode(text))
+        except Exception:
+            pass
+    return estimate_tokens
+
+
+class IngestState:
+    """적재 상태(체크포인트) SQLite 파일.
+
+    files   원본 파일별 크기/mtime/sha256과 그 파일이 만든 청크 id 목록
+    chunks  청크 id(내용 해시)별 본문/메타데이터/임베딩. 임베딩은 배치마다 바로 기록되므로
+            중간에 멈춰도 다시 실행하면 남은 청크만 임베딩한다
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files (source TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+            "sha256 TEXT, chunk_ids TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT, metadata TEXT, vector BLOB)")
+
+    def files(self) -> dict:
+        rows = self.conn.execute("SELECT source, size, mtime, sha256, chunk_ids FROM files")
+        return {source: (size, mtime, sha, json.loads(ids)) for source, size, mtime, sha, ids in rows}
+
+    def embedded(self, chunk_id: str) -> bool:
+        row = self.conn.execute("SELECT vector IS NOT NULL FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+        return bool(row and row[0])
+
+    def save_vectors(self, chunks, vectors):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, text, metadata, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (chunk_id, text, json.dumps(metadata, ensure_ascii=False), np.asarray(vector, dtype=np.float32).tobytes())
+                    for (chunk_id, text, metadata), vector in zip(chunks, vectors)
+                ],
+            )
+
+    def iter_chunks(self, ids: set, batch_size: int = 1000):
+        """ids에 속한 청크를 (ids, vectors, documents) 묶음으로 읽는다."""
+        cursor = self.conn.execute("SELECT id, text, metadata, vector FROM chunks WHERE vector IS NOT NULL ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            rows = [row for row in rows if row[0] in ids]
+            if rows:
+                yield (
+                    [row[0] for row in rows],
+                    np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows]),
+                    [Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows],
+                )
+
+    def commit_files(self, updated: dict, removed: list):
+        """저장소 반영이 끝난 뒤 파일 목록을 갱신하고 더 이상 참조되지 않는 청크를 지운다."""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM files WHERE source = ?", [(source,) for source in removed])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (source, size, mtime, sha256, chunk_ids) VALUES (?, ?, ?, ?, ?)",
+                [(source, size, mtime, sha, json.dumps(ids)) for source, (size, mtime, sha, ids) in updated.items()],
+            )
+            referenced = set()
+            for (ids,) in self.conn.execute("SELECT chunk_ids FROM files"):
+                referenced.update(json.loads(ids))
+            orphans = [(chunk_id,) for (chunk_id,) in self.conn.execute("SELECT id FROM chunks") if chunk_id not in referenced]
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", orphans)
+
+    def close(self):
+        self.conn.close()
+
+
+async def ingest(
+    paths,
+    backend: str,
+    index_path: str,
+    embedder,
+    state_path: str = None,
+    count_tokens=estimate_tokens,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    batch_size: int = 100,
+    concurrency: int = 4,
+    prune: bool = False,
+    max_retries: int = 3,
+    hnsw_ef: int = 64,
+) -> dict:
+    """원본 파일을 청크로 나눠 임베딩하고 벡터 저장소에 일괄 반영한다.
+
+    크기/mtime(다르면 sha256)이 바뀐 파일만 다시 읽고, 내용 해시가 같은 청크는 파일이 달라도
+    한 번만 임베딩한다. 임베딩 요청은 batch_size개씩 최대 concurrency개만 동시에 보낸다.
+    chroma는 바뀐 청크만 upsert/delete하고, 로컬 인덱스는 체크포인트의 벡터로 다시 쓴다(재임베딩 없음).
+    prune=True면 원본에서 사라진 파일의 청크도 지운다.
+    """
+    started = time.perf_counter()
+    state = IngestState(state_path or index_path.rstrip("/\\") + ".ingest.sqlite3")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    stats = {
+        "files_changed": 0, "files_unchanged": 0, "files_removed": 0, "documents": 0, "chunks": 0,
+        "duplicate_chunks": 0, "embedded_chunks": 0, "embedding_requests": 0, "embedding_tokens": 0,
+    }
+    slots = asyncio.Semaphore(concurrency)
+    tasks, errors, pending, queued = set(), [], [], set()
+
+    async def embed(batch):
+        try:
+            for attempt in range(max_retries):
+                try:
+                    vectors = await embedder.aembed_documents([text for _, text, _ in batch])
+                    break
+                except Exception:
+                    if attempt == max_retries - 1:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+            state.save_vectors(batch, vectors)  # 체크포인트
+            stats["embedded_chunks"] += len(batch)
+            stats["embedding_requests"] += 1
+            stats["embedding_tokens"] += sum(count_tokens(text) for _, text, _ in batch)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            slots.release()
+
+    async def submit():
+        nonlocal pending
+        batch, pending = pending, []
+        await slots.acquire()  # 동시 요청 수만큼만 띄워 두므로 메모리에 올라가는 청크도 그만큼이다
+        if errors:
+            slots.release()
+            raise errors[0]
+        task = asyncio.create_task(embed(batch))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    try:
+        known = state.files()
+        seen, updated = set(), {}
+        for source, path in iter_files(paths):
+            seen.add(source)
+            info = os.stat(path)
+            previous = known.get(source)
+            if previous and previous[:2] == (info.st_size, info.st_mtime):
+                stats["files_unchanged"] += 1
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            sha = hashlib.sha256(data).hexdigest()
+            if previous and previous[2] == sha:
+                updated[source] = (info.st_size, info.st_mtime, sha, previous[3])  # mtime만 바뀜
+                stats["files_unchanged"] += 1
+                continue
+
+            stats["files_changed"] += 1
+            chunk_ids = []
+            for text, metadata in read_documents(path, data):
+                stats["documents"] += 1
+                for i, chunk in enumerate(splitter.split_text(text)):
+                    stats["chunks"] += 1
+                    chunk_id = content_hash(chunk)
+                    if chunk_id not in chunk_ids:
+                        chunk_ids.append(chunk_id)
+                    if chunk_id in queued or state.embedded(chunk_id):
+                        stats["duplicate_chunks"] += 1
+                        continue
+                    queued.add(chunk_id)
+                    pending.append((chunk_id, chunk, {**metadata, "source": source, "chunk": i}))
+                    if len(pending) >= batch_size:
+                        await submit()
+            updated[source] = (info.st_size, info.st_mtime, sha, chunk_ids)
+        if pending:
+            await submit()
+        await asyncio.gather(*tasks)
+        if errors:
+            raise errors[0]
+
+        removed = [source for source in known if source not in seen] if prune else []
+        stats["files_removed"] = len(removed)
+        old_refs = {chunk_id for *_, ids in known.values() for chunk_id in ids}
+        current = {source: entry for source, entry in known.items() if source not in removed}
+        current.update(updated)
+        new_refs = {chunk_id for *_, ids in current.values() for chunk_id in ids}
+        added, deleted = new_refs - old_refs, old_refs - new_refs
+
+        if backend == "chroma":
+            if added or deleted:
+                write_chroma(index_path, state.iter_chunks(added), delete_ids=sorted(deleted), hnsw_ef=hnsw_ef)
+        elif added or deleted or not os.path.exists(os.path.join(index_path, "docs.jsonl")):
+            ids, vectors, documents = [], [], []
+            for batch_ids, batch_vectors, batch_documents in state.iter_chunks(new_refs):
+                ids.extend(batch_ids)
+                vectors.append(batch_vectors)
+                documents.extend(batch_documents)
+            if ids:
+                write_local_index(index_path, backend, ids, np.concatenate(vectors), documents)
+        state.commit_files(updated, removed)
+    finally:
+        for task in tasks:
+            task.cancel()
+        state.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        **stats,
+        "added_chunks": len(added),
+        "deleted_chunks": len(deleted),
+        "total_chunks": len(new_refs),
+        # 검색 캐시 키(VECTOR_COLLECTION_VERSION)로 쓸 수 있는 컬렉션 내용 버전
+        "collection_version": hashlib.sha256("".join(sorted(new_refs)).encode()).hexdigest()[:12],
+        "elapsed_s": round(elapsed, 3),
+        "docs_per_s": round(stats["documents"] / elapsed, 1) if elapsed else 0.0,
+        "chunks_per_s": round(stats["chunks"] / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def build_embedder(stub: bool, batch_size: int):
+    if stub:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        return DeterministicFakeEmbedding(size=1536)
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, chunk_size=batch_size)
+
+
+if __name__ == "__main__":
+    # global-documents 컬렉션 적재 (다시 실행하면 바뀐 파일만 반영):
+    #   python -m app.ingest data/docs
+    #   python -m app.ingest data/docs --backend faiss --path data/vector_index --prune
+    #   python -m app.ingest data/docs --stub-embeddings --path /tmp/vector_db   (API 호출 없이)
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="원본 파일 또는 디렉터리 (.txt, .md, .jsonl)")
+    parser.add_argument("--backend", choices=["chroma", "numpy", "faiss", "hnswlib"], default=os.getenv("VECTOR_BACKEND", "chroma"))
+    parser.add_argument("--path", help="벡터 저장소 경로 (기본: VECTOR_DB_PATH 또는 data/vector_db|vector_index)")
+    parser.add_argument("--state", help="체크포인트 파일 (기본: <path>.ingest.sqlite3)")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--prune", action="store_true", help="원본에서 사라진 파일의 청크를 지운다")
+    parser.add_argument("--stub-embeddings", action="store_true", help="결정적인 가짜 임베딩 사용 (테스트용)")
+    args = parser.parse_args()
+
+    report = asyncio.run(ingest(
+        args.paths,
+        args.backend,
+        args.path or default_index_path(args.backend),
+        build_embedder(args.stub_embeddings, args.batch_size),
+        state_path=args.state,
+        count_tokens=token_counter(args.stub_embeddings),
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        prune=args.prune,
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if report["added_chunks"] or report["deleted_chunks"]:
+        print(f"검색 캐시를 비우려면 서버를 VECTOR_COLLECTION_VERSION={report['collection_version']}로 재시작하세요.")
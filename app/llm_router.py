@@ -0,0 +1,256 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+from app.metrics import observe_provider
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    # openai.RateLimitError, google ResourceExhausted, HTTP 429 등
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    name = type(e).__name__
+    return status == 429 or "RateLimit" in name or "ResourceExhausted" in name or "429" in str(e)[:200]
+
+
+class ProviderHealth:
+    """공급자별 최근 지연/오류 기록과 서킷 브레이커 상태."""
+
+    def __init__(self, name: str, window: int = 100, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.latencies = deque(maxlen=window)   # 성공한 호출의 소요 시간(초)
+        self.outcomes = deque(maxlen=window)    # True=성공, False=실패
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.state = "closed"                   # closed | open | half_open
+        self.opened_at = 0.0
+        self.rate_limited_until = 0.0
+        self.last_error = None
+        self.in_flight = 0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def current_state(self, now: float) -> str:
+        # 상태를 바꾸지 않고 본다. 쿨다운이 지난 open은 half_open으로 본다
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            return "half_open"
+        return self.state
+
+    def available(self, now: float) -> bool:
+        """읽기 전용 (snapshot/rank에서 부른다). 상태 전이는 실제로 호출할 때 begin_call에서 한다."""
+        if now < self.rate_limited_until:
+            return False
+        state = self.current_state(now)
+        if state == "open":
+            return False
+        if state == "half_open":
+            return self.in_flight == 0  # 쿨다운이 지나면 시험 요청 하나를 허용
+        return True
+
+    def begin_call(self, now: float):
+        self.state = self.current_state(now)
+        self.in_flight += 1
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.state = "closed"
+
+    def record_failure(self, e: Exception, now: float):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.last_error = f"{type(e).__name__}: {e}"[:300]
+        if is_rate_limit_error(e):
+            retry_after = getattr(e, "retry_after", None)
+            self.rate_limited_until = now + (float(retry_after) if retry_after else self.cooldown)
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = now
+
+    def score(self, prior_latency: float) -> float:
+        # 낮을수록 좋다: p50 지연에 오류율 가중치를 곱한다
+        p50 = self.percentile(50)
+        return (p50 if p50 is not None else prior_latency) * (1 + 4 * self.error_rate)
+
+    def snapshot(self, now: float) -> dict:
+        def ms(v):
+            return round(v * 1000, 1) if v is not None else None
+        return {
+            "state": self.state,
+            "available": self.available(now),
+            "samples": len(self.latencies),
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "error_rate": round(self.error_rate, 4),
+            "consecutive_failures": self.consecutive_failures,
+            "rate_limited_for_s": round(max(0.0, self.rate_limited_until - now), 1),
+            "in_flight": self.in_flight,
+            "last_error": self.last_error,
+        }
+
+
+class RouterResult(NamedTuple):
+    response: object
+    provider: str
+    primary: str
+    errors: List[str]
+    hedged: bool
+
+
+class AllProvidersFailed(Exception):
+    def __init__(self, errors: List[str]):
+        super().__init__(" / ".join(errors) or "사용 가능한 LLM 공급자가 없습니다")
+        self.errors = errors
+
+
+class LLMRouter:
+    """상태 기반 LLM 라우터.
+
+    - 가용(서킷 closed/half_open, rate limit 아님) 공급자 중 점수가 가장 좋은 곳으로 보낸다.
+    - 실패가 연속되면 서킷을 열어 cooldown 동안 건너뛴다.
+    - hedge=True면 primary가 p95 기반 마감 시간 안에 답하지 않을 때 두 번째 공급자에도 요청하고,
+      먼저 성공한 응답을 쓴다.
+    """
+
+    def __init__(
+        self,
+        pool: dict,
+        hedge_enabled: bool = True,
+        hedge_min: float = 1.0,
+        hedge_max: float = 15.0,
+        hedge_default: float = 8.0,
+        hedge_min_samples: int = 20,
+        prior_latency: float = 3.0,
+        explore_ratio: float = 0.05,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+    ):
+        self.pool = pool
+        self.health = {
+            name: ProviderHealth(name, failure_threshold=failure_threshold, cooldown=cooldown) for name in pool
+        }
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.hedge_default = hedge_default
+        self.hedge_min_samples = hedge_min_samples
+        self.prior_latency = prior_latency
+        self.explore_ratio = explore_ratio
+        self.decisions = deque(maxlen=50)
+        self.counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "fallbacks": 0, "all_failed": 0}
+
+    def rank(self, explore: bool = True) -> List[str]:
+        """가용 공급자를 점수순으로 정렬. 가끔(explore_ratio) 순서를 섞어 통계를 갱신한다."""
+        now = time.monotonic()
+        names = [n for n in self.pool if self.health[n].available(now)]
+        names.sort(key=lambda n: self.health[n].score(self.prior_latency))
+        if explore and len(names) > 1 and random.random() < self.explore_ratio:
+            names.insert(0, names.pop(random.randrange(1, len(names))))
+        return names
+
+    def hedge_delay(self, name: str) -> float:
+        health = self.health[name]
+        if len(health.latencies) < self.hedge_min_samples:
+            return self.hedge_default
+        return min(self.hedge_max, max(self.hedge_min, health.percentile(95)))
+
+    async def _call(self, name: str, prompt, config):
+        health = self.health[name]
+        start = time.monotonic()
+        health.begin_call(start)
+        try:
+            response = await self.pool[name].ainvoke(prompt, config)
+        except asyncio.CancelledError:
+            observe_provider(f"llm:{name}", time.monotonic() - start, "cancelled")
+            raise  # hedge에서 진 요청은 실패로 기록하지 않는다
+        except Exception as e:
+            health.record_failure(e, time.monotonic())
+            observe_provider(f"llm:{name}", time.monotonic() - start, "error")
+            raise
+        finally:
+            health.in_flight -= 1
+        health.record_success(time.monotonic() - start)
+        observe_provider(f"llm:{name}", time.monotonic() - start)
+        return response
+
+    async def ainvoke(self, prompt, config=None, hedge: bool = None) -> RouterResult:
+        hedge = self.hedge_enabled if hedge is None else hedge
+        candidates = self.rank()
+        self.counters["requests"] += 1
+        if not candidates:
+            self.counters["all_failed"] += 1
+            raise AllProvidersFailed([])
+        primary = candidates[0]
+        errors = []
+        hedged = False
+        pending = {}  # task -> provider
+
+        def launch(name):
+            pending[asyncio.ensure_future(self._call(name, prompt, config))] = name
+
+        launch(primary)
+        queue = candidates[1:]
+        try:
+            while pending:
+                timeout = None
+                if hedge and queue and not hedged:
+                    timeout = self.hedge_delay(primary)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # primary가 마감 시간을 넘김 -> 두 번째 공급자에 hedge 요청
+                    hedged = True
+                    self.counters["hedged"] += 1
+                    launch(queue.pop(0))
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        self._record_decision(primary, name, hedged, errors)
+                        return RouterResult(task.result(), name, primary, errors, hedged)
+                    errors.append(f"{name}: {task.exception()}")
+                # 실패했고 진행 중인 요청이 없으면 다음 공급자로 즉시 넘어간다
+                if not pending and queue:
+                    launch(queue.pop(0))
+        finally:
+            for task in pending:
+                task.cancel()
+        self.counters["all_failed"] += 1
+        self._record_decision(primary, None, hedged, errors)
+        raise AllProvidersFailed(errors)
+
+    def _record_decision(self, primary, winner, hedged, errors):
+        if winner and winner != primary:
+            self.counters["hedge_wins" if hedged and not errors else "fallbacks"] += 1
+        self.decisions.append({
+            "at": time.time(),
+            "primary": primary,
+            "winner": winner,
+            "hedged": hedged,
+            "errors": errors,
+        })
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "providers": {
+                name: {**health.snapshot(now), "hedge_delay_s": round(self.hedge_delay(name), 2)}
+                for name, health in self.health.items()
+            },
+            "ranking": self.rank(explore=False),
+            "counters": dict(self.counters),
+            "recent_decisions": list(self.decisions),
+        }
@@ -1,67 +1,264 @@
-from fastapi import FastAPI, Depends, HTTPException, APIRouter, Request
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models import Conversation
-from app.schemas import ChatRequest, ChatResponse, ConversationCreate, UserCreate, SocialLoginRequest
-from app.mental_agent_graph import build_mental_graph
-from app.crud import create_message, create_user, get_user_by_social, create_user_social
-import requests
-import os
-
-app = FastAPI()
-router = APIRouter()
-
 from dotenv import load_dotenv
+# 다른 app 모듈이 import 시점에 환경 변수를 읽으므로 가장 먼저 한 번만 불러온다
 load_dotenv()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db  
-    finally:
-        db.close()
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, APIRouter, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import SessionLocal, ReadSessionLocal, RoundTripCounter, track_round_trips, pool_stats
+from app.models import User
+from app.schemas import ChatRequest, ChatResponse, ConversationCreate, UserCreate, SocialLoginRequest, DeadJobReplay
+from app.mental_agent_graph import compile_mental_graph
+from app.mental_agent import providers, retrieval_cache, conversation_memory, prompt_usage, VECTOR_BACKEND, EMOTION_MODE, EmotionHeaderStripper
+from app.crud import create_user, get_social_user, create_user_social, conversation_belongs_to, create_conversation as crud_create_conversation
+from app.session_cache import entity_cache
+from app.write_queue import write_queue, persist_turn, WRITE_QUEUE_VISIBLE_TIMEOUT
+from app.turn_gate import turn_gate, turn_key
+from app.analytics import HISTORY, list_history, daily_stats, summarize, create_export_report, export_history
+from app.oauth import OAuthClient, PROVIDERS
+from app.metrics import METRICS_ENABLED, RequestMetricsMiddleware, metrics
+import asyncio
+import os
+import json
+import time
+from datetime import date, datetime
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest, db: Session = Depends(get_db)):
-    conv = db.query(Conversation).filter_by(conversation_id=req.conversation_id, user_id=req.user_id).first()
-    if not conv:
-        raise HTTPException(status_code=404, detail="대화 세션을 찾을 수 없습니다.")
-    
-    create_message(
-        db,
-        conversation_id=req.conversation_id,
-        sender_type="user",
-        agent_type="TBD(router)",
-        content=req.user_input
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 컴파일된 그래프는 프로세스 수명 동안 재사용
+    app.state.mental_graph = compile_mental_graph()
+    # LLM/임베딩 클라이언트와 벡터 인덱스를 미리 만들어 첫 요청의 콜드 스타트를 없앤다.
+    # PROVIDER_WARMUP=0이면 처음 쓰는 요청에서 만든다 (/signup, 로그인만 받는 워커는 만들지 않음)
+    if os.getenv("PROVIDER_WARMUP", "1") == "1":
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, providers.startup)
+        try:
+            await loop.run_in_executor(None, providers.get("vectorstore").warmup)
+        except Exception as e:
+            print(f"벡터 인덱스 warmup 실패 ({VECTOR_BACKEND}): {e}")
+    # 이전 프로세스가 남긴 쓰기 작업이 있으면 이어서 반영한다
+    await write_queue.start()
+    # 소셜 로그인 공급자 호출은 커넥션 풀을 공유하는 클라이언트 하나로 처리
+    app.state.oauth_client = OAuthClient(
+        connect_timeout=float(os.getenv("OAUTH_CONNECT_TIMEOUT", "3")),
+        read_timeout=float(os.getenv("OAUTH_READ_TIMEOUT", "10")),
+        retries=int(os.getenv("OAUTH_RETRIES", "2")),
     )
+    yield
+    await app.state.oauth_client.aclose()
+    await entity_cache.backend.close()
+    await conversation_memory.drain()
+    await write_queue.stop()
+    if providers.peek("embedding") is not None:
+        providers.peek("embedding").save()
 
-    g = build_mental_graph()
-    runnable = g.compile()
-    state = {
+app = FastAPI(lifespan=lifespan)
+if METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware)
+router = APIRouter()
+
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+async def start_chat_turn(req: ChatRequest):
+    # 방금 만든 대화일 수 있으므로 소유 확인은 복제본이 아니라 primary에서 짧은 세션으로 한다
+    async with SessionLocal() as db:
+        if not await conversation_belongs_to(db, req.conversation_id, req.user_id):
+            raise HTTPException(status_code=404, detail="대화 세션을 찾을 수 없습니다.")
+    # 이번 질문과 답변은 답변이 나온 뒤 persist_turn에서 함께 저장한다 (현재 질문은 프롬프트에 따로 들어간다)
+    return {
         "user_id": req.user_id,
         "conversation_id": req.conversation_id,
         "user_input": req.user_input,
         "phq9_suggested": False,
-        "db": db,  # db session을 state에 추가!
     }
-    result = runnable.invoke(state)
+
+async def finish_chat_turn(state: dict, result: dict, started_at: datetime):
+    # 기본(queue 모드)은 로컬 큐에 넣고 바로 돌아온다. MySQL 반영은 백그라운드 워커가 한다
+    # (세션은 처음 쿼리할 때 커넥션을 얻으므로 queue 모드에서는 커넥션을 쓰지 않는다)
+    async with SessionLocal() as db:
+        ids = await persist_turn(db, state, result, started_at)
+    if ids:
+        # 응답은 기다리지 않고, 대화 락만 반영될 때까지 잡아 다음 턴이 이 턴을 읽게 한다
+        turn_gate.hold(write_queue.wait_applied(ids, WRITE_QUEUE_VISIBLE_TIMEOUT))
+
+def graph_config(**configurable):
+    # 조회 노드는 이 팩토리로 짧은 세션을 열고 닫는다. 턴 전체(LLM 호출 포함) 동안 커넥션을 잡지 않는다
+    # (캐시에 넣는 PHQ-9 스냅샷만 primary_session으로 읽는다)
+    return {"configurable": {"read_session": ReadSessionLocal, "primary_session": SessionLocal, **configurable}}
+
+def chat_turn_key(req: ChatRequest, request: Request):
+    # 같은 대화의 같은 입력(또는 같은 Idempotency-Key)은 한 번만 실행한다. 키가 있으면 끝난 뒤 재시도에도 같은 답을 준다
+    idempotency_key = request.headers.get("Idempotency-Key")
+    return turn_key(req.user_id, req.conversation_id, req.user_input, idempotency_key), idempotency_key is not None
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, request: Request, response: Response):
+    async def run_turn():
+        started_at = datetime.now()
+        with track_round_trips() as round_trips:
+            state = await start_chat_turn(req)
+            runnable = request.app.state.mental_graph
+            result = await runnable.ainvoke(state, config=graph_config())
+            await finish_chat_turn(state, result, started_at)
+        return result, round_trips.count
+
+    key, replayable = chat_turn_key(req, request)
+    result, round_trips = await turn_gate.run(req.conversation_id, key, run_turn, replayable=replayable)
+    response.headers["X-DB-Round-Trips"] = str(round_trips)
     return result
 
-@app.post("/create_conversation")
-def create_conversation(req: ConversationCreate, db: Session = Depends(get_db)):
-    from app.models import Conversation
-    from datetime import datetime
-    conv = Conversation(
-        user_id=req.user_id, started_at=datetime.now()
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """SSE로 답변 토큰을 스트리밍한다.
+
+    이벤트 순서: token* → (reset → token*)* → references → phq9(제안 시) → done(ttft_ms, total_ms, db_round_trips)
+    reset은 답하던 모델이 실패해 다른 모델의 답으로 바뀔 때 온다. 클라이언트는 받은 토큰을 지우고 이어지는 토큰만 보여 준다.
+    """
+    started = time.perf_counter()
+    started_at = datetime.now()
+    round_trips = RoundTripCounter()
+    # 대화 소유 확인은 스트림을 열기 전에 해서 404를 그대로 돌려준다
+    with track_round_trips(round_trips):
+        state = await start_chat_turn(req)
+    runnable = request.app.state.mental_graph
+
+    async def event_stream():
+        ttft_ms = None
+        final = {}
+        run_id, sent = None, []  # 지금 보내고 있는 모델 응답의 id와 보낸 토큰
+        stripper = None
+        with track_round_trips(round_trips):
+            async for mode, payload in runnable.astream(
+                state,
+                config=graph_config(stream=True),
+                stream_mode=["messages", "updates"],
+            ):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") != "llm" or not isinstance(chunk.content, str) or not chunk.content:
+                        continue
+                    if chunk.id != run_id:
+                        # 다른 응답의 토큰: 앞 모델이 답하다 실패해 폴백 모델이 처음부터 답한다
+                        if sent:
+                            yield sse_event("reset", {})
+                        run_id, sent = chunk.id, []
+                        # fused 모드의 '[감정: ...]' 머리줄은 응답마다 사용자에게 보내지 않는다
+                        stripper = EmotionHeaderStripper() if EMOTION_MODE == "fused" else None
+                    text = stripper.feed(chunk.content) if stripper else chunk.content
+                    if not text:
+                        continue
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                    sent.append(text)
+                    yield sse_event("token", {"text": text})
+                    continue
+                for node, update in payload.items():
+                    if node == "llm":
+                        rest = stripper.flush() if stripper else ""
+                        if rest:
+                            sent.append(rest)
+                            yield sse_event("token", {"text": rest})
+                        if "".join(sent).strip() != update["answer"].strip():
+                            # 토큰 스트리밍을 지원하지 않는 모델의 답, 또는 보낸 토큰과 다른 최종 답(실패 후 폴백,
+                            # 두 모델 모두 실패)은 저장될 답과 같도록 한 번에 다시 보낸다
+                            if sent:
+                                yield sse_event("reset", {})
+                            if ttft_ms is None:
+                                ttft_ms = (time.perf_counter() - started) * 1000
+                            yield sse_event("token", {"text": update["answer"]})
+                    if node in ("emotion", "llm", "postprocess"):
+                        final.update(update)
+        yield sse_event("references", {"text": final.get("footer", "")})
+        if final.get("phq9_form"):
+            yield sse_event("phq9", {"text": final["phq9_form"]})
+        total_ms = (time.perf_counter() - started) * 1000
+        yield sse_event("done", {
+            # 토큰이 하나도 나오지 않은 턴(두 모델 모두 실패 등)은 None
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "total_ms": round(total_ms, 1),
+            "llm_used": final.get("llm_used"),
+            "db_round_trips": round_trips.count,
+        })
+        # 저장은 done을 보낸 뒤에 한다. 이 생성기 안에서 하므로 턴 관문의 대화 락은 저장까지 잡힌다
+        with track_round_trips(round_trips):
+            await finish_chat_turn(state, final, started_at)
+
+    # 같은 키의 중복 요청은 먼저 시작한 스트림의 이벤트를 처음부터 함께 받는다
+    key, replayable = chat_turn_key(req, request)
+    return StreamingResponse(
+        turn_gate.stream(req.conversation_id, f"stream:{key}", event_stream, replayable=replayable),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    db.add(conv)
-    db.commit()
-    db.refresh(conv)
+
+def provider_stats(name: str) -> dict:
+    # 아직 만들어지지 않은 클라이언트는 메트릭 조회 때문에 만들지 않는다
+    client = providers.peek(name)
+    return client.stats() if client is not None else {}
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    return {
+        "embedding": provider_stats("embedding"),
+        "retrieval": retrieval_cache.stats(),
+        "emotion": provider_stats("emotion_classifier"),
+        "session": entity_cache.stats(),
+        "memory": conversation_memory.stats(),
+        "prompt": prompt_usage.stats(),
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # 노드/SQL/공급자 호출/HTTP 지연 히스토그램과 LLM 선택/토큰 카운터 (Prometheus 텍스트 형식)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/queue")
+async def queue_metrics():
+    return write_queue.stats()
+
+@app.get("/queue/dead")
+async def dead_jobs(limit: int = Query(50, ge=1, le=1000)):
+    # max_attempts번 실패해 더 이상 재시도하지 않는 쓰기 작업과 마지막 오류
+    return {"count": write_queue.dead_count(), "jobs": write_queue.dead_jobs(limit)}
+
+@app.post("/queue/dead/replay")
+async def replay_dead_jobs(req: DeadJobReplay = None):
+    # 원인(스키마, 데이터)을 고친 뒤 다시 넣는다. 메시지/기록은 request_key로 중복 반영되지 않는다
+    return {"replayed": write_queue.replay_dead(req.ids if req else None)}
+
+@app.get("/metrics/db")
+async def db_metrics():
+    # 풀 대기/점유 시간 히스토그램과 체크아웃 수는 /metrics (db_pool_*)에 있다
+    return pool_stats()
+
+@app.get("/metrics/turns")
+async def turn_metrics():
+    return turn_gate.stats()
+
+@app.get("/llm/router")
+async def llm_router_state():
+    router = providers.peek("llm_router")
+    summary_router = providers.peek("summary_router")
+    return {
+        **(router.snapshot() if router is not None else {}),
+        "summary": summary_router.snapshot() if summary_router is not None else None,
+        "registry": providers.stats(),
+    }
+
+@app.post("/create_conversation")
+async def create_conversation(req: ConversationCreate, db: AsyncSession = Depends(get_db)):
+    conv = await crud_create_conversation(db, req.user_id)
     return {"conversation_id": conv.conversation_id}
 
 @app.post("/signup")
-def signup(req: UserCreate, db: Session = Depends(get_db)):
-    user = create_user(
+async def signup(req: UserCreate, db: AsyncSession = Depends(get_db)):
+    user = await create_user(
         db,
         email=req.email,
         password=req.password,
@@ -70,97 +267,90 @@ def signup(req: UserCreate, db: Session = Depends(get_db)):
     )
     return {"user_id": user.user_id}
 
+async def social_login(request: Request, provider_name: str, code: str, db: AsyncSession, **extra):
+    # 세 공급자 공통 흐름: 인가 코드 -> 토큰 교환 -> 사용자 정보 -> 가입/조회
+    provider = PROVIDERS[provider_name]
+    token, social_id, email, nickname = await request.app.state.oauth_client.login(provider, code, **extra)
+
+    if ReadSessionLocal is SessionLocal:
+        user = await get_social_user(db, provider.name, social_id)
+    else:
+        # 기존 사용자 조회는 복제본에서 한다. 복제 지연으로 못 찾으면 가입 전에 primary에서 한 번 더 확인한다
+        async with ReadSessionLocal() as read_db:
+            user = await get_social_user(read_db, provider.name, social_id)
+        if not user:
+            user = await get_social_user(db, provider.name, social_id)
+    if not user:
+        created = await create_user_social(db, provider.name, social_id, email, nickname, access_token=token)
+        user = {"user_id": created.user_id, "email": created.email}
+    return {"user_id": user["user_id"], "provider": provider.name, "email": user["email"]}
+
 # 1. 구글 소셜 로그인
 @router.api_route("/login/oauth2/code/google", methods=["GET", "POST"])
-def google_login(request: Request, code: str, db: Session = Depends(get_db)):
-    token_url = "https://oauth2.googleapis.com/token"
-    data = {
-        "code": code,
-        "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-        "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-        "redirect_uri": os.getenv("GOOGLE_REDIRECT_URI"),
-        "grant_type": "authorization_code",
-    }
-    resp = requests.post(token_url, data=data)
-    if not resp.ok:
-        raise HTTPException(400, "구글 토큰 요청 실패")
-    token = resp.json()["access_token"]
-
-    userinfo = requests.get(
-        "https://www.googleapis.com/oauth2/v2/userinfo",
-        headers={"Authorization": f"Bearer {token}"}
-    ).json()
-    provider = "google"
-    social_id = userinfo["id"]
-    email = userinfo.get("email")
-    nickname = userinfo.get("name", "")
-
-    user = get_user_by_social(db, provider, social_id)
-    if not user:
-        user = create_user_social(db, provider, social_id, email, nickname, access_token=token)
-    return {"user_id": user.user_id, "provider": provider, "email": user.email}
+async def google_login(request: Request, code: str, db: AsyncSession = Depends(get_db)):
+    return await social_login(request, "google", code, db)
 
 
 # 2. 카카오 소셜 로그인
 @router.api_route("/login/oauth2/code/kakao", methods=["GET", "POST"])
-def kakao_login(code: str, db: Session = Depends(get_db)):
-    token_url = "https://kauth.kakao.com/oauth/token"
-    data = {
-        "grant_type": "authorization_code",
-        "client_id": os.getenv("KAKAO_CLIENT_ID"),
-        "redirect_uri": os.getenv("KAKAO_REDIRECT_URI"),
-        "code": code,
-    }
-    resp = requests.post(token_url, data=data)
-    if not resp.ok:
-        raise HTTPException(400, "카카오 토큰 요청 실패")
-    token = resp.json()["access_token"] 
-
-    userinfo = requests.get(
-        "https://kapi.kakao.com/v2/user/me",
-        headers={"Authorization": f"Bearer {token}"}
-    ).json()
-    provider = "kakao"
-    social_id = str(userinfo["id"])
-    kakao_account = userinfo.get("kakao_account", {})
-    email = kakao_account.get("email", None)
-    nickname = kakao_account.get("profile", {}).get("nickname", "")
-
-    user = get_user_by_social(db, provider, social_id)
-    if not user:
-        user = create_user_social(db, provider, social_id, email, nickname, access_token=token)
-    return {"user_id": user.user_id, "provider": provider, "email": user.email}
+async def kakao_login(request: Request, code: str, db: AsyncSession = Depends(get_db)):
+    return await social_login(request, "kakao", code, db)
 
 
 # 3. 네이버 소셜 로그인
 @router.api_route("/login/oauth2/code/naver", methods=["GET", "POST"])
-def naver_login(code: str, state: str, db: Session = Depends(get_db)):
-    token_url = "https://nid.naver.com/oauth2.0/token"
-    data = {
-        "grant_type": "authorization_code",
-        "client_id": os.getenv("NAVER_CLIENT_ID"),
-        "client_secret": os.getenv("NAVER_CLIENT_SECRET"),
-        "code": code,
-        "state": state,
-        "redirect_uri": os.getenv("NAVER_REDIRECT_URI")
-    }
-    resp = requests.post(token_url, data=data)
-    if not resp.ok:
-        raise HTTPException(400, "네이버 토큰 요청 실패")
-    token = resp.json()["access_token"]
-
-    userinfo = requests.get(
-        "https://openapi.naver.com/v1/nid/me",
-        headers={"Authorization": f"Bearer {token}"}
-    ).json()["response"]
-    provider = "naver"
-    social_id = userinfo["id"]
-    email = userinfo.get("email", None)
-    nickname = userinfo.get("nickname", "")
-
-    user = get_user_by_social(db, provider, social_id)
-    if not user:
-        user = create_user_social(db, provider, social_id, email, nickname, access_token=token)
-    return {"user_id": user.user_id, "provider": provider, "email": user.email}
+async def naver_login(request: Request, code: str, state: str, db: AsyncSession = Depends(get_db)):
+    return await social_login(request, "naver", code, db, state=state)
+
+app.include_router(router)
+
+# 상담사용 분석 API. 일별 집계(daily_stat)와 기록 테이블의 인덱스만 읽고 message 테이블은 스캔하지 않는다
+def check_history_kind(kind: str):
+    if kind not in HISTORY:
+        raise HTTPException(status_code=400, detail=f"kind는 {', '.join(HISTORY)} 중 하나여야 합니다.")
+
+@app.get("/analytics/users/{user_id}/history/{kind}")
+async def user_history(user_id: int, kind: str, before: int = None, limit: int = Query(50, ge=1, le=500)):
+    check_history_kind(kind)
+    async with ReadSessionLocal() as db:
+        return await list_history(db, kind, user_id, before, limit)
+
+@app.get("/analytics/users/{user_id}/daily")
+async def user_daily(user_id: int, start: date = None, end: date = None, before: date = None, limit: int = Query(31, ge=1, le=366)):
+    async with ReadSessionLocal() as db:
+        return await daily_stats(db, "user", str(user_id), start, end, before, limit)
+
+@app.get("/analytics/users/{user_id}/summary")
+async def user_summary(user_id: int, start: date = None, end: date = None):
+    async with ReadSessionLocal() as db:
+        return await summarize(db, "user", str(user_id), start, end)
+
+@app.get("/analytics/cohorts/{cohort}/daily")
+async def cohort_daily(cohort: str, start: date = None, end: date = None, before: date = None, limit: int = Query(31, ge=1, le=366)):
+    # cohort는 user.business_type (없는 사용자는 "(none)")
+    async with ReadSessionLocal() as db:
+        return await daily_stats(db, "cohort", cohort, start, end, before, limit)
+
+@app.get("/analytics/cohorts/{cohort}/summary")
+async def cohort_summary(cohort: str, start: date = None, end: date = None):
+    async with ReadSessionLocal() as db:
+        return await summarize(db, "cohort", cohort, start, end)
 
-app.include_router(router)
\ No newline at end of file
+@app.get("/analytics/users/{user_id}/export/{kind}")
+async def export_user_history(user_id: int, kind: str, format: str = "csv", start: date = None, end: date = None):
+    """기록을 CSV 또는 JSON으로 스트리밍하고, 내보내기 한 건을 report 행으로 남긴다 (X-Report-Id)."""
+    check_history_kind(kind)
+    if format not in ("csv", "json"):
+        raise HTTPException(status_code=400, detail="format은 csv 또는 json이어야 합니다.")
+    async with SessionLocal() as db:
+        if await db.get(User, user_id) is None:
+            raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다.")
+        report = await create_export_report(db, user_id, kind, format, start, end)
+    return StreamingResponse(
+        export_history(ReadSessionLocal, SessionLocal, report.report_id, kind, user_id, format, start, end),
+        media_type="text/csv; charset=utf-8" if format == "csv" else "application/json",
+        headers={
+            "Content-Disposition": f'attachment; filename="{kind}-{user_id}-{report.report_id}.{format}"',
+            "X-Report-Id": str(report.report_id),
+        },
+    )
\ No newline at end of file
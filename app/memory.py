@@ -0,0 +1,126 @@
+import asyncio
+import re
+
+from app.crud import get_recent_messages, get_messages_between, get_conversation_summary, save_conversation_summary
+
+# 저장된 상담사 답변 뒤에 붙는 참고자료/PHQ-9 설문 블록. 대화 기록에는 본문만 넣는다
+_APPENDIX = re.compile(r"\n*\[(?:참고자료|PHQ-9 설문)\]\n")
+_HANGUL = re.compile(r"[가-힣]")
+
+
+def strip_appendix(content: str) -> str:
+    match = _APPENDIX.search(content or "")
+    return content[:match.start()].rstrip() if match else (content or "")
+
+
+def estimate_tokens(text: str) -> int:
+    # 토크나이저 없이 쓰는 근사치: 한글은 음절당 1토큰, 그 밖의 문자는 4자당 1토큰
+    hangul = len(_HANGUL.findall(text))
+    return hangul + (len(text) - hangul) // 4 + 1
+
+
+def format_line(sender_type: str, content: str) -> str:
+    prefix = "Human" if sender_type == "user" else "AI"
+    return f"{prefix}: {strip_appendix(content)}"
+
+
+class ConversationMemory:
+    """토큰 예산 안에서 대화 기록을 만든다.
+
+    최근 메시지를 최신순으로 예산이 찰 때까지 원문 그대로 넣고, 예산 밖으로 밀려난 메시지는
+    대화별 누적 요약(conversation_summary)에 반영한다. 요약은 밀려난 메시지가
+    summary_trigger개 이상 쌓였을 때만 백그라운드에서 이전 요약 + 새 메시지로 갱신한다.
+    한 번 갱신에는 오래된 메시지부터 summary_chunk개까지만 넣고, 남은 메시지는 다음 갱신이 이어서 반영한다
+    (요약이 없던 긴 대화도 프롬프트 하나에 전부 들어가지 않는다).
+    """
+
+    def __init__(
+        self,
+        summarize,
+        session_factory,
+        token_budget: int = 600,
+        summary_trigger: int = 6,
+        max_messages: int = 40,
+        summary_chunk: int = 40,
+    ):
+        self.summarize = summarize          # async (previous_summary, lines) -> str
+        self.session_factory = session_factory
+        self.token_budget = token_budget
+        self.summary_trigger = summary_trigger
+        self.max_messages = max_messages
+        self.summary_chunk = summary_chunk
+        self._updating = set()              # 요약 갱신 중인 conversation_id (대화당 하나만)
+        self._tasks = set()
+        self.counters = {"summaries": 0, "summary_errors": 0}
+
+    async def load_history(self, db, conversation_id: int) -> str:
+        summary = await get_conversation_summary(db, conversation_id)
+        after = summary.last_message_id if summary else 0
+        rows = await get_recent_messages(db, conversation_id, after, self.max_messages)
+
+        budget = self.token_budget
+        if summary:
+            budget -= estimate_tokens(summary.summary)
+        lines, kept = [], 0
+        for message_id, sender_type, content in rows:  # 최신순
+            line = format_line(sender_type, content)
+            cost = estimate_tokens(line)
+            if lines and cost > budget:
+                break
+            lines.append(line)
+            budget -= cost
+            kept += 1
+
+        overflow = rows[kept:]
+        if len(overflow) >= self.summary_trigger or (len(rows) == self.max_messages and overflow):
+            # overflow[0]이 예산 밖으로 밀려난 가장 최근 메시지
+            self.schedule_summary(conversation_id, upto_message_id=overflow[0][0])
+
+        history = "\n".join(reversed(lines))
+        if summary:
+            history = f"[이전 대화 요약]\n{summary.summary}\n\n{history}"
+        return history
+
+    def schedule_summary(self, conversation_id: int, upto_message_id: int):
+        if conversation_id in self._updating:
+            return
+        self._updating.add(conversation_id)
+        task = asyncio.create_task(self._update_summary(conversation_id, upto_message_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update_summary(self, conversation_id: int, upto_message_id: int):
+        try:
+            # 요청 세션과 별개의 세션을 쓴다 (요청 트랜잭션/커넥션을 붙잡지 않음)
+            async with self.session_factory() as db:
+                summary = await get_conversation_summary(db, conversation_id)
+                after = summary.last_message_id if summary else 0
+                if upto_message_id <= after:
+                    return
+                rows = await get_messages_between(db, conversation_id, after, upto_message_id, self.summary_chunk)
+                if not rows:
+                    return
+                lines = [format_line(sender_type, content) for _, sender_type, content in rows]
+                text = await self.summarize(summary.summary if summary else "", lines)
+                await save_conversation_summary(db, conversation_id, text.strip(), rows[-1][0])
+                self.counters["summaries"] += 1
+        except Exception as e:
+            # 요약 실패는 다음 턴에 다시 시도된다. 답변 경로에는 영향이 없다
+            self.counters["summary_errors"] += 1
+            print(f"대화 요약 오류 (conversation={conversation_id}): {e}")
+        finally:
+            self._updating.discard(conversation_id)
+
+    async def drain(self):
+        """진행 중인 요약 갱신을 기다린다 (종료 시/벤치마크용)."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "summary_trigger": self.summary_trigger,
+            "summary_chunk": self.summary_chunk,
+            "updating": len(self._updating),
+            **self.counters,
+        }
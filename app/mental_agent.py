@@ -1,144 +1,307 @@
 import os
-import threading
+import re
 from datetime import datetime
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-import openai
-
-from sqlalchemy.orm import Session
-from app.crud import (
-    create_message, get_conversation_history,
-    save_or_update_phq9_result, get_latest_phq9_by_user
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from app.cache import CachedEmbeddings, RetrievalCache
+from app.emotion import build_emotion_classifier, normalize_label
+from app.llm_router import LLMRouter
+from app.metrics import track_provider
+from app.providers import ProviderRegistry
+from app.vector_store import RetrieverSettings, build_vector_index, default_index_path
+from app.memory import ConversationMemory
+from app.database import SessionLocal
+
+# 환경 변수(.env)는 진입점(app.main)에서 한 번만 읽는다
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# VECTOR_BACKEND: chroma(기존 컬렉션) | faiss | hnswlib | numpy(작은 코퍼스 전수 비교)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+retriever_settings = RetrieverSettings.from_env()
+retrieval_cache = RetrievalCache(
+    maxsize=int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "3600")),
+    version=os.getenv("VECTOR_COLLECTION_VERSION", "1"),
 )
 
-from dotenv import load_dotenv
-load_dotenv()
+# 외부 클라이언트는 처음 쓸 때(또는 lifespan의 providers.startup) 만든다.
+# langchain_openai / langchain_google_genai / openai import도 생성 함수 안에서 한다
+providers = ProviderRegistry()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+def _build_openai_client():
+    import openai
 
-openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    return openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-embedding = OpenAIEmbeddings(model="text-embedding-3-small")
-vectorstore = Chroma(
-    collection_name="global-documents",
-    embedding_function=embedding,
-    persist_directory="D:/penta/data/vector_db"
-)
+def _build_embedding():
+    from langchain_openai import OpenAIEmbeddings
 
-answer_prompt = PromptTemplate(
-    input_variables=["context", "question", "chat_history"],
-    template="""
-당신은 친절하고 공감하는 멘탈 건강 상담사입니다.
-아래 이전 대화 내용, 상담 기록, 참고 내용을 종합적으로 고려하여 사용자 질문에 대해 친절하고 이해하기 쉽게 답변해 주세요.
-특히 이전 대화에서 언급된 PHQ-9 점수, 감정 상태, 개인적 상황 등을 기억하고 연속성 있는 상담을 제공하세요.
-상담자가 우울함을 표시하고 있다면 공감을 표하고 PHQ-9 설문을 제안하세요. 단 PHQ-9 설문 제안은 1회에 한해서만 하세요.
-PHQ-9 점수에 따라 적절한 조치를 안내하세요.
-상담 기록 및 참고 내용에 실명이 들어가 있다면 무시해줘.
+    # 자주 들어오는 짧은 입력은 임베딩 API와 벡터 검색을 건너뛴다
+    return CachedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-small"),
+        maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+        ttl=float(os.getenv("EMBEDDING_CACHE_TTL", "86400")),
+        persist_path=os.getenv("EMBEDDING_CACHE_PATH"),
+    )
+
+def _build_vectorstore():
+    return build_vector_index(
+        VECTOR_BACKEND,
+        default_index_path(VECTOR_BACKEND),
+        embedding_function=providers.get("embedding"),
+        settings=retriever_settings,
+    )
 
-이전 대화 내용:
-{chat_history}
+def _build_llm_pool():
+    from langchain_openai import ChatOpenAI
+    from langchain_google_genai import ChatGoogleGenerativeAI
 
-상담 기록 및 참고 내용:
-{context}
+    return {
+        "openai": ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0.7,
+            api_key=os.getenv("OPENAI_API_KEY")
+            ),
+        "gemini": ChatGoogleGenerativeAI(
+            google_api_key=os.getenv("GEMINI_API_KEY"),
+            model="gemini-1.5-flash-latest",
+            temperature=0.7,
+        )
+    }
 
-사용자 질문:
-{question}
+def _build_llm_router():
+    # 고정 4:1 라운드로빈 대신 공급자별 지연/오류율/서킷 상태로 고른다
+    return LLMRouter(
+        providers.get("llm_pool"),
+        hedge_enabled=os.getenv("LLM_HEDGE_ENABLED", "1") == "1",
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+    )
 
-답변:
-"""
-)
+def _build_summary_router():
+    # 백그라운드 요약은 같은 모델을 쓰되 공급자 상태를 따로 센다 (요약 실패가 답변 경로의 서킷을 열지 않도록)
+    return LLMRouter(
+        providers.get("llm_pool"),
+        hedge_enabled=False,
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+    )
 
-LLM_POOL = {
-    "openai": ChatOpenAI(
-        model="gpt-4o-mini", 
-        temperature=0.7, 
-        api_key=OPENAI_API_KEY
-        ),
-    "gemini": ChatGoogleGenerativeAI(
-        google_api_key=GEMINI_API_KEY,
-        model="gemini-1.5-flash-latest",
-        temperature=0.7,
+def _build_emotion_classifier():
+    # 기본은 기존과 같은 analyze_emotion(LLM) 호출. "embedding"(검색용 질의 임베딩을 재사용하는 로컬 분류기)과
+    # "lexicon"은 확신도가 낮을 때만 LLM을 부른다. 실제 임베딩으로 LLM과의 일치율을 재기 전까지는 켜지 않는다
+    # (python -m bench.bench_emotion --with-llm)
+    return build_emotion_classifier(
+        os.getenv("EMOTION_BACKEND", "llm"),
+        embedder=providers.get("embedding"),
+        analyze=analyze_emotion,
+        threshold=float(os.getenv("EMOTION_CONFIDENCE_THRESHOLD", "0.5")),
     )
-}
-llm_call_count = 0
-llm_lock = threading.Lock()
 
-def get_llm_choice():
-    global llm_call_count
-    with llm_lock:
-        use_gemini = (llm_call_count % 5 == 4)
-        llm_call_count += 1
-    return "gemini" if use_gemini else "openai"
+providers.register("openai_client", _build_openai_client)
+providers.register("embedding", _build_embedding)
+providers.register("vectorstore", _build_vectorstore)
+providers.register("llm_pool", _build_llm_pool)
+providers.register("llm_router", _build_llm_router)
+providers.register("summary_router", _build_summary_router)
+providers.register("emotion_classifier", _build_emotion_classifier)
+
+def get_embedding() -> CachedEmbeddings:
+    return providers.get("embedding")
 
-def get_fallback_llm_name(current_llm_name):
-    return "gemini" if current_llm_name == "openai" else "openai"
+def get_vectorstore():
+    return providers.get("vectorstore")
 
-def analyze_emotion(text: str) -> str:
+def get_llm_router() -> LLMRouter:
+    return providers.get("llm_router")
+
+def get_emotion_classifier():
+    return providers.get("emotion_classifier")
+
+def build_emotion_messages(text: str):
     prompt = (
         f"다음 사용자의 감정을 하나의 단어로 요약해 주세요. "
         f"가능한 값: 긍정, 중립, 슬픔, 우울, 불안, 분노, 행복, 기타.\n"
         f"텍스트: \"{text}\"\n"
         f"감정:"
     )
+    return [
+        {"role": "system", "content": "당신은 감정분석가입니다."},
+        {"role": "user", "content": prompt},
+    ]
+
+async def analyze_emotion(text: str) -> str:
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "당신은 감정분석가입니다."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0
-        )
+        with track_provider("emotion_llm"):
+            response = await providers.get("openai_client").chat.completions.create(
+                model="gpt-4o-mini",
+                messages=build_emotion_messages(text),
+                temperature=0
+            )
         return response.choices[0].message.content.strip()
     except Exception as e:
         print(f"감정 분석 오류: {e}")
         return "중립"
 
+async def retrieve_documents(query: str):
+    # 질의 임베딩은 캐시(및 동시 요청 합치기)를 거쳐 감정 분류와 공유된다
+    vector = await get_embedding().aembed_query(query)
+    with track_provider(f"vectorstore:{VECTOR_BACKEND}"):
+        return await get_vectorstore().asearch(vector, retriever_settings)
+
+SUMMARY_PROMPT = """다음은 멘탈 건강 상담 대화의 이전 요약과 그 뒤에 이어진 대화입니다.
+이전 요약에 새 대화 내용을 반영해 하나의 요약으로 다시 작성하세요.
+사용자의 고민, 감정 변화, PHQ-9 점수, 상담사가 제안한 내용처럼 이후 상담에 필요한 정보만 남기고
+10문장 이내로 작성하세요. 실명은 적지 마세요.
+
+=== 이전 요약 ===
+{previous}
+
+=== 새 대화 ===
+{dialogue}
+
+요약:"""
+
+async def summarize_conversation(previous: str, lines) -> str:
+    prompt = SUMMARY_PROMPT.format(previous=previous or "(없음)", dialogue="\n".join(lines))
+    routed = await providers.get("summary_router").ainvoke(prompt)
+    response = routed.response
+    return response.content if hasattr(response, "content") else str(response)
+
+# 대화 기록은 고정 6개 대신 토큰 예산으로 자르고, 밀려난 메시지는 누적 요약으로 남긴다
+conversation_memory = ConversationMemory(
+    summarize_conversation,
+    SessionLocal,
+    token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "600")),
+    summary_trigger=int(os.getenv("HISTORY_SUMMARY_TRIGGER", "6")),
+    max_messages=int(os.getenv("HISTORY_MAX_MESSAGES", "40")),
+    summary_chunk=int(os.getenv("HISTORY_SUMMARY_CHUNK", "40")),
+)
+
+# "separate": 감정 분석과 답변 생성을 따로 호출, "fused": 답변 생성 호출 한 번에 감정 레이블까지 받는다
+EMOTION_MODE = os.getenv("EMOTION_MODE", "separate")
+
+FUSED_EMOTION_INSTRUCTION = (
+    "답변의 첫 줄에는 사용자의 현재 감정을 [감정: 레이블] 형식으로만 적고, 둘째 줄부터 상담 답변을 작성하세요.\n"
+    "레이블은 긍정, 중립, 슬픔, 우울, 불안, 분노, 행복, 기타 중 하나입니다."
+)
+# 답변 생성의 시스템 메시지. 이전 프롬프트의 지시문을 그대로 옮긴 것으로, 요청/사용자/공급자와 무관하게
+# 바이트 단위로 같다. 요청마다 달라지는 내용(세션 정보, 대화, 검색 결과, 질문)은 모두 사람 메시지로 보낸다.
+# 공급자 측 프롬프트 캐시(OpenAI/Gemini)는 1024토큰 이상 prefix부터 적용되는데, 지시문을 늘려 그 길이를
+# 채우면 캐시 할인보다 늘어난 입력 토큰이 더 비싸다 (bench_prompt_cache). 지시문은 필요한 만큼만 둔다
+ANSWER_SYSTEM_PROMPT = """당신은 친절하고 공감하는 멘탈 건강 상담사입니다.
+항상 같은 인사말(예: '안녕하세요')로 시작하지 말고,
+질문에 바로 상담 답변을 해주세요.
+
+아래 이전 대화 내용, 상담 기록, 참고 내용을 종합적으로 고려하여 사용자 질문에 대해 친절하고 이해하기 쉽게 답변해 주세요.
+특히 이전 대화에서 언급된 PHQ-9 점수, 감정 상태, 개인적 상황 등을 기억하고 연속성 있는 상담을 제공하세요.
+상담자가 우울함을 표시하고 있다면 공감을 표하고 PHQ-9 설문을 제안하세요. PHQ-9 설문 점수가 존재한다면 PHQ-9 점수에 따라 적절한 조치를 안내하세요.
+상담 기록 및 참고 내용에 실명이 들어가 있다면 무시해줘."""
+
+def build_answer_messages(state: dict, fused_emotion: bool = False):
+    """답변 생성 메시지 목록: 고정 시스템 메시지 + 요청별 사람 메시지.
+
+    사람 메시지는 대화 안에서 덜 바뀌는 것(세션 정보, 대화 기록)을 앞에,
+    매 턴 바뀌는 것(검색 결과, 질문)을 뒤에 둔다.
+    """
+    system = ANSWER_SYSTEM_PROMPT
+    if fused_emotion:
+        # 모드별 지시는 공통 prefix 뒤에 붙여 separate/fused가 같은 캐시를 쓰게 한다
+        system = f"{ANSWER_SYSTEM_PROMPT}\n\n{FUSED_EMOTION_INSTRUCTION}"
+    human = f"""=== 사용자 세션 정보 ===
+{state.get('user_context', '')}
+
+=== 최근 대화 내용 ===
+{state.get('chat_history', '')}
+
+=== 상담 기록 및 참고 내용 ===
+{state.get('context', '')}
+
+=== 현재 질문 ===
+{state['user_input']}
+
+답변:"""
+    return [SystemMessage(content=system), HumanMessage(content=human)]
+
+class PromptUsageStats:
+    """답변 생성 호출의 입력/캐시 토큰 누적치."""
+
+    def __init__(self):
+        self.turns = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, usage: dict):
+        self.turns += 1
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.cached_tokens += usage.get("cached_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.turns,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_ratio": round(self.cached_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+        }
+
+prompt_usage = PromptUsageStats()
+
+def cached_input_tokens(usage: dict) -> int:
+    # langchain usage_metadata: OpenAI/Gemini 모두 input_token_details.cache_read에 캐시 적중 토큰 수를 준다
+    return (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+
+_EMOTION_HEADER = re.compile(r"^\s*\[감정\s*[:：]\s*([^\]\n]+)\]\s*\n?")
+
+def split_emotion_header(text: str):
+    """'[감정: 우울]\n답변...' -> ("우울", "답변..."). 머리줄이 없으면 (None, text).
+
+    레이블은 normalize_label로 EMOTION_LABELS 중 하나(없으면 "기타")로 바꾼다.
+    """
+    match = _EMOTION_HEADER.match(text)
+    if not match:
+        return None, text
+    return normalize_label(match.group(1)), text[match.end():]
+
+class EmotionHeaderStripper:
+    """스트리밍 토큰에서 감정 머리줄을 걸러 낸다. 머리줄이 끝날 때까지는 버퍼링한다."""
+
+    def __init__(self, max_header_len: int = 40):
+        self.max_header_len = max_header_len
+        self.buffer = ""
+        self.done = False
+        self.emotion = None
+
+    def feed(self, text: str) -> str:
+        if self.done:
+            return text
+        self.buffer += text
+        if "\n" in self.buffer or len(self.buffer) > self.max_header_len:
+            return self.flush()
+        return ""
+
+    def flush(self) -> str:
+        if self.done:
+            return ""
+        self.done = True
+        self.emotion, body = split_emotion_header(self.buffer)
+        return body
+
 def is_depressed_emotion(emotion: str) -> bool:
     return any(keyword in emotion for keyword in ["우울"])
 
-def get_user_context_from_db(db: Session, user_id: int):
-    phq9 = get_latest_phq9_by_user(db, user_id)
+def format_user_context(phq9: dict) -> str:
     context_parts = []
     if phq9:
+        updated_at = datetime.fromisoformat(phq9["updated_at"])
         context_parts.append(
-            f"PHQ-9 점수: {phq9.score}점 ({phq9.level}, {phq9.updated_at.strftime('%Y-%m-%d %H:%M')})"
+            f"PHQ-9 점수: {phq9['score']}점 ({phq9['level']}, {updated_at.strftime('%Y-%m-%d %H:%M')})"
         )
     return "\n".join(context_parts) if context_parts else "이전 세션 정보 없음"
 
-def extract_and_save_phq9(db: Session, user_id: int, conversation_id: int, text: str):
-    import re
-    phq9_patterns = [
-        r'PHQ.*?(\d+)점',
-        r'점수.*?(\d+)',
-        r'(\d+)점',
-        r'총.*?(\d+)',
-    ]
-    for pattern in phq9_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        for match in matches:
-            score = int(match)
-            if 0 <= score <= 27:
-                if score <= 4:
-                    level = "정상"
-                elif score <= 9:
-                    level = "경미한 우울"
-                elif score <= 14:
-                    level = "중등도 우울"
-                elif score <= 19:
-                    level = "중증 우울"
-                else:
-                    level = "매우 심한 우울"
-                save_or_update_phq9_result(db, user_id, score, level)
-                return (score, level)
-    return (None, None)
-
 def load_phq9_markdown():
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    phq9_path = os.path.join(base_dir, "data", "PHQ-9.txt")
+    phq9_path = os.path.join(BASE_DIR, "data", "PHQ-9.txt")
     try:
         with open(phq9_path, encoding="utf-8") as f:
             return f.read()
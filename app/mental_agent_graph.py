@@ -1,23 +1,70 @@
-from langgraph.graph import StateGraph
+from functools import partial
+from typing import Optional, TypedDict
+from langgraph.graph import StateGraph, START
 from app.mental_agent_nodes import (
     node_load_history, node_load_user_context, node_embed_and_retrieve,
-    node_emotion_analysis, node_llm_generate, node_postprocess_and_save, node_output,
+    node_emotion_analysis, node_llm_generate, node_postprocess, node_output,
 )
+from app.mental_agent import EMOTION_MODE
+from app.metrics import instrument_node
 
-def build_mental_graph():
-    g = StateGraph(dict)
-    g.add_node("history", node_load_history)
-    g.add_node("user_context", node_load_user_context)
-    g.add_node("embed", node_embed_and_retrieve)
-    g.add_node("emotion", node_emotion_analysis)
-    g.add_node("llm", node_llm_generate)
-    g.add_node("save", node_postprocess_and_save)
-    g.add_node("output", node_output)
-    g.add_edge("history", "user_context")
-    g.add_edge("user_context", "embed")
-    g.add_edge("embed", "emotion")
-    g.add_edge("emotion", "llm")
-    g.add_edge("llm", "save")
-    g.add_edge("save", "output")
-    g.set_entry_point("history")
+class MentalState(TypedDict, total=False):
+    # 요청 입력
+    user_id: int
+    conversation_id: int
+    user_input: str
+    phq9_suggested: bool
+    # 병렬 단계: 각 키는 하나의 브랜치만 기록한다.
+    # (같은 superstep에서 두 브랜치가 같은 키를 쓰면 langgraph가 InvalidUpdateError를 낸다)
+    chat_history: str          # history
+    user_context: str          # user_context
+    phq9_previous: Optional[int]  # user_context (저장된 PHQ-9 점수, 없으면 None)
+    docs: list                 # embed
+    context: str               # embed
+    references: list           # embed
+    emotion: str               # emotion (fused 모드에서는 llm)
+    depressed: bool            # emotion (fused 모드에서는 llm)
+    # 합류 이후 단계
+    answer: str
+    llm_used: Optional[str]
+    llm_error: Optional[str]
+    fallback_used: bool
+    usage: dict                # 답변 생성 호출의 토큰 사용량 (usage_metadata + cached_tokens)
+    footer: str                # [참고자료] 블록
+    phq9_form: str             # [PHQ-9 설문] 블록 (제안하지 않으면 "")
+    phq9_score: Optional[int]  # 사용자 입력에서 찾은 PHQ-9 점수 (persist_turn이 저장)
+    phq9_level: Optional[str]
+    phq9_changed: bool         # 저장된 점수와 다를 때만 phq9_result를 갱신한다
+
+def build_mental_graph(emotion_mode=EMOTION_MODE):
+    fused = emotion_mode == "fused"
+    g = StateGraph(MentalState)
+
+    def add_node(name, fn):
+        # 노드별 실행 시간 기록 (METRICS_ENABLED=0이면 원래 함수 그대로)
+        g.add_node(name, instrument_node(name, fn))
+
+    add_node("history", node_load_history)
+    add_node("user_context", node_load_user_context)
+    add_node("embed", node_embed_and_retrieve)
+    add_node("llm", partial(node_llm_generate, fused_emotion=True) if fused else node_llm_generate)
+    add_node("postprocess", node_postprocess)
+    add_node("output", node_output)
+    # fan-out: 대화 기록, 사용자 컨텍스트(노드마다 자기 읽기 세션을 연다), 벡터 검색, 감정 분석
+    g.add_edge(START, "history")
+    g.add_edge(START, "user_context")
+    g.add_edge(START, "embed")
+    join = ["history", "user_context", "embed"]
+    if not fused:
+        add_node("emotion", node_emotion_analysis)
+        g.add_edge(START, "emotion")
+        join.append("emotion")
+    # fan-in: 모든 브랜치가 끝나야 llm 실행
+    g.add_edge(join, "llm")
+    g.add_edge("llm", "postprocess")
+    g.add_edge("postprocess", "output")
     return g
+
+def compile_mental_graph(emotion_mode=EMOTION_MODE):
+    # 그래프는 프로세스당 한 번만 컴파일하고, 요청별 데이터는 state/config로만 전달
+    return build_mental_graph(emotion_mode).compile()
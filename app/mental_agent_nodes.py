@@ -1,98 +1,127 @@
-from app.crud import create_message, get_conversation_history
+import asyncio
+from contextlib import asynccontextmanager
+from app.database import ReadSessionLocal, SessionLocal
+from app.llm_router import AllProvidersFailed
+from app.metrics import record_llm_turn
+from app.crud import get_phq9_snapshot
+from app.phq9 import extract_phq9_score
 from app.mental_agent import (
-    get_user_context_from_db, extract_and_save_phq9,
-    vectorstore, LLM_POOL, get_llm_choice, get_fallback_llm_name, answer_prompt,
-    analyze_emotion, is_depressed_emotion, load_phq9_markdown,
+    format_user_context,
+    retrieve_documents, retrieval_cache, get_llm_router, conversation_memory,
+    get_emotion_classifier, is_depressed_emotion, load_phq9_markdown,
+    build_answer_messages, cached_input_tokens, prompt_usage, split_emotion_header,
 )
 
-def node_load_history(state):
-    db = state["db"]
-    state["chat_history"] = get_conversation_history(db, state["conversation_id"])
-    return state
+# 각 노드는 자신이 기록하는 키만 반환한다 (병렬 브랜치 간 덮어쓰기 방지)
 
-def node_load_user_context(state):
-    db = state["db"]
-    state["user_context"] = get_user_context_from_db(db, state["user_id"])
-    return state
-
-def node_embed_and_retrieve(state):
-    docs = vectorstore.as_retriever().invoke(state["user_input"])
-    state["docs"] = docs
-    state["context"] = "\n\n".join([d.page_content for d in docs])
-    state["references"] = [
-        d.metadata.get("source") or d.metadata.get("title") or str(d.metadata) for d in docs
-    ]
-    return state
-
-def node_emotion_analysis(state):
-    state["emotion"] = analyze_emotion(state["user_input"])
-    state["depressed"] = is_depressed_emotion(state["emotion"])
-    return state
-
-def node_llm_generate(state):
-    llm_name = get_llm_choice()
-    enhanced_prompt = f"""
-당신은 친절하고 공감하는 멘탈 건강 상담사입니다.
-항상 같은 인사말(예: '안녕하세요')로 시작하지 말고,
-질문에 바로 상담 답변을 해주세요.
-
-아래 이전 대화 내용, 상담 기록, 참고 내용을 종합적으로 고려하여 사용자 질문에 대해 친절하고 이해하기 쉽게 답변해 주세요.
-특히 이전 대화에서 언급된 PHQ-9 점수, 감정 상태, 개인적 상황 등을 기억하고 연속성 있는 상담을 제공하세요.
-상담자가 우울함을 표시하고 있다면 공감을 표하고 PHQ-9 설문을 제안하세요. PHQ-9 설문 점수가 존재한다면 PHQ-9 점수에 따라 적절한 조치를 안내하세요.
-상담 기록 및 참고 내용에 실명이 들어가 있다면 무시해줘.
+@asynccontextmanager
+async def read_session(config, primary: bool = False):
+    # 조회 노드는 짧은 세션을 열고 바로 닫아 LLM 호출 동안 커넥션을 잡고 있지 않는다.
+    # 세션 팩토리(read_session, primary면 primary_session)는 실행(config)마다 전달되고,
+    # 호출자가 세션(db)을 넘기면 그대로 쓴다
+    configurable = config["configurable"]
+    db = configurable.get("db")
+    if db is not None:
+        # 넘겨받은 세션 하나를 병렬 브랜치(history, user_context)가 함께 쓰므로 한 번에 하나씩 쓴다
+        async with db.info.setdefault("graph_lock", asyncio.Lock()):
+            yield db
+        return
+    if primary:
+        factory = configurable.get("primary_session", SessionLocal)
+    else:
+        factory = configurable.get("read_session", ReadSessionLocal)
+    async with factory() as db:
+        yield db
 
-=== 사용자 세션 정보 ===
-{state.get('user_context','')}
+async def node_load_history(state, config):
+    async with read_session(config) as db:
+        return {"chat_history": await conversation_memory.load_history(db, state["conversation_id"])}
 
-=== 최근 대화 내용 ===
-{state.get('chat_history','')}
+async def node_load_user_context(state, config):
+    # PHQ-9 스냅샷은 entity_cache에 들어간다. 저장 직후 무효화된 키를 지연된 복제본의 이전 값으로
+    # 다시 채우지 않도록 primary에서 읽는다 (캐시 미스일 때만, 기본 키 조회 한 번)
+    async with read_session(config, primary=True) as db:
+        phq9 = await get_phq9_snapshot(db, state["user_id"])
+    return {"user_context": format_user_context(phq9), "phq9_previous": phq9.get("score")}
 
-=== 상담 기록 및 참고 내용 ===
-{state.get('context','')}
+async def node_embed_and_retrieve(state):
+    # 벡터 검색은 CPU/디스크 작업이므로 executor에서 실행된다 (VectorIndex.asearch)
+    docs = await retrieval_cache.aget_or_retrieve(state["user_input"], retrieve_documents)
+    return {
+        "docs": docs,
+        "context": "\n\n".join([d.page_content for d in docs]),
+        "references": [
+            d.metadata.get("source") or d.metadata.get("title") or str(d.metadata) for d in docs
+        ],
+    }
 
-=== 현재 질문 ===
-{state['user_input']}
+async def node_emotion_analysis(state):
+    result = await get_emotion_classifier().classify(state["user_input"])
+    return {"emotion": result.label, "depressed": is_depressed_emotion(result.label)}
 
-답변:
-"""
+async def node_llm_generate(state, config, fused_emotion=False):
+    # fused 모드에서는 감정 레이블도 이 호출에서 함께 받는다 (node_emotion_analysis 생략)
+    messages = build_answer_messages(state, fused_emotion)
+    response = None
+    # 스트리밍 중에는 두 모델의 토큰이 섞이지 않도록 hedge하지 않는다
+    streaming = config.get("configurable", {}).get("stream", False)
     try:
-        llm = LLM_POOL[llm_name]
-        response = llm.invoke(enhanced_prompt)
-        state["answer"] = response.content if hasattr(response, "content") else str(response)
-        state["llm_used"] = llm_name
-        state["llm_error"] = None
-        state["fallback_used"] = False
-    except Exception as e:
-        fallback_llm_name = get_fallback_llm_name(llm_name)
-        try:
-            llm = LLM_POOL[fallback_llm_name]
-            response = llm.invoke(enhanced_prompt)
-            state["answer"] = response.content if hasattr(response, "content") else str(response)
-            state["llm_used"] = fallback_llm_name
-            state["llm_error"] = str(e)
-            state["fallback_used"] = True
-        except Exception as e2:
-            state["answer"] = f"두 모델 모두 오류가 발생했습니다: {e2}"
-            state["llm_used"] = None
-            state["llm_error"] = f"{e} / {e2}"
-            state["fallback_used"] = True
-    return state
+        routed = await get_llm_router().ainvoke(messages, config, hedge=False if streaming else None)
+        response = routed.response
+        result = {
+            "answer": response.content if hasattr(response, "content") else str(response),
+            "llm_used": routed.provider,
+            "llm_error": " / ".join(routed.errors) or None,
+            "fallback_used": routed.provider != routed.primary,
+        }
+    except AllProvidersFailed as e:
+        result = {
+            "answer": f"두 모델 모두 오류가 발생했습니다: {e}",
+            "llm_used": None,
+            "llm_error": str(e),
+            "fallback_used": True,
+        }
+    usage = dict(getattr(response, "usage_metadata", None) or {})
+    if usage:
+        usage["cached_tokens"] = cached_input_tokens(usage)
+        prompt_usage.record(usage)
+    result["usage"] = usage
+    record_llm_turn(result["llm_used"], result["fallback_used"], usage)
+    if fused_emotion:
+        emotion, answer = split_emotion_header(result["answer"])
+        emotion = emotion or "중립"
+        result.update(answer=answer, emotion=emotion, depressed=is_depressed_emotion(emotion))
+    return result
 
-def node_postprocess_and_save(state):
-    db = state["db"]
+async def node_postprocess(state):
     refs = state.get("references", [])
     if refs:
-        state["answer"] += "\n\n[참고자료]\n" + "\n".join(f"- {r}" for r in refs)
+        footer = "\n\n[참고자료]\n" + "\n".join(f"- {r}" for r in refs)
     else:
-        state["answer"] += "\n\n[참고자료]\n- (관련 문서 없음)"
+        footer = "\n\n[참고자료]\n- (관련 문서 없음)"
+    answer = state["answer"] + footer
 
-    create_message(db, state["conversation_id"], "agent", "mental_agent", state["answer"])
-    extract_and_save_phq9(db, state["user_id"], state["conversation_id"], state["user_input"])
+    # DB 쓰기는 응답과 무관하므로 그래프 밖(persist_turn)에서 한다
+    phq9_score, phq9_level = extract_phq9_score(state["user_input"])
+    # 저장된 점수와 같아도 기록(phq9_history)에는 남기고, 최신 값(phq9_result)만 다시 쓰지 않는다
+    phq9_changed = phq9_score is not None and phq9_score != state.get("phq9_previous")
 
-    if state.get("depressed") and state.get("phq9_suggested") != True:
-        state["answer"] += "\n\n[PHQ-9 설문]\n" + load_phq9_markdown()
-        state["phq9_suggested"] = True
-    return state
+    phq9_suggested = state.get("phq9_suggested", False)
+    phq9_form = ""
+    if state.get("depressed") and phq9_suggested != True:
+        phq9_form = "\n\n[PHQ-9 설문]\n" + load_phq9_markdown()
+        answer += phq9_form
+        phq9_suggested = True
+    # 스트리밍 응답은 footer/phq9_form을 별도 이벤트로 내보낸다
+    return {
+        "answer": answer,
+        "footer": footer,
+        "phq9_form": phq9_form,
+        "phq9_suggested": phq9_suggested,
+        "phq9_score": phq9_score,
+        "phq9_level": phq9_level,
+        "phq9_changed": phq9_changed,
+    }
 
-def node_output(state):
+async def node_output(state):
     return {"answer": state["answer"]}
@@ -0,0 +1,290 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# METRICS_ENABLED=0이면 노드 래퍼, DB 리스너, HTTP 미들웨어를 아예 설치하지 않는다 (비용 0)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# OTEL_ENABLED=1이면 같은 지점에서 OpenTelemetry span도 만든다.
+# 트레이서 공급자/익스포터는 opentelemetry-instrument 또는 OTEL_* 환경 변수로 설정한다
+OTEL_ENABLED = METRICS_ENABLED and os.getenv("OTEL_ENABLED", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NULL = nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Prometheus 히스토그램. 레이블 값 튜플별로 버킷 개수/합계를 모은다."""
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [버킷별 개수..., +Inf 개수, 합계]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            pairs = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound is None else f"{bound:g}"
+                yield f"{self.name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(pairs)} {series[-1]:.6f}"
+            yield f"{self.name}_count{_format_labels(pairs)} {cumulative}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(list(zip(self.labelnames, labels)))} {value}"
+
+
+class Gauge:
+    """조회 시점에 collect()로 값을 읽는 게이지. collect는 {레이블 값 튜플: 값}을 돌려준다."""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collectors = []
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for collect in self.collectors:
+            for labels, value in sorted(collect().items()):
+                yield f"{self.name}{_format_labels(list(zip(self.labelnames, labels)))} {value}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        metric = Gauge(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 텍스트 형식 (text/plain; version=0.0.4)."""
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+metrics = MetricsRegistry()
+NODE_SECONDS = metrics.histogram("agent_node_duration_seconds", "그래프 노드 실행 시간", ("node",))
+DB_SECONDS = metrics.histogram("db_query_duration_seconds", "SQL 실행 시간", ("operation",))
+PROVIDER_SECONDS = metrics.histogram(
+    "provider_call_duration_seconds", "외부 공급자(LLM, 임베딩, 벡터 검색, OAuth) 호출 시간", ("provider", "outcome")
+)
+HTTP_SECONDS = metrics.histogram("http_request_duration_seconds", "HTTP 요청 처리 시간", ("method", "route", "status"))
+LLM_TURNS = metrics.counter("llm_turns_total", "답변 생성에 쓰인 LLM 공급자 (none: 모두 실패)", ("provider", "fallback"))
+LLM_TOKENS = metrics.counter("llm_tokens_total", "답변 생성 토큰 수", ("provider", "type"))
+DB_POOL_WAIT = metrics.histogram(
+    "db_pool_wait_seconds", "커넥션 풀에서 커넥션을 얻기까지 기다린 시간", ("pool",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0),
+)
+DB_POOL_HOLD = metrics.histogram(
+    "db_pool_hold_seconds", "체크아웃한 커넥션을 풀에 돌려줄 때까지 잡고 있던 시간", ("pool",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0),
+)
+DB_POOL_CHECKOUTS = metrics.counter("db_pool_checkouts_total", "커넥션 풀 체크아웃 수", ("pool",))
+DB_POOL_CONNECTIONS = metrics.gauge("db_pool_connections", "커넥션 풀 상태별 커넥션 수", ("pool", "state"))
+
+_tracer = None
+
+
+def span(name: str, **attributes):
+    """OTEL_ENABLED일 때만 span을 연다. 아니면 아무것도 하지 않는 컨텍스트."""
+    if not OTEL_ENABLED:
+        return _NULL
+    global _tracer
+    if _tracer is None:
+        from opentelemetry import trace  # 선택 의존성: OTEL_ENABLED=1일 때만 필요
+
+        _tracer = trace.get_tracer("mental-agent")
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def instrument_node(name: str, fn):
+    """그래프 노드 래퍼. 비활성이면 원래 함수를 그대로 돌려준다.
+
+    wraps로 원래 시그니처를 노출하므로 langgraph가 config 인자 여부를 그대로 판단한다.
+    """
+    if not METRICS_ENABLED:
+        return fn
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with span(f"node.{name}"):
+                return await fn(*args, **kwargs)
+        finally:
+            NODE_SECONDS.observe(time.perf_counter() - start, name)
+
+    return wrapper
+
+
+@contextmanager
+def _track_provider(provider: str):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with span(f"provider.{provider}"):
+            yield
+        outcome = "ok"
+    finally:
+        PROVIDER_SECONDS.observe(time.perf_counter() - start, provider, outcome)
+
+
+def track_provider(provider: str):
+    return _track_provider(provider) if METRICS_ENABLED else _NULL
+
+
+def observe_provider(provider: str, seconds: float, outcome: str = "ok"):
+    if METRICS_ENABLED:
+        PROVIDER_SECONDS.observe(seconds, provider, outcome)
+
+
+def record_llm_turn(provider, fallback: bool, usage: dict):
+    if not METRICS_ENABLED:
+        return
+    provider = provider or "none"
+    LLM_TURNS.inc(1, provider, "1" if fallback else "0")
+    for key, kind in (("input_tokens", "input"), ("output_tokens", "output"), ("cached_tokens", "cached")):
+        if usage.get(key):
+            LLM_TOKENS.inc(usage[key], provider, kind)
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is not None:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_SECONDS.observe(time.perf_counter() - started, operation)
+
+
+def instrument_db():
+    """모든 Engine의 SQL 실행 시간을 기록한다 (AsyncEngine도 내부 동기 Engine 이벤트를 쓴다)."""
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not event.contains(Engine, "before_cursor_execute", _query_started):
+        event.listen(Engine, "before_cursor_execute", _query_started)
+        event.listen(Engine, "after_cursor_execute", _query_finished)
+
+
+def observe_pool_wait(pool: str, seconds: float):
+    if METRICS_ENABLED:
+        DB_POOL_WAIT.observe(seconds, pool)
+
+
+def instrument_pool(name: str, pool):
+    """풀 체크아웃 수, 커넥션을 잡고 있던 시간, 상태별 커넥션 수를 기록한다.
+
+    대기 시간은 app.database.TimedQueuePool이 잰다.
+    """
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc(1, name)
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    def checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            DB_POOL_HOLD.observe(time.perf_counter() - started, name)
+
+    event.listen(pool, "checkout", checkout)
+    event.listen(pool, "checkin", checkin)
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CONNECTIONS.collectors.append(lambda: {
+            (name, "checked_out"): pool.checkedout(),
+            (name, "idle"): pool.checkedin(),
+            (name, "overflow"): max(0, pool.overflow()),
+        })
+
+
+class RequestMetricsMiddleware:
+    """ASGI 미들웨어: 라우트별 요청 시간. 스트리밍 응답은 본문이 끝날 때까지 잰다."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # 라우터가 같은 scope에 매칭된 route를 기록한다 (경로 파라미터가 레이블을 늘리지 않도록 템플릿 사용)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - start, scope["method"], route, str(status))
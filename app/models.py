@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    Column, Integer, String, Boolean, ForeignKey, DateTime, Text, DECIMAL, JSON
+    Column, Integer, String, Boolean, ForeignKey, Date, DateTime, Text, DECIMAL, JSON, Index
 )
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
@@ -39,7 +39,12 @@ class Message(Base):
     agent_type = Column(String(50))
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
+    request_key = Column(String(64), unique=True, nullable=True)  # 쓰기 큐 재시도 시 중복 INSERT 방지
     conversation = relationship("Conversation", back_populates="messages")
+    __table_args__ = (
+        # 대화별 최근 메시지 윈도우 조회용
+        Index("ix_message_conversation_message", "conversation_id", "message_id"),
+    )
     
 class Report(Base):
     __tablename__ = "report"
@@ -52,6 +57,13 @@ class Report(Base):
     file_url = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
 
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summary"
+    conversation_id = Column(Integer, ForeignKey("conversation.conversation_id"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    last_message_id = Column(Integer, nullable=False)  # 요약에 반영된 마지막 메시지
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 class PHQ9Result(Base):
     __tablename__ = "phq9_result"
     user_id = Column(Integer, ForeignKey("user.user_id"), primary_key=True)
@@ -59,3 +71,44 @@ class PHQ9Result(Base):
     level = Column(String(50))
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     user = relationship("User", back_populates="phq9_result", uselist=False)
+
+class PHQ9History(Base):
+    # 추가만 하는 PHQ-9 점수 기록 (phq9_result는 사용자별 최신 값만 가진다)
+    __tablename__ = "phq9_history"
+    phq9_history_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("user.user_id"), nullable=False)
+    conversation_id = Column(Integer, ForeignKey("conversation.conversation_id"))
+    score = Column(Integer, nullable=False)
+    level = Column(String(50))
+    created_at = Column(DateTime, default=datetime.now)
+    request_key = Column(String(64), unique=True, nullable=True)  # 쓰기 큐 재시도 시 중복 INSERT 방지
+    __table_args__ = (
+        # 사용자별 기록 페이지 조회/내보내기 (id 기준 keyset)
+        Index("ix_phq9_history_user_id", "user_id", "phq9_history_id"),
+    )
+
+class EmotionHistory(Base):
+    # 추가만 하는 턴별 감정 분석 기록
+    __tablename__ = "emotion_history"
+    emotion_history_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("user.user_id"), nullable=False)
+    conversation_id = Column(Integer, ForeignKey("conversation.conversation_id"))
+    emotion = Column(String(20), nullable=False)
+    depressed = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.now)
+    request_key = Column(String(64), unique=True, nullable=True)
+    __table_args__ = (
+        Index("ix_emotion_history_user_id", "user_id", "emotion_history_id"),
+    )
+
+class DailyStat(Base):
+    # 기록을 넣는 트랜잭션에서 함께 더하는 일별 집계.
+    # scope="user"면 scope_key는 user_id, "cohort"면 user.business_type
+    # metric: turns, depressed, emotion:<레이블>, phq9 (total은 점수 합)
+    __tablename__ = "daily_stat"
+    scope = Column(String(16), primary_key=True)
+    scope_key = Column(String(100), primary_key=True)
+    day = Column(Date, primary_key=True)
+    metric = Column(String(40), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
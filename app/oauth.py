@@ -0,0 +1,155 @@
+import asyncio
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from app.metrics import track_provider
+
+
+def _parse_google(userinfo: dict):
+    return str(userinfo["id"]), userinfo.get("email"), userinfo.get("name", "")
+
+def _parse_kakao(userinfo: dict):
+    kakao_account = userinfo.get("kakao_account", {})
+    return str(userinfo["id"]), kakao_account.get("email", None), kakao_account.get("profile", {}).get("nickname", "")
+
+def _parse_naver(userinfo: dict):
+    userinfo = userinfo["response"]
+    return str(userinfo["id"]), userinfo.get("email", None), userinfo.get("nickname", "")
+
+
+@dataclass(frozen=True)
+class OAuthProvider:
+    name: str
+    token_url: str
+    userinfo_url: str
+    env_prefix: str                        # GOOGLE -> GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI
+    parse_userinfo: Callable[[dict], Tuple[str, str, str]]
+    error_message: str
+    send_client_secret: bool = True
+    extra_params: Tuple[str, ...] = field(default_factory=tuple)  # 콜백에서 그대로 넘길 파라미터 (naver: state)
+
+    def token_request_data(self, code: str, extra: dict) -> dict:
+        data = {
+            "grant_type": "authorization_code",
+            "client_id": os.getenv(f"{self.env_prefix}_CLIENT_ID"),
+            "redirect_uri": os.getenv(f"{self.env_prefix}_REDIRECT_URI"),
+            "code": code,
+        }
+        if self.send_client_secret:
+            data["client_secret"] = os.getenv(f"{self.env_prefix}_CLIENT_SECRET")
+        for name in self.extra_params:
+            data[name] = extra[name]
+        return data
+
+
+PROVIDERS = {
+    "google": OAuthProvider(
+        name="google",
+        token_url="https://oauth2.googleapis.com/token",
+        userinfo_url="https://www.googleapis.com/oauth2/v2/userinfo",
+        env_prefix="GOOGLE",
+        parse_userinfo=_parse_google,
+        error_message="구글 토큰 요청 실패",
+    ),
+    "kakao": OAuthProvider(
+        name="kakao",
+        token_url="https://kauth.kakao.com/oauth/token",
+        userinfo_url="https://kapi.kakao.com/v2/user/me",
+        env_prefix="KAKAO",
+        parse_userinfo=_parse_kakao,
+        error_message="카카오 토큰 요청 실패",
+        send_client_secret=False,
+    ),
+    "naver": OAuthProvider(
+        name="naver",
+        token_url="https://nid.naver.com/oauth2.0/token",
+        userinfo_url="https://openapi.naver.com/v1/nid/me",
+        env_prefix="NAVER",
+        parse_userinfo=_parse_naver,
+        error_message="네이버 토큰 요청 실패",
+        extra_params=("state",),
+    ),
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class OAuthClient:
+    """소셜 로그인 공급자 호출용 공유 HTTP 클라이언트.
+
+    커넥션 풀/keep-alive를 공유하고(h2 패키지가 있으면 HTTP/2), connect/read 타임아웃과
+    지수 백오프 재시도를 적용한다. 인가 코드는 한 번만 쓸 수 있으므로 토큰 교환(POST)은
+    요청이 전송되지 않은 연결 오류일 때만 재시도한다.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    def __init__(
+        self,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.2,
+        max_connections: int = 100,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections // 2),
+            http2=_http2_available(),
+            transport=transport,
+        )
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        idempotent = method == "GET"
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                with track_provider(f"oauth:{httpx.URL(url).host}"):
+                    resp = await self.client.request(method, url, **kwargs)
+            except self.NOT_SENT_ERRORS:
+                if last:
+                    raise
+            except httpx.TransportError:
+                if last or not idempotent:
+                    raise
+            else:
+                if resp.status_code not in self.RETRY_STATUS or last or not idempotent:
+                    return resp
+            await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+
+    async def exchange_code(self, provider: OAuthProvider, code: str, **extra) -> str:
+        try:
+            resp = await self._request("POST", provider.token_url, data=provider.token_request_data(code, extra))
+        except httpx.HTTPError:
+            raise HTTPException(400, provider.error_message)
+        if not resp.is_success:
+            raise HTTPException(400, provider.error_message)
+        return resp.json()["access_token"]
+
+    async def fetch_userinfo(self, provider: OAuthProvider, token: str) -> dict:
+        resp = await self._request("GET", provider.userinfo_url, headers={"Authorization": f"Bearer {token}"})
+        return resp.json()
+
+    async def login(self, provider: OAuthProvider, code: str, **extra):
+        """인가 코드 -> (access_token, social_id, email, nickname)"""
+        token = await self.exchange_code(provider, code, **extra)
+        social_id, email, nickname = provider.parse_userinfo(await self.fetch_userinfo(provider, token))
+        return token, social_id, email, nickname
+
+    async def aclose(self):
+        await self.client.aclose()
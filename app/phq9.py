@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+from app.analytics import record_history
+from app.crud import upsert_phq9_results
+from app.models import Conversation, Message, PHQ9Result
+from app.session_cache import apply_invalidations, entity_cache
+
+# 이 값 이상인 후보만 점수로 본다. PHQ-9 언급 없이 "3점", "점수가 12점"만 있는 문장은 넘지 못한다
+PHQ9_MIN_CONFIDENCE = float(os.getenv("PHQ9_MIN_CONFIDENCE", "0.6"))
+# PHQ-9 언급과 숫자 사이의 최대 거리(글자 수)
+PHQ9_CONTEXT_CHARS = int(os.getenv("PHQ9_CONTEXT_CHARS", "40"))
+
+Phq9Match = namedtuple("Phq9Match", "score level confidence")
+
+_MENTION = r"phq\s*-?\s*9|피에이치큐|우울증?\s*(?:검사|설문|척도|자가\s*진단)|자가\s*진단|설문"
+# 모든 패턴을 하나로 합쳐 입력을 한 번만 훑는다. 앞의 대안이 먼저 잡히므로 "PHQ-9"의 9는 숫자 후보가 되지 않는다
+_TOKEN = re.compile(
+    rf"""
+      (?P<mention>{_MENTION})
+    | (?P<total>총\s*점|합\s*계|총합|점수|총)
+    | (?P<num>\d+(?:\.\d+)?)\s*
+      (?P<unit>점\s*(?:만점|중)|점|/\s*27|번\s*문항|번|문항|개월|개|회|시간|시|분|일|살|세|주|달|년|%|kg|키로|원|명|층)?
+      (?P<bound>\s*(?:이상|이하|미만|초과|넘으면|부터|에서))?
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+# 대부분의 메시지에는 숫자가 없고, 숫자가 있어도 PHQ-9 언급이 없으면 신뢰도가 0.5를 넘지 못하므로 먼저 이 둘만 본다
+_DIGIT = re.compile(r"\d")
+_HAS_MENTION = re.compile(_MENTION, re.IGNORECASE)
+_UNMENTIONED_MAX = 0.5
+_SCORE_UNITS = ("", "점", "/27")
+_ITEM_UNITS = ("번", "문항", "번문항")
+
+
+def phq9_level(score: int) -> str:
+    if score <= 4:
+        return "정상"
+    if score <= 9:
+        return "경미한 우울"
+    if score <= 14:
+        return "중등도 우울"
+    if score <= 19:
+        return "중증 우울"
+    return "매우 심한 우울"
+
+
+def extract(text: str, min_confidence: float = None):
+    """사용자 입력에서 PHQ-9 총점(0~27)을 찾는다. 없거나 확신이 낮으면 None.
+
+    숫자마다 PHQ-9 언급(PHQ-9, 우울증 검사, 자가진단, 설문)과의 거리, 단위("점", "/27"),
+    앞의 "총점/점수" 여부로 신뢰도를 매기고, 기준을 넘는 후보 중 마지막 것을 고른다 ("12점에서 7점으로"는 7).
+    "27점 만점", "3번 문항 2점"처럼 총점이 아닌 숫자, 다른 단위(번, 시간, 일 ...)가 붙은 숫자,
+    "10점 이상이면", "12점에서"처럼 기준이나 출발점을 말하는 숫자는 버린다.
+    """
+    if not text or not _DIGIT.search(text):
+        return None
+    min_confidence = PHQ9_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    if min_confidence > _UNMENTIONED_MAX and not _HAS_MENTION.search(text):
+        return None
+    mention_starts, candidates = [], []
+    last_mention = last_total = last_item = None
+    for m in _TOKEN.finditer(text):
+        kind = m.lastgroup
+        if kind == "mention":
+            mention_starts.append(m.start())
+            last_mention = m.end()
+            continue
+        if kind == "total":
+            last_total = m.end()
+            continue
+        unit = (m.group("unit") or "").replace(" ", "")
+        if unit in _ITEM_UNITS:
+            last_item = m.end()
+            continue
+        number = m.group("num")
+        if unit not in _SCORE_UNITS or not number.isdigit() or len(number) > 2 or int(number) > 27:
+            continue
+        if m.group("bound"):
+            continue  # 기준/범위 ("10점 이상이면", "25점 넘으면") 또는 바뀌기 전 점수 ("12점에서")
+        if last_item is not None and m.start() - last_item <= 3:
+            continue  # 문항별 점수 ("1번 2점")
+        before = m.start() - last_mention if last_mention is not None else None
+        near_total = last_total is not None and m.start() - last_total <= 6
+        candidates.append((int(number), unit, before, near_total, m.end()))
+    for score, unit, before, near_total, end in reversed(candidates):
+        if before is not None and before <= PHQ9_CONTEXT_CHARS:
+            confidence = 0.8
+        else:
+            i = bisect_left(mention_starts, end)
+            if i < len(mention_starts) and mention_starts[i] - end <= PHQ9_CONTEXT_CHARS // 2:
+                confidence = 0.6  # "12점 나왔어요, PHQ-9에서"
+            else:
+                confidence = 0.3 if near_total else 0.0
+        if unit or near_total:
+            confidence += 0.2
+        confidence = round(confidence, 2)
+        if confidence >= min_confidence:
+            return Phq9Match(score, phq9_level(score), confidence)
+    return None
+
+
+def extract_phq9_score(text: str):
+    """(점수, 단계). 없으면 (None, None). 저장은 호출자가 한다."""
+    match = extract(text)
+    return (match.score, match.level) if match else (None, None)
+
+
+async def scan_messages(session_factory, chunk: int = 2000, after: int = 0, min_confidence: float = None):
+    """사용자 메시지를 message_id 순으로 chunk개씩 읽어 점수가 있는 것만 묶음으로 낸다.
+
+    청크마다 짧은 세션을 쓰므로 긴 스캔 중에도 커넥션이나 스냅샷을 오래 잡지 않는다.
+    묶음: (이번 청크에서 읽은 메시지 수, [(message_id, user_id, conversation_id, created_at, Phq9Match)])
+    """
+    query = (
+        select(Message.message_id, Conversation.user_id, Message.conversation_id, Message.created_at, Message.content)
+        .join(Conversation, Conversation.conversation_id == Message.conversation_id)
+        .where(Message.sender_type == "user")
+    )
+    while True:
+        async with session_factory() as db:
+            rows = (await db.execute(query.where(Message.message_id > after).order_by(Message.message_id).limit(chunk))).all()
+        if not rows:
+            return
+        found = []
+        for message_id, user_id, conversation_id, created_at, content in rows:
+            match = extract(content, min_confidence)
+            if match is not None:
+                found.append((message_id, user_id, conversation_id, created_at, match))
+        yield len(rows), found
+        after = rows[-1][0]
+
+
+async def backfill(read_session, write_session, apply: bool = False, prune: bool = False,
+                   history_before=None, chunk: int = 2000, min_confidence: float = None) -> dict:
+    """과거 메시지로 사용자별 최신 PHQ-9 점수를 다시 계산해 phq9_result와 비교한다.
+
+    apply=False면 비교 결과만 돌려준다 (재검증). apply=True면 다른 점수만 고치고,
+    prune=True면 어떤 메시지로도 뒷받침되지 않는 점수(이전 추출기의 오탐)를 지운다.
+    history_before(datetime)를 주면 그 전 메시지의 점수를 phq9_history와 일별 집계에 넣는다
+    (기록 테이블이 생기기 전 기간 채우기. request_key가 backfill:<message_id>라서 다시 돌려도 중복되지 않는다).
+    """
+    start = time.perf_counter()
+    latest = {}  # user_id -> (created_at, Phq9Match)
+    scanned = found = history = 0
+    async for count, matches in scan_messages(read_session, chunk, min_confidence=min_confidence):
+        scanned += count
+        found += len(matches)
+        for _, user_id, _, created_at, match in matches:
+            latest[user_id] = (created_at, match)
+        rows = [
+            {
+                "request_key": f"backfill:{message_id}", "user_id": user_id, "conversation_id": conversation_id,
+                "score": match.score, "level": match.level, "created_at": created_at,
+            }
+            for message_id, user_id, conversation_id, created_at, match in matches
+            # created_at이 없는 메시지는 날짜를 알 수 없으므로 기록/일별 집계에서 뺀다 (최신 점수 계산에는 쓴다)
+            if history_before is not None and created_at is not None and created_at < history_before
+        ]
+        if rows and apply:
+            async with write_session() as db:
+                history += await record_history(db, [], rows)
+                await db.commit()
+
+    async with read_session() as db:
+        stored = dict((await db.execute(select(PHQ9Result.user_id, PHQ9Result.score))).all())
+    changed = {user_id: value for user_id, value in latest.items() if stored.get(user_id) != value[1].score}
+    unsupported = [user_id for user_id in stored if user_id not in latest]
+    if apply and changed:
+        updates = [
+            {"user_id": user_id, "score": match.score, "level": match.level, "updated_at": created_at or datetime.now()}
+            for user_id, (created_at, match) in changed.items()
+        ]
+        for i in range(0, len(updates), chunk):
+            async with write_session() as db:
+                # 이전 추출기가 더 늦은 메시지에서 잘못 찾은 점수도 고쳐야 하므로 시각 비교 없이 덮어쓴다
+                await upsert_phq9_results(db, updates[i:i + chunk], only_newer=False)
+                await db.commit()
+                await apply_invalidations(db)
+    if apply and prune and unsupported:
+        for i in range(0, len(unsupported), chunk):
+            async with write_session() as db:
+                await db.execute(delete(PHQ9Result).where(PHQ9Result.user_id.in_(unsupported[i:i + chunk])))
+                await db.commit()
+            for user_id in unsupported[i:i + chunk]:
+                await entity_cache.invalidate("phq9", str(user_id))
+    elapsed = time.perf_counter() - start
+    return {
+        "applied": apply,
+        "messages": scanned,
+        "matches": found,
+        "users_with_score": len(latest),
+        "unchanged": len(latest) - len(changed),
+        "changed": sum(1 for user_id in changed if user_id in stored),
+        "missing": sum(1 for user_id in changed if user_id not in stored),
+        "unsupported": len(unsupported),
+        "pruned": len(unsupported) if apply and prune else 0,
+        "history_rows": history,
+        "samples": [
+            {"user_id": user_id, "stored": stored.get(user_id), "extracted": match.score, "confidence": match.confidence}
+            for user_id, (_, match) in list(changed.items())[:20]
+        ],
+        "elapsed_s": round(elapsed, 2),
+        "messages_per_s": round(scanned / elapsed) if elapsed else None,
+    }
+
+
+if __name__ == "__main__":
+    # 기본은 재검증(읽기만). 고치려면 --apply
+    #   python -m app.phq9 --chunk 2000
+    #   python -m app.phq9 --apply --prune --history-before 2025-01-01
+    from app.database import ReadSessionLocal, SessionLocal
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--apply", action="store_true", help="다른 점수를 phq9_result에 반영한다")
+    parser.add_argument("--prune", action="store_true", help="메시지로 뒷받침되지 않는 점수를 지운다 (--apply와 함께)")
+    parser.add_argument("--history-before", type=datetime.fromisoformat, help="이 시각 전 메시지의 점수를 phq9_history에 채운다")
+    parser.add_argument("--chunk", type=int, default=2000)
+    parser.add_argument("--min-confidence", type=float, default=None)
+    args = parser.parse_args()
+    report = asyncio.run(backfill(
+        ReadSessionLocal, SessionLocal, apply=args.apply, prune=args.prune,
+        history_before=args.history_before, chunk=args.chunk, min_confidence=args.min_confidence,
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
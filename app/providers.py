@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class ProviderRegistry:
+    """외부 클라이언트(LLM, 임베딩, 벡터 저장소 등)를 이름으로 등록해 두고 처음 쓸 때 한 번만 만든다.
+
+    등록은 생성 함수만 기록하므로 import 시점에는 무거운 모듈 import, 네트워크/디스크 접근이 없다.
+    startup()으로 미리 만들 수 있고, override()로 벤치/테스트용 객체를 넣을 수 있다.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()  # 생성 함수가 다른 공급자를 get()할 수 있다
+        self.build_ms = {}
+
+    def register(self, name: str, factory):
+        self._factories[name] = factory
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = self._factories[name]()
+                self.build_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+                self._instances[name] = instance
+        return instance
+
+    def peek(self, name: str):
+        """이미 만들어진 객체만 돌려준다 (메트릭 조회가 클라이언트를 만들지 않도록)."""
+        return self._instances.get(name)
+
+    def override(self, name: str, instance):
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self, name: str = None):
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def startup(self, names=None):
+        """명시적 초기화 훅. 동기 함수이므로 이벤트 루프에서는 executor로 실행한다."""
+        for name in names or list(self._factories):
+            self.get(name)
+
+    def stats(self) -> dict:
+        return {
+            "built": sorted(self._instances),
+            "pending": sorted(set(self._factories) - set(self._instances)),
+            "build_ms": dict(self.build_ms),
+        }
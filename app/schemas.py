@@ -25,4 +25,6 @@ class SocialLoginRequest(BaseModel):
     social_id: str
     email: str = None
     nickname: str = ""
-    business_type: str = ""
\ No newline at end of file
+    business_type: str = ""
+class DeadJobReplay(BaseModel):
+    ids: Optional[list[int]] = None  # 없으면 dead_jobs 전부
@@ -0,0 +1,131 @@
+import json
+import os
+
+from app.cache import LRUTTLCache
+
+# 네임스페이스별 TTL(초). PHQ-9는 쓰기 시 무효화하지만 다른 워커의 로컬 캐시까지는
+# 지울 수 없으므로 짧게 둔다 (워커 간 즉시 일관성이 필요하면 redis 백엔드 사용)
+DEFAULT_TTLS = {
+    "conv": 600,     # (conversation_id, user_id) 소유 여부. 소유자는 바뀌지 않는다
+    "phq9": 60,      # 사용자별 최신 PHQ-9 스냅샷
+    "social": 600,   # (provider, social_id) -> user
+}
+
+
+class LocalBackend:
+    """프로세스 안 LRU+TTL 캐시. 워커마다 따로 가진다."""
+
+    name = "local"
+
+    def __init__(self, maxsize: int = 10000, ttls: dict = None):
+        ttls = ttls or DEFAULT_TTLS
+        self.caches = {namespace: LRUTTLCache(maxsize, ttl) for namespace, ttl in ttls.items()}
+
+    async def get(self, namespace: str, key: str):
+        return self.caches[namespace].get(key)
+
+    async def set(self, namespace: str, key: str, value):
+        self.caches[namespace].set(key, value)
+
+    async def delete(self, namespace: str, key: str):
+        self.caches[namespace].delete(key)
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    """여러 워커가 공유하는 redis 캐시. 값은 JSON으로 저장하고 TTL은 redis가 만료시킨다."""
+
+    name = "redis"
+
+    def __init__(self, url: str, ttls: dict = None, prefix: str = "penta:"):
+        import redis.asyncio as redis  # 선택 의존성: redis 백엔드를 쓸 때만 필요
+
+        self.client = redis.from_url(url)
+        self.ttls = ttls or DEFAULT_TTLS
+        self.prefix = prefix
+
+    async def get(self, namespace: str, key: str):
+        raw = await self.client.get(f"{self.prefix}{namespace}:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, namespace: str, key: str, value):
+        await self.client.set(f"{self.prefix}{namespace}:{key}", json.dumps(value), ex=self.ttls[namespace])
+
+    async def delete(self, namespace: str, key: str):
+        await self.client.delete(f"{self.prefix}{namespace}:{key}")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class EntityCache:
+    """작고 자주 읽는 행(대화 소유, PHQ-9, 소셜 사용자)을 캐시한다.
+
+    값은 ORM 객체가 아닌 JSON으로 표현 가능한 값만 넣는다 (세션 간 공유).
+    loader가 None을 돌려주면 캐시하지 않으므로, '없음'도 캐시하려면 빈 dict 등을 돌려준다.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.counters = {}
+
+    def _count(self, namespace: str, field: str):
+        counter = self.counters.setdefault(namespace, {"hits": 0, "misses": 0, "invalidations": 0})
+        counter[field] += 1
+
+    async def get_or_load(self, namespace: str, key: str, loader):
+        value = await self.backend.get(namespace, key)
+        if value is not None:
+            self._count(namespace, "hits")
+            return value
+        self._count(namespace, "misses")
+        value = await loader()
+        if value is not None:
+            await self.backend.set(namespace, key, value)
+        return value
+
+    async def set(self, namespace: str, key: str, value):
+        await self.backend.set(namespace, key, value)
+
+    async def invalidate(self, namespace: str, key: str):
+        self._count(namespace, "invalidations")
+        await self.backend.delete(namespace, key)
+
+    def stats(self) -> dict:
+        namespaces = {}
+        for namespace, counter in self.counters.items():
+            total = counter["hits"] + counter["misses"]
+            namespaces[namespace] = {**counter, "hit_ratio": round(counter["hits"] / total, 4) if total else 0.0}
+        return {"backend": self.backend.name, "namespaces": namespaces}
+
+
+# 세션(session.info)에 쌓아 두었다가 commit 이후에 지우는 무효화 목록.
+# commit 전에 지우면 동시 요청이 commit 이전 값을 다시 채워 넣을 수 있다
+PENDING_INVALIDATIONS = "entity_cache_invalidations"
+
+def defer_invalidation(db, namespace: str, key: str):
+    db.info.setdefault(PENDING_INVALIDATIONS, set()).add((namespace, key))
+
+async def apply_invalidations(db):
+    for namespace, key in db.info.pop(PENDING_INVALIDATIONS, ()):
+        await entity_cache.invalidate(namespace, key)
+
+
+def build_entity_cache(backend: str, redis_url: str = None, maxsize: int = 10000) -> EntityCache:
+    """backend: "local" | "redis" | "none"(항상 미스)"""
+    if backend == "local":
+        return EntityCache(LocalBackend(maxsize))
+    if backend == "none":
+        return EntityCache(LocalBackend(maxsize, ttls={namespace: -1 for namespace in DEFAULT_TTLS}))
+    if backend == "redis":
+        return EntityCache(RedisBackend(redis_url or "redis://localhost:6379/0"))
+    raise ValueError(f"알 수 없는 세션 캐시 백엔드: {backend}")
+
+
+entity_cache = build_entity_cache(
+    os.getenv("SESSION_CACHE_BACKEND", "local"),
+    redis_url=os.getenv("SESSION_CACHE_REDIS_URL"),
+    maxsize=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+)
@@ -0,0 +1,250 @@
+import asyncio
+import contextvars
+import hashlib
+import os
+from contextlib import asynccontextmanager
+
+from app.cache import LRUTTLCache, normalize_text
+
+
+class KeyedLock:
+    """키별 asyncio.Lock. 같은 키는 도착 순서대로 하나씩, 다른 키는 동시에 실행된다.
+
+    쓰는 요청이 없어진 키는 지워서 대화 수만큼 락이 쌓이지 않는다.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [Lock, 사용 중인 요청 수]
+
+    def locked(self, key) -> bool:
+        entry = self._locks.get(key)
+        return entry is not None and entry[0].locked()
+
+    async def acquire(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._drop(key, entry)
+            raise
+
+    def release(self, key):
+        # 잡은 태스크가 아닌 곳(백그라운드 태스크)에서 놓아도 된다
+        entry = self._locks[key]
+        entry[0].release()
+        self._drop(key, entry)
+
+    def _drop(self, key, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+    @asynccontextmanager
+    async def __call__(self, key):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class _Broadcast:
+    """스트림 이벤트를 모아 두고 여러 구독자에게 처음부터 다시 보내 준다."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event=None, done=False, error=None):
+        async with self._changed:
+            if event is not None:
+                self.events.append(event)
+            self.done = self.done or done
+            self.error = error or self.error
+            self._changed.notify_all()
+
+    async def subscribe(self):
+        i = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: i < len(self.events) or self.done)
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done and i == len(self.events):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+# 지금 실행 중인 턴이 응답 뒤에도 기다려야 하는 태스크 목록 (TurnGate.hold)
+_holds = contextvars.ContextVar("turn_holds", default=None)
+
+
+def turn_key(user_id: int, conversation_id: int, user_input: str, idempotency_key: str = None) -> str:
+    # Idempotency-Key가 없으면 같은 사용자/대화/정규화된 입력을 같은 요청으로 본다
+    if idempotency_key:
+        return f"{user_id}:{conversation_id}:idem:{idempotency_key}"
+    digest = hashlib.sha1(normalize_text(user_input).encode("utf-8")).hexdigest()
+    return f"{user_id}:{conversation_id}:{digest}"
+
+
+class TurnGate:
+    """대화 턴 실행 관문.
+
+    - 같은 대화의 턴은 도착 순서대로 하나씩 실행한다. 기록 읽기(load_history)와 저장 순서가 섞이지 않는다.
+    - 같은 키로 진행 중인 턴이 있으면 다시 실행하지 않고 그 결과를 함께 받는다 (재시도, 중복 전송).
+    - Idempotency-Key로 들어온 턴은 끝난 뒤에도 replay_ttl초 동안 같은 결과를 돌려준다.
+
+    실행은 별도 태스크에서 하므로 먼저 온 요청의 연결이 끊겨도 합류한 요청은 결과를 받는다.
+    대화 락은 fn(스트림이면 events)이 끝날 때 놓되, 그 안에서 hold()로 넘긴 작업이 있으면 응답은 바로 돌려주고
+    락만 백그라운드에서 그 작업이 끝날 때까지 잡는다. /chat과 /chat/stream은 queue 모드 저장이 반영될 때까지
+    (WRITE_QUEUE_VISIBLE_TIMEOUT까지) 잡으므로 다음 턴은 이전 턴이 들어간 기록을 읽는다.
+    """
+
+    def __init__(self, replay_ttl: float = 60, maxsize: int = 10000, enabled: bool = True):
+        self.enabled = enabled
+        self.locks = KeyedLock()
+        self._inflight = {}  # key -> (태스크, 스트림이면 _Broadcast)
+        self._replay = LRUTTLCache(maxsize, replay_ttl) if replay_ttl > 0 else None
+        self._holding = set()  # 응답 뒤 락을 잡고 있는 백그라운드 태스크
+        self.counters = {"executed": 0, "coalesced": 0, "replayed": 0, "queued": 0, "held": 0}
+
+    def _replayed(self, key, replayable):
+        if not replayable or self._replay is None:
+            return None
+        value = self._replay.get(key)
+        if value is not None:
+            self.counters["replayed"] += 1
+        return value
+
+    def _start(self, key, coro, broadcast=None):
+        task = asyncio.ensure_future(coro)
+        self._inflight[key] = (task, broadcast)
+
+        def finished(task):
+            self._inflight.pop(key, None)
+            if not task.cancelled():
+                task.exception()  # 기다리는 요청이 모두 끊겨도 경고가 남지 않도록 소비
+
+        task.add_done_callback(finished)
+        return task
+
+    @asynccontextmanager
+    async def _turn(self, conversation_id):
+        if self.locks.locked(conversation_id):
+            self.counters["queued"] += 1
+        await self.locks.acquire(conversation_id)
+        self.counters["executed"] += 1
+        holds = []
+        token = _holds.set(holds)
+        try:
+            yield
+        finally:
+            _holds.reset(token)
+            self._release(conversation_id, [task for task in holds if not task.done()])
+
+    def _release(self, conversation_id, holds):
+        if not holds:
+            self.locks.release(conversation_id)
+            return
+        self.counters["held"] += 1
+
+        async def release_after():
+            try:
+                await asyncio.gather(*holds, return_exceptions=True)
+            finally:
+                self.locks.release(conversation_id)
+
+        task = asyncio.ensure_future(release_after())
+        self._holding.add(task)
+        task.add_done_callback(self._holding.discard)
+
+    def hold(self, awaitable):
+        """실행 중인 턴이 끝난 뒤에도 awaitable이 끝날 때까지 대화 락을 잡는다. 턴은 기다리지 않는다.
+
+        관문 밖(비활성화 등)에서 부르면 기다릴 턴이 없으므로 실행하지 않는다.
+        """
+        holds = _holds.get()
+        if holds is None:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            return
+        # 바로 태스크로 띄워야 턴이 끝나기 전에 끝난 일(예: 이미 반영된 작업)도 놓치지 않는다
+        holds.append(asyncio.ensure_future(awaitable))
+
+    async def run(self, conversation_id: int, key: str, fn, replayable: bool = False):
+        """fn()을 대화별로 직렬화하고 같은 키의 동시 호출을 한 번으로 합친다."""
+        if not self.enabled:
+            return await fn()
+        cached = self._replayed(key, replayable)
+        if cached is not None:
+            return cached
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(inflight[0])
+
+        async def execute():
+            async with self._turn(conversation_id):
+                result = await fn()
+            if replayable and self._replay is not None:
+                self._replay.set(key, result)
+            return result
+
+        return await asyncio.shield(self._start(key, execute()))
+
+    async def stream(self, conversation_id: int, key: str, events, replayable: bool = False):
+        """events()가 만드는 스트림을 대화별로 직렬화하고, 같은 키의 요청은 같은 이벤트를 처음부터 받는다."""
+        if not self.enabled:
+            async for event in events():
+                yield event
+            return
+        broadcast = self._replayed(key, replayable)
+        if broadcast is None:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.counters["coalesced"] += 1
+                broadcast = inflight[1]
+            else:
+                broadcast = _Broadcast()
+
+                async def produce():
+                    try:
+                        async with self._turn(conversation_id):
+                            async for event in events():
+                                await broadcast.publish(event)
+                    except BaseException as e:
+                        await broadcast.publish(done=True, error=e)
+                        raise
+                    await broadcast.publish(done=True)
+                    if replayable and self._replay is not None:
+                        self._replay.set(key, broadcast)
+
+                self._start(key, produce(), broadcast)
+        async for event in broadcast.subscribe():
+            yield event
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            **self.counters,
+            "in_flight": len(self._inflight),
+            "active_conversations": len(self.locks),
+            "holding": len(self._holding),
+            "replay_entries": len(self._replay) if self._replay is not None else 0,
+        }
+
+
+turn_gate = TurnGate(
+    replay_ttl=float(os.getenv("CHAT_IDEMPOTENCY_TTL", "60")),
+    enabled=os.getenv("CHAT_TURN_GATE", "1") == "1",
+)
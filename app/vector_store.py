@@ -0,0 +1,371 @@
+import asyncio
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+COLLECTION_NAME = "global-documents"
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def default_index_path(backend: str) -> str:
+    return os.getenv("VECTOR_DB_PATH") or os.path.join(
+        BASE_DIR, "data", "vector_db" if backend == "chroma" else "vector_index"
+    )
+
+
+@dataclass(frozen=True)
+class RetrieverSettings:
+    k: int = 4
+    search_type: str = "similarity"        # similarity | mmr
+    fetch_k: int = 20                      # mmr 후보 수
+    lambda_mult: float = 0.5               # mmr 관련성/다양성 비중 (1이면 유사도만)
+    score_threshold: Optional[float] = None  # 코사인 유사도 하한
+    hnsw_ef: int = 64                      # HNSW 검색 폭 (faiss/hnswlib/chroma)
+
+    @classmethod
+    def from_env(cls):
+        threshold = os.getenv("RETRIEVER_SCORE_THRESHOLD")
+        return cls(
+            k=int(os.getenv("RETRIEVER_K", "4")),
+            search_type=os.getenv("RETRIEVER_SEARCH_TYPE", "similarity"),
+            fetch_k=int(os.getenv("RETRIEVER_FETCH_K", "20")),
+            lambda_mult=float(os.getenv("RETRIEVER_LAMBDA", "0.5")),
+            score_threshold=float(threshold) if threshold else None,
+            hnsw_ef=int(os.getenv("VECTOR_HNSW_EF", "64")),
+        )
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class VectorIndex:
+    """벡터 -> 문서 검색 인터페이스. 점수는 모두 코사인 유사도(클수록 가까움)."""
+
+    name = "base"
+
+    def __init__(self, settings: RetrieverSettings = None):
+        self.settings = settings or RetrieverSettings()
+
+    def _search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        raise NotImplementedError
+
+    def _vectors(self, positions: List[int]) -> np.ndarray:
+        raise NotImplementedError
+
+    def _document(self, position: int) -> Document:
+        raise NotImplementedError
+
+    def warmup(self):
+        """인덱스를 메모리에 올리고 검색 경로를 한 번 실행한다 (첫 요청의 콜드 스타트 제거)."""
+        raise NotImplementedError
+
+    def search(self, vector, settings: RetrieverSettings = None) -> List[Document]:
+        settings = settings or self.settings
+        query = _normalize(vector)
+        mmr = settings.search_type == "mmr"
+        hits = self._search(query, settings.fetch_k if mmr else settings.k)
+        if settings.score_threshold is not None:
+            hits = [hit for hit in hits if hit[1] >= settings.score_threshold]
+        if mmr and hits:
+            candidates = self._vectors([position for position, _ in hits])
+            chosen = maximal_marginal_relevance(query, candidates, lambda_mult=settings.lambda_mult, k=settings.k)
+            hits = [hits[i] for i in chosen]
+        return [self._document(position) for position, _ in hits[:settings.k]]
+
+    async def asearch(self, vector, settings: RetrieverSettings = None) -> List[Document]:
+        # 검색은 CPU/디스크 작업이므로 이벤트 루프 밖에서 실행한다
+        return await asyncio.get_running_loop().run_in_executor(None, self.search, vector, settings)
+
+
+class LocalIndex(VectorIndex):
+    """로컬 디렉터리 인덱스 공통부.
+
+    path/
+      vectors.npy   정규화된 float32 행렬. mmap으로 열어 워커 프로세스들이 OS 페이지 캐시를 공유한다
+      docs.jsonl    행 순서대로 {"id", "page_content", "metadata"}
+    """
+
+    def __init__(self, path: str, settings: RetrieverSettings = None):
+        super().__init__(settings)
+        self.path = path
+        self._matrix = None
+        self._docs = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    with open(os.path.join(self.path, "docs.jsonl"), encoding="utf-8") as f:
+                        self._docs = [json.loads(line) for line in f]
+                    self._load_index()
+                    self._matrix = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+
+    def _load_index(self):
+        pass
+
+    def _vectors(self, positions):
+        return np.asarray(self._matrix[positions])
+
+    def _document(self, position):
+        doc = self._docs[position]
+        return Document(page_content=doc["page_content"], metadata=doc.get("metadata") or {}, id=doc.get("id"))
+
+    def warmup(self):
+        self._load()
+        # mmap 페이지를 한 번 훑어 페이지 캐시에 올린다 (이미 올라와 있으면 다른 워커와 공유)
+        float(np.asarray(self._matrix, dtype=np.float32).sum())
+        if len(self._docs):
+            self._search(_normalize(self._matrix[0]), 1)
+
+    def __len__(self):
+        self._load()
+        return len(self._docs)
+
+
+class NumpyIndex(LocalIndex):
+    """전수 비교(brute force). 수만 건 이하의 작은 코퍼스에서 정확하고 충분히 빠르다."""
+
+    name = "numpy"
+
+    def _search(self, vector, k):
+        self._load()
+        scores = self._matrix @ vector
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class FaissIndex(LocalIndex):
+    """faiss HNSW(내적) 인덱스. index.faiss를 mmap으로 읽는다."""
+
+    name = "faiss"
+
+    def _load_index(self):
+        import faiss  # 선택 의존성: VECTOR_BACKEND=faiss일 때만 필요
+
+        self._index = faiss.read_index(os.path.join(self.path, "index.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        if hasattr(self._index, "hnsw"):
+            self._index.hnsw.efSearch = self.settings.hnsw_ef
+
+    def _search(self, vector, k):
+        self._load()
+        scores, ids = self._index.search(vector.reshape(1, -1), k)
+        return [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0]
+
+
+class HnswlibIndex(LocalIndex):
+    """hnswlib(cosine) 인덱스. 인덱스 그래프는 워커마다 메모리에 올라간다 (벡터 행렬은 mmap 공유)."""
+
+    name = "hnswlib"
+
+    def _load_index(self):
+        import hnswlib  # 선택 의존성: VECTOR_BACKEND=hnswlib일 때만 필요
+
+        with open(os.path.join(self.path, "docs.jsonl"), encoding="utf-8") as f:
+            count = sum(1 for _ in f)
+        dim = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r").shape[1]
+        self._index = hnswlib.Index(space="cosine", dim=dim)
+        self._index.load_index(os.path.join(self.path, "index.hnsw"), max_elements=count)
+        self._index.set_ef(self.settings.hnsw_ef)
+
+    def _search(self, vector, k):
+        self._load()
+        k = min(k, self._index.get_current_count())
+        if k <= 0:
+            return []
+        self._index.set_ef(max(self.settings.hnsw_ef, k))
+        labels, distances = self._index.knn_query(vector, k=k)
+        return [(int(i), 1.0 - float(d)) for i, d in zip(labels[0], distances[0])]
+
+
+# Chroma 거리 -> 코사인 유사도. 컬렉션마다 생성 당시의 거리 함수가 다르다 (지정하지 않았으면 l2)
+_CHROMA_RELEVANCE = {
+    "cosine": lambda d: 1.0 - d,
+    "ip": lambda d: 1.0 - d,                # 정규화된 벡터의 1 - 내적
+    "l2": lambda d: 1.0 - d / 2.0,          # 정규화된 벡터의 제곱 거리 = 2 - 2 * 코사인
+}
+
+
+class ChromaIndex(VectorIndex):
+    """기존 Chroma 컬렉션. 처음 사용할 때 연다."""
+
+    name = "chroma"
+
+    def __init__(self, path: str, embedding_function, settings: RetrieverSettings = None):
+        super().__init__(settings)
+        self.path = path
+        self.embedding_function = embedding_function
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    import chromadb
+                    from langchain_chroma import Chroma
+
+                    client = chromadb.PersistentClient(path=self.path)
+                    # 새로 만드는 컬렉션에만 적용된다 (기존 컬렉션의 거리/ef는 생성 당시 값)
+                    self.collection = client.get_or_create_collection(
+                        COLLECTION_NAME, metadata={"hnsw:space": "cosine", "hnsw:search_ef": self.settings.hnsw_ef}
+                    )
+                    config = self.collection.configuration
+                    space = (config.get("hnsw") or config.get("spann") or {}).get("space") or "l2"
+                    self.relevance = _CHROMA_RELEVANCE[space]
+                    self._store = Chroma(
+                        client=client, collection_name=COLLECTION_NAME, embedding_function=self.embedding_function
+                    )
+        return self._store
+
+    def search(self, vector, settings: RetrieverSettings = None):
+        settings = settings or self.settings
+        vector = np.asarray(vector, dtype=float).tolist()
+        if settings.search_type == "mmr":
+            return self.store.max_marginal_relevance_search_by_vector(
+                vector, k=settings.k, fetch_k=settings.fetch_k, lambda_mult=settings.lambda_mult
+            )
+        # 이름과 달리 점수는 컬렉션의 거리(작을수록 가까움)다
+        pairs = self.store.similarity_search_by_vector_with_relevance_scores(vector, k=settings.k)
+        return [
+            doc for doc, distance in pairs
+            if settings.score_threshold is None or self.relevance(distance) >= settings.score_threshold
+        ]
+
+    def warmup(self):
+        self.store
+        if self.collection.count():
+            sample = self.collection.peek(1)["embeddings"][0]
+            self.search(sample)
+
+
+def write_local_index(path: str, backend: str, ids: List[str], vectors, documents: List[Document],
+                      hnsw_m: int = 32, ef_construction: int = 200):
+    """로컬 인덱스 디렉터리를 새로 쓴다. 다른 워커가 읽는 중일 수 있으므로 임시 파일에 쓰고 교체한다."""
+    os.makedirs(path, exist_ok=True)
+    matrix = _normalize(vectors)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(ids), -1)
+
+    def replace(name, write):
+        tmp = os.path.join(path, f".{name}.tmp")
+        write(tmp)
+        os.replace(tmp, os.path.join(path, name))
+
+    if backend == "faiss":
+        import faiss
+
+        index = faiss.IndexHNSWFlat(matrix.shape[1], hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        index.add(matrix)
+        replace("index.faiss", lambda tmp: faiss.write_index(index, tmp))
+    elif backend == "hnswlib":
+        import hnswlib
+
+        index = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        index.init_index(max_elements=max(1, len(ids)), M=hnsw_m, ef_construction=ef_construction)
+        if len(ids):
+            index.add_items(matrix, np.arange(len(ids)))
+        replace("index.hnsw", lambda tmp: index.save_index(tmp))
+
+    def write_vectors(tmp):
+        with open(tmp, "wb") as f:
+            np.save(f, matrix)
+
+    def write_docs(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            for doc_id, doc in zip(ids, documents):
+                f.write(json.dumps({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+
+    replace("vectors.npy", write_vectors)
+    replace("docs.jsonl", write_docs)
+
+
+def write_chroma(path: str, batches, delete_ids: List[str] = (), hnsw_ef: int = 64):
+    """이미 계산한 임베딩을 Chroma 컬렉션에 바로 upsert하고 delete_ids를 지운다.
+
+    batches는 (ids, vectors, documents) 묶음의 iterable이다. 문서를 하나씩 add_texts로 넣으면
+    매번 임베딩 호출과 인덱스 갱신이 일어나므로 대량 적재는 이 경로를 쓴다.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection(
+        COLLECTION_NAME, metadata={"hnsw:space": "cosine", "hnsw:search_ef": hnsw_ef}
+    )
+    limit = client.get_max_batch_size()
+    written = 0
+    for ids, vectors, documents in batches:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for start in range(0, len(ids), limit):
+            end = start + limit
+            collection.upsert(
+                ids=list(ids[start:end]),
+                embeddings=vectors[start:end].tolist(),
+                documents=[d.page_content for d in documents[start:end]],
+                metadatas=[d.metadata or None for d in documents[start:end]],
+            )
+        written += len(ids)
+    delete_ids = list(delete_ids)
+    for start in range(0, len(delete_ids), limit):
+        collection.delete(ids=delete_ids[start:start + limit])
+    return written
+
+
+def build_vector_index(backend: str, path: str, embedding_function=None, settings: RetrieverSettings = None) -> VectorIndex:
+    """backend: "chroma" | "faiss" | "hnswlib" | "numpy". 인덱스는 첫 사용(또는 warmup) 때 연다."""
+    settings = settings or RetrieverSettings()
+    if backend == "chroma":
+        return ChromaIndex(path, embedding_function, settings)
+    if backend == "numpy":
+        return NumpyIndex(path, settings)
+    if backend == "faiss":
+        return FaissIndex(path, settings)
+    if backend == "hnswlib":
+        return HnswlibIndex(path, settings)
+    raise ValueError(f"알 수 없는 벡터 저장소 백엔드: {backend}")
+
+
+def export_chroma(path: str, batch_size: int = 1000):
+    """Chroma 컬렉션의 (ids, vectors, documents)를 모두 읽는다. 로컬 인덱스로 옮길 때 쓴다."""
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=path).get_collection(COLLECTION_NAME)
+    ids, vectors, documents = [], [], []
+    for offset in range(0, collection.count(), batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        ids.extend(batch["ids"])
+        vectors.extend(batch["embeddings"])
+        documents.extend(
+            Document(page_content=text or "", metadata=meta or {}) for text, meta in zip(batch["documents"], batch["metadatas"])
+        )
+    return ids, np.asarray(vectors, dtype=np.float32), documents
+
+
+if __name__ == "__main__":
+    # Chroma 컬렉션을 로컬 인덱스로 변환:
+    #   python -m app.vector_store --chroma-path data/vector_db --backend faiss --out data/vector_index
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chroma-path", required=True)
+    parser.add_argument("--backend", choices=["numpy", "faiss", "hnswlib"], default="numpy")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    ids, vectors, documents = export_chroma(args.chroma_path)
+    write_local_index(args.out, args.backend, ids, vectors, documents)
+    print(f"{len(ids)}개 문서를 {args.backend} 인덱스로 기록했습니다: {args.out}")
@@ -0,0 +1,430 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, DisconnectionError, TimeoutError as PoolTimeoutError
+
+from app.analytics import record_history
+from app.crud import insert_messages, upsert_phq9_results
+from app.database import SessionLocal
+from app.metrics import metrics
+from app.models import Message
+from app.session_cache import apply_invalidations
+
+# "queue": 턴의 쓰기를 로컬 큐에 넣고 워커가 여러 턴을 한 배치로 MySQL에 반영 (기본)
+# "sync": 요청 세션에서 바로 쓰고 commit
+PERSIST_MODE = os.getenv("PERSIST_MODE", "queue")
+# queue 모드에서 턴 관문은 응답을 돌려준 뒤에도 턴의 작업이 반영될 때까지 최대 이 시간(초) 대화 락을 잡는다.
+# 그래야 같은 대화의 다음 턴 load_history가 방금 턴을 읽는다. 넘기면 락을 놓고 작업은 나중에 반영된다 (0이면 잡지 않음)
+WRITE_QUEUE_VISIBLE_TIMEOUT = float(os.getenv("WRITE_QUEUE_VISIBLE_TIMEOUT", "5"))
+
+
+# DB에 닿지 못했거나 잠시 막힌 경우의 MySQL 오류 코드 (접속 실패, 끊김, 연결 초과, 락 대기/교착)
+_UNAVAILABLE_CODES = {1040, 1205, 1213, 2002, 2003, 2005, 2006, 2013}
+
+
+def db_unavailable(e: BaseException) -> bool:
+    """DB 장애로 보이는 실패면 True. 그 밖의 실패(제약 위반, 잘못된 값 등)는 작업 자체의 문제로 본다."""
+    if isinstance(e, DBAPIError):
+        code = e.orig.args[0] if e.orig is not None and e.orig.args else None
+        return e.connection_invalidated or code in _UNAVAILABLE_CODES
+    return isinstance(e, (OSError, asyncio.TimeoutError, PoolTimeoutError, DisconnectionError))
+
+
+def turn_jobs(state: dict, result: dict, started_at: datetime) -> list:
+    """한 턴의 쓰기 작업 목록. 사용자 메시지가 답변보다 먼저 들어가도록 순서를 지킨다."""
+    turn_id = uuid4().hex
+    jobs = [
+        ("message", {
+            "request_key": f"{turn_id}:user",
+            "conversation_id": state["conversation_id"],
+            "sender_type": "user",
+            "agent_type": "TBD(router)",
+            "content": state["user_input"],
+            "created_at": started_at.isoformat(),
+        }),
+        ("message", {
+            "request_key": f"{turn_id}:agent",
+            "conversation_id": state["conversation_id"],
+            "sender_type": "agent",
+            "agent_type": "mental_agent",
+            "content": result["answer"],
+            "created_at": datetime.now().isoformat(),
+        }),
+    ]
+    if result.get("emotion"):
+        jobs.append(("emotion", {
+            "request_key": f"{turn_id}:emotion",
+            "user_id": state["user_id"],
+            "conversation_id": state["conversation_id"],
+            "emotion": result["emotion"],
+            "depressed": bool(result.get("depressed")),
+            "created_at": started_at.isoformat(),
+        }))
+    if result.get("phq9_score") is not None:
+        jobs.append(("phq9", {
+            "request_key": f"{turn_id}:phq9",
+            "user_id": state["user_id"],
+            "conversation_id": state["conversation_id"],
+            "score": result["phq9_score"],
+            "level": result["phq9_level"],
+            "updated_at": datetime.now().isoformat(),
+            "changed": result.get("phq9_changed", True),
+        }))
+    return jobs
+
+
+async def apply_jobs(db, jobs: list):
+    """작업들을 종류별로 모아 한 번씩 반영한다. commit은 호출자가 한다."""
+    messages = [dict(p, created_at=datetime.fromisoformat(p["created_at"])) for kind, p in jobs if kind == "message"]
+    phq9 = [dict(p, updated_at=datetime.fromisoformat(p["updated_at"])) for kind, p in jobs if kind == "phq9"]
+    emotions = [dict(p, created_at=datetime.fromisoformat(p["created_at"])) for kind, p in jobs if kind == "emotion"]
+    if messages:
+        await insert_messages(db, messages)
+    # 저장된 점수와 같다고 표시된 작업(changed=False)은 기록만 남기고 최신 값은 건드리지 않는다
+    latest = [{key: p[key] for key in ("user_id", "score", "level", "updated_at")} for p in phq9 if p["changed"]]
+    if latest:
+        await upsert_phq9_results(db, latest)
+    # 추가 전용 기록과 일별 집계
+    history = [
+        {
+            "request_key": p["request_key"], "user_id": p["user_id"], "conversation_id": p["conversation_id"],
+            "score": p["score"], "level": p["level"], "created_at": p["updated_at"],
+        }
+        for p in phq9
+    ]
+    if emotions or history:
+        await record_history(db, emotions, history)
+
+
+class WriteQueue:
+    """응답 이후의 DB 쓰기를 받아 두는 SQLite 기반 내구성 큐.
+
+    enqueue는 로컬 파일에만 기록하고 작업 id를 돌려준다. 워커가 쌓인 작업을 batch_size씩
+    한 트랜잭션으로 MySQL에 반영한 뒤 큐에서 지운다. wait_applied(ids)로 반영될 때까지 기다릴 수 있다.
+    프로세스가 죽어도 남은 작업은 다음 시작 때 이어서 처리된다. 메시지는 request_key로, PHQ-9는 덮어쓰기라서
+    같은 작업이 두 번 반영되어도 결과가 같다.
+
+    여러 워커 프로세스가 같은 파일을 써도 된다. 작업은 넣은 프로세스(owner)만 꺼내고, 각 워커는
+    owners 테이블에 heartbeat를 남긴다. heartbeat가 lease초 넘게 끊긴(죽은) 워커나 정상 종료한 워커의
+    작업은 살아 있는 워커가 넘겨받는다. max_attempts번 실패한 작업은 dead_jobs로 옮기고
+    replay_dead()로 다시 넣을 수 있다.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        session_factory,
+        batch_size: int = 200,
+        linger: float = 0.05,
+        max_attempts: int = 20,
+        max_backoff: float = 30.0,
+        lease: float = 30.0,
+    ):
+        self.path = path
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+        self._last_heartbeat = 0.0
+        self._conn = None
+        self._wakeup = None
+        self._worker = None
+        self._stopping = False
+        self._waiters = {}  # 작업 id -> 반영되면 결과가 정해지는 Future
+        self.flush_ms = deque(maxlen=200)
+        self.counters = {"enqueued": 0, "flushed": 0, "batches": 0, "failures": 0, "dead": 0, "wait_timeouts": 0, "adopted": 0}
+        self.last_error = None
+
+    def _open(self):
+        if self._conn is None:
+            # 다른 워커가 쓰는 중이면 잠금이 풀릴 때까지 기다린다
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_at REAL NOT NULL DEFAULT 0, owner TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_owner ON jobs (owner, id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS dead_jobs (id INTEGER PRIMARY KEY, kind TEXT, payload TEXT, error TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+        return self._conn
+
+    def _heartbeat(self, force: bool = False):
+        """1초에 한 번 heartbeat를 남기고, 살아 있지 않은 워커의 작업을 넘겨받는다."""
+        now = time.time()
+        if not force and now - self._last_heartbeat < 1.0:
+            return
+        self._last_heartbeat = now
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("INSERT OR REPLACE INTO owners (owner, heartbeat) VALUES (?, ?)", (self.owner, now))
+            self._conn.execute("DELETE FROM owners WHERE heartbeat < ?", (now - self.lease,))
+            adopted = self._conn.execute(
+                "UPDATE jobs SET owner = ? WHERE owner NOT IN (SELECT owner FROM owners)", (self.owner,)
+            ).rowcount
+        if adopted:
+            self.counters["adopted"] += adopted
+
+    def enqueue(self, jobs: list) -> list:
+        conn = self._open()
+        with conn:
+            conn.execute("BEGIN")
+            ids = [
+                conn.execute(
+                    "INSERT INTO jobs (kind, payload, owner) VALUES (?, ?, ?)",
+                    (kind, json.dumps(payload, ensure_ascii=False), self.owner),
+                ).lastrowid
+                for kind, payload in jobs
+            ]
+        self.counters["enqueued"] += len(jobs)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return ids
+
+    async def wait_applied(self, ids: list, timeout: float) -> bool:
+        """작업들이 MySQL에 반영될 때까지 기다린다. 시간 안에 모두 반영되면 True.
+
+        워커가 돌고 있지 않으면(start 전) 기다리지 않는다. 기다리는 턴이 있으면 워커는 linger 없이 바로 반영한다.
+        """
+        if not ids or timeout <= 0 or self._worker is None:
+            return False
+        loop = asyncio.get_running_loop()
+        futures = [self._waiters.setdefault(job_id, loop.create_future()) for job_id in ids]
+        self._wakeup.set()
+        try:
+            return all(await asyncio.wait_for(asyncio.gather(*(asyncio.shield(f) for f in futures)), timeout))
+        except asyncio.TimeoutError:
+            self.counters["wait_timeouts"] += 1
+            return False
+        finally:
+            for job_id in ids:
+                future = self._waiters.get(job_id)
+                if future is not None and future.done():
+                    del self._waiters[job_id]
+
+    def _resolve(self, ids, applied: bool):
+        for job_id in ids:
+            future = self._waiters.pop(job_id, None)
+            if future is not None and not future.done():
+                future.set_result(applied)
+
+    def depth(self) -> int:
+        # 파일 전체(다른 워커 몫 포함)의 대기 작업 수
+        return self._open().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def dead_count(self) -> int:
+        return self._open().execute("SELECT COUNT(*) FROM dead_jobs").fetchone()[0]
+
+    def dead_jobs(self, limit: int = 50) -> list:
+        rows = self._open().execute("SELECT id, kind, payload, error FROM dead_jobs ORDER BY id LIMIT ?", (limit,))
+        return [{"id": job_id, "kind": kind, "payload": json.loads(payload), "error": error} for job_id, kind, payload, error in rows]
+
+    def replay_dead(self, ids: list = None) -> int:
+        """dead_jobs의 작업(ids가 없으면 전부)을 시도 횟수 0으로 다시 큐에 넣는다. 원래 순서대로 들어간다."""
+        conn = self._open()
+        where, params = "", ()
+        if ids:
+            where = f" WHERE id IN ({','.join('?' * len(ids))})"
+            params = tuple(ids)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            replayed = conn.execute(
+                f"INSERT INTO jobs (kind, payload, owner) SELECT kind, payload, ? FROM dead_jobs{where} ORDER BY id",
+                (self.owner, *params),
+            ).rowcount
+            conn.execute(f"DELETE FROM dead_jobs{where}", params)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return replayed
+
+    async def check_schema(self):
+        """message.request_key가 없으면(migrations/003 미적용) 모든 메시지 작업이 실패해 dead_jobs로 가므로 시작을 막는다.
+
+        DB에 접속하지 못하는 등 다른 오류는 경고만 남긴다 (작업은 큐에 쌓였다가 DB가 돌아오면 반영된다).
+        """
+        try:
+            async with self.session_factory() as db:
+                await db.execute(select(Message.request_key).limit(0))
+        except DBAPIError as e:
+            if "request_key" in str(e.orig):
+                raise RuntimeError(
+                    "message.request_key 컬럼이 없습니다. migrations/003_message_request_key.sql을 먼저 적용하세요."
+                ) from e
+            print(f"쓰기 큐 스키마 확인 실패 (계속 진행): {type(e).__name__}: {e}"[:300])
+
+    async def start(self):
+        await self.check_schema()
+        self._open()
+        self._heartbeat(force=True)
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()  # 이전 프로세스가 남긴 작업부터 처리
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        if self._worker is not None:
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._worker, timeout)
+            except asyncio.TimeoutError:
+                self._worker.cancel()  # 남은 작업은 파일에 있으므로 다음 시작 때 처리된다
+            self._worker = None
+        if self._conn is not None:
+            # 남은 작업은 다른 워커가 바로 넘겨받는다 (없으면 다음 시작 때 처리)
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass  # 재시도 대기 중인 작업이 있을 수 있으므로 주기적으로 확인
+            self._wakeup.clear()
+            if not self._stopping and not self._waiters:
+                await asyncio.sleep(self.linger)  # 짧게 기다려 여러 턴의 쓰기를 한 배치로 묶는다
+            while await self.flush():
+                pass
+            if self._stopping:
+                return
+
+    def _due(self, limit: int):
+        rows = self._conn.execute(
+            "SELECT id, kind, payload, attempts FROM jobs WHERE owner = ? AND next_at <= ? ORDER BY id LIMIT ?",
+            (self.owner, time.time(), limit),
+        ).fetchall()
+        return [(job_id, kind, json.loads(payload), attempts) for job_id, kind, payload, attempts in rows]
+
+    async def _apply(self, batch):
+        """배치를 한 트랜잭션으로 반영한다. 실패하면 그 예외를 돌려준다."""
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                await apply_jobs(db, [(kind, payload) for _, kind, payload, _ in batch])
+                await db.commit()
+                await apply_invalidations(db)
+        except Exception as e:
+            self.counters["failures"] += 1
+            self.last_error = f"{type(e).__name__}: {e}"[:300]
+            return e
+        self.flush_ms.append((time.perf_counter() - start) * 1000)
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id, *_ in batch])
+        self._resolve([job_id for job_id, *_ in batch], True)
+        self.counters["flushed"] += len(batch)
+        self.counters["batches"] += 1
+        return None
+
+    def _retry_later(self, job_id, kind, payload, attempts):
+        attempts += 1
+        if attempts >= self.max_attempts:
+            self._bury(job_id, kind, payload, f"{attempts}번 실패")
+            return
+        with self._conn:
+            self._conn.execute("BEGIN")
+            backoff = min(self.max_backoff, 0.5 * 2 ** attempts) * (1 + random.random() / 2)
+            self._conn.execute(
+                "UPDATE jobs SET attempts = ?, next_at = ? WHERE id = ?", (attempts, time.time() + backoff, job_id)
+            )
+
+    def _bury(self, job_id, kind, payload, reason: str):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO dead_jobs (id, kind, payload, error) VALUES (?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), self.last_error),
+            )
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self.counters["dead"] += 1
+        self._resolve([job_id], False)
+        print(f"쓰기 큐 작업 {job_id}({kind})가 {reason}해 dead_jobs로 옮겼습니다: {self.last_error}")
+
+    async def flush(self) -> int:
+        """반영 가능한 작업을 한 배치 처리하고 반영한 작업 수를 돌려준다."""
+        self._heartbeat()  # 밀린 작업을 오래 처리하는 동안에도 넘겨받히지 않도록
+        batch = self._due(self.batch_size)
+        if not batch:
+            return 0
+        error = await self._apply(batch)
+        if error is None:
+            return len(batch)
+        # 배치가 실패하면 하나씩 반영한다. DB 장애면 남은 작업을 모두 뒤로 미루고,
+        # 그 밖의 실패는 그 작업의 문제이므로 재시도 없이 dead_jobs로 보내고 다음 작업을 계속한다
+        flushed = 0
+        for i, job in enumerate(batch):
+            if len(batch) > 1 and not db_unavailable(error):
+                error = await self._apply([job])
+                if error is None:
+                    flushed += 1
+                    continue
+            if not db_unavailable(error):
+                self._bury(*job[:3], "반영에 실패")
+                continue
+            for rest in batch[i:]:
+                self._retry_later(*rest)
+            break
+        return flushed
+
+    def stats(self) -> dict:
+        flush_ms = sorted(self.flush_ms)
+
+        def pct(p):
+            return round(flush_ms[min(len(flush_ms) - 1, int(p / 100 * len(flush_ms)))], 2) if flush_ms else None
+
+        return {
+            "mode": PERSIST_MODE,
+            "owner": self.owner,
+            "depth": self.depth(),
+            "dead_jobs": self.dead_count(),
+            **self.counters,
+            "flush_p50_ms": pct(50),
+            "flush_p95_ms": pct(95),
+            "last_error": self.last_error,
+        }
+
+
+write_queue = WriteQueue(
+    os.getenv("WRITE_QUEUE_PATH", "write_queue.sqlite3"),
+    SessionLocal,
+    batch_size=int(os.getenv("WRITE_QUEUE_BATCH", "200")),
+    linger=float(os.getenv("WRITE_QUEUE_LINGER", "0.05")),
+    lease=float(os.getenv("WRITE_QUEUE_LEASE", "30")),
+)
+# dead_jobs가 0보다 크면 알림을 걸 수 있도록 /metrics에도 내보낸다
+QUEUE_JOBS = metrics.gauge("write_queue_jobs", "쓰기 큐 파일의 작업 수 (pending: 대기, dead: 재시도 포기)", ("state",))
+QUEUE_JOBS.collectors.append(lambda: {("pending",): write_queue.depth(), ("dead",): write_queue.dead_count()})
+
+
+async def persist_turn(db, state: dict, result: dict, started_at: datetime) -> list:
+    """턴의 메시지/PHQ-9 쓰기. 두 모델 모두 실패한 턴은 사용자 메시지까지 저장하지 않는다.
+
+    queue 모드는 큐에 넣고 바로 돌아오며 작업 id를 돌려준다 (반영은 write_queue.wait_applied로 기다릴 수 있다).
+    sync 모드와 저장할 것이 없는 턴은 빈 목록.
+    """
+    if result.get("llm_used") is None:
+        return []
+    jobs = turn_jobs(state, result, started_at)
+    if PERSIST_MODE == "queue":
+        return write_queue.enqueue(jobs)
+    await apply_jobs(db, jobs)
+    await db.commit()
+    await apply_invalidations(db)
+    return []
@@ -0,0 +1,159 @@
+"""분석 API: 쓰기 시점 일별 집계의 비용과 읽기 이득, 스트리밍 내보내기의 메모리.
+
+합성 데이터(--users명 x --turns턴, --days일에 걸쳐, 코호트 --cohorts개)를 시간순으로 쓰기 큐와 같은
+배치(--batch-size)로 apply_jobs에 넣는다.
+
+1. 쓰기: 메시지만 넣는 배치 vs 메시지 + 감정/PHQ-9 기록 + 집계를 넣는 배치의 처리 시간
+2. 읽기: 사용자/코호트의 기간 감정 분포를 집계 테이블에서 vs 기록 테이블을 GROUP BY로 스캔해서
+3. 내보내기: export_history(청크 스트리밍) vs 전체를 한 번에 읽어 CSV로 만들 때의 최대 메모리(tracemalloc)
+
+    python -m bench.bench_analytics --users 200 --turns 200 --days 90
+"""
+import argparse
+import asyncio
+import csv
+import io
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import func, select
+
+from bench.fakes import make_session_factory
+from app.analytics import EXPORT_COLUMNS, create_export_report, export_history, summarize
+from app.models import EmotionHistory, User
+from app.write_queue import apply_jobs
+
+EMOTIONS = ["우울", "불안", "분노", "중립", "기쁨", "슬픔"]
+
+
+def synthetic_jobs(users, conversations, turns, days, rng, with_history=True):
+    start = datetime.now() - timedelta(days=days)
+    for user_id, conversation_id in zip(users, conversations):
+        for turn in range(turns):
+            at = start + timedelta(seconds=rng.randrange(days * 86400))
+            key = uuid4().hex
+            yield ("message", {
+                "request_key": f"{key}:user", "conversation_id": conversation_id, "sender_type": "user",
+                "agent_type": "TBD(router)", "content": f"턴 {turn}", "created_at": at.isoformat(),
+            })
+            if not with_history:
+                continue
+            emotion = rng.choice(EMOTIONS)
+            yield ("emotion", {
+                "request_key": f"{key}:emotion", "user_id": user_id, "conversation_id": conversation_id,
+                "emotion": emotion, "depressed": emotion in ("우울", "슬픔"), "created_at": at.isoformat(),
+            })
+            if rng.random() < 0.05:
+                yield ("phq9", {
+                    "request_key": f"{key}:phq9", "user_id": user_id, "conversation_id": conversation_id,
+                    "score": rng.randint(0, 27), "level": "-", "updated_at": at.isoformat(),
+                })
+
+
+async def write(session_factory, jobs, batch_size):
+    # 실제 큐 배치처럼 시간순으로 넣는다 (한 배치의 턴은 대부분 같은 날)
+    jobs = sorted(jobs, key=lambda job: job[1].get("created_at") or job[1]["updated_at"])
+    start = time.perf_counter()
+    for i in range(0, len(jobs), batch_size):
+        async with session_factory() as db:
+            await apply_jobs(db, jobs[i:i + batch_size])
+            await db.commit()
+    return len(jobs), time.perf_counter() - start
+
+
+async def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = await fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--cohorts", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    session_factory, _, _ = await make_session_factory()
+    async with session_factory() as db:
+        users = [
+            User(email=f"a{uuid4().hex[:10]}@example.com", password="-", business_type=f"cohort-{i % args.cohorts}")
+            for i in range(args.users)
+        ]
+        db.add_all(users)
+        await db.commit()
+        from app.crud import create_conversation
+        user_ids = [user.user_id for user in users]
+        conversations = [(await create_conversation(db, user_id)).conversation_id for user_id in user_ids]
+
+    # 1. 쓰기 비용 (메시지 작업 수는 같다)
+    sample = max(1, args.users // 10)
+    n, elapsed = await write(session_factory, synthetic_jobs(user_ids[:sample], conversations[:sample], args.turns, args.days, rng, False), args.batch_size)
+    print(f"write messages only        {n:7d} jobs {elapsed:6.2f}s  {n / elapsed:8.0f} jobs/s  {elapsed / (sample * args.turns) * 1e6:6.1f}us/turn")
+    n, elapsed = await write(session_factory, synthetic_jobs(user_ids, conversations, args.turns, args.days, rng), args.batch_size)
+    turns = args.users * args.turns
+    print(f"write + history/aggregates {n:7d} jobs {elapsed:6.2f}s  {n / elapsed:8.0f} jobs/s  {elapsed / turns * 1e6:6.1f}us/turn")
+
+    # 2. 읽기: 기간 감정 분포
+    user_id, cohort = str(user_ids[0]), "cohort-0"
+
+    async def aggregate(scope, key):
+        async with session_factory() as db:
+            return await summarize(db, scope, key)
+
+    async def scan(where):
+        async with session_factory() as db:
+            rows = await db.execute(
+                select(EmotionHistory.emotion, func.count()).select_from(EmotionHistory)
+                .join(User, User.user_id == EmotionHistory.user_id).where(where).group_by(EmotionHistory.emotion)
+            )
+            return dict(rows.all())
+
+    for label, scope, key, where in (
+        ("user", "user", user_id, EmotionHistory.user_id == user_ids[0]),
+        ("cohort", "cohort", cohort, User.business_type == cohort),
+    ):
+        agg_ms, agg = await timed(lambda: aggregate(scope, key))
+        scan_ms, scanned = await timed(lambda: scan(where), repeat=5)
+        assert agg["emotions"] == scanned, (agg["emotions"], scanned)
+        print(f"read {label:<6} emotion distribution  aggregate={agg_ms:7.2f}ms  history scan={scan_ms:8.2f}ms  ({agg['turns']} turns)")
+
+    # 3. 내보내기: 한 사용자의 기록을 CSV로 (행 수를 늘리려고 코호트 0 전체 사용자를 차례로)
+    exported = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for uid in user_ids[::args.cohorts]:
+        async with session_factory() as db:
+            report = await create_export_report(db, uid, "emotion", "csv")
+        async for part in export_history(session_factory, session_factory, report.report_id, "emotion", uid, "csv", chunk=500):
+            exported += part.count("\n")
+    stream_s = time.perf_counter() - start
+    _, stream_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    columns = EXPORT_COLUMNS["emotion"]
+    start = time.perf_counter()
+    async with session_factory() as db:
+        rows = (await db.execute(
+            select(*(getattr(EmotionHistory, c) for c in columns)).where(EmotionHistory.user_id.in_(user_ids[::args.cohorts]))
+        )).all()
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    whole_s = time.perf_counter() - start
+    _, whole_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"export {len(rows)} rows: streaming {stream_peak / 2**20:6.2f}MB peak {exported / stream_s:8.0f} lines/s | "
+        f"load all {whole_peak / 2**20:6.2f}MB peak {len(rows) / whole_s:8.0f} rows/s"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""동시 /chat 턴 처리량: 스레드풀(동기 경로) vs 단일 이벤트 루프(비동기 경로).
+
+동기 경로는 FastAPI 기본 스레드풀(40)을 흉내 내어, 한 턴이 끝날 때까지 워커 스레드를 점유한다.
+
+    python -m bench.bench_async_load --requests 400 --llm-ms 300
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.pool import NullPool
+
+from bench.fakes import Latency, create_message, install_fakes, make_session_factory, percentile
+from app.mental_agent_graph import compile_mental_graph
+
+
+async def chat_turn(runnable, session_factory, user_id, conversation_id, i):
+    start = time.perf_counter()
+    async with session_factory() as db:
+        await create_message(db, conversation_id, "user", "TBD(router)", f"요즘 불안해요 {i}")
+        state = {
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "user_input": f"요즘 불안해요 {i}",
+            "phq9_suggested": False,
+        }
+        await runnable.ainvoke(state, config={"configurable": {"db": db}})
+    return (time.perf_counter() - start) * 1000
+
+
+def report(label, latencies, elapsed):
+    print(
+        f"{label:<22} requests={len(latencies)} throughput={len(latencies) / elapsed:7.1f} req/s "
+        f"p50={percentile(latencies, 50):7.1f}ms p95={percentile(latencies, 95):7.1f}ms "
+        f"p99={percentile(latencies, 99):7.1f}ms"
+    )
+
+
+def run_threadpool(runnable, session_factory, user_id, conversation_id, n, workers):
+    def job(i):
+        return asyncio.run(chat_turn(runnable, session_factory, user_id, conversation_id, i))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(job, range(n)))
+    report(f"sync (threads={workers})", latencies, time.perf_counter() - start)
+
+
+async def run_async(runnable, session_factory, user_id, conversation_id, n):
+    start = time.perf_counter()
+    latencies = await asyncio.gather(
+        *(chat_turn(runnable, session_factory, user_id, conversation_id, i) for i in range(n))
+    )
+    report("async (event loop)", latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--llm-ms", type=float, default=300)
+    parser.add_argument("--emotion-ms", type=float, default=300)
+    parser.add_argument("--retrieval-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    install_fakes(
+        llm_latency=Latency(args.llm_ms / 1000, 0.2, seed=1),
+        emotion_latency=Latency(args.emotion_ms / 1000, 0.2, seed=2),
+        retrieval_latency=Latency(args.retrieval_ms / 1000, 0.2, seed=3),
+    )
+    runnable = compile_mental_graph()
+
+    # 스레드마다 이벤트 루프가 다르므로 동기 경로는 커넥션을 풀링하지 않는다
+    session_factory, user_id, conversation_id = asyncio.run(make_session_factory(poolclass=NullPool))
+    run_threadpool(runnable, session_factory, user_id, conversation_id, args.requests, args.threads)
+
+    async def async_path():
+        # 세션이 그래프 실행 내내 커넥션을 잡고 있으므로 풀은 동시 요청 수만큼 둔다
+        session_factory, user_id, conversation_id = await make_session_factory(pool_size=args.requests)
+        await run_async(runnable, session_factory, user_id, conversation_id, args.requests)
+
+    asyncio.run(async_path())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""커넥션 풀 점유: 턴 전체 동안 세션을 잡는 방식(held) vs 조회 노드마다 짧은 세션(scoped).
+
+held는 이전 /chat 경로처럼 요청 세션 하나를 그래프에 넘겨 LLM 호출 동안에도 커넥션을 잡는다.
+scoped는 조회 노드가 read_session 팩토리로 세션을 열고 바로 닫는다. 작은 풀(--pool-size,
+오버플로 없음)에 동시 턴을 몰아 처리량, 턴 지연, 풀 대기 시간(db_pool_wait_seconds)을 비교한다.
+
+    python -m bench.bench_db_pool --turns 200 --concurrency 40 --pool-size 5 --llm-ms 300
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bench.fakes import Latency, install_fakes, make_session_factory, percentile
+from app.database import build_engine
+from app.mental_agent_graph import compile_mental_graph
+from app.metrics import DB_POOL_CHECKOUTS, DB_POOL_WAIT
+
+
+def pool_wait(name):
+    """(평균 대기 ms, 대기 합계 s, 체크아웃 수)"""
+    series = DB_POOL_WAIT._series.get((name,))
+    checkouts = DB_POOL_CHECKOUTS._values.get((name,), 0)
+    if not series:
+        return 0.0, 0.0, checkouts
+    count = sum(series[:-1])
+    return series[-1] / count * 1000 if count else 0.0, series[-1], checkouts
+
+
+async def run(mode, runnable, path, user_id, conversation_id, args):
+    engine = build_engine(
+        f"sqlite+aiosqlite:///{path}", mode,
+        pool_size=args.pool_size, max_overflow=0, pool_timeout=120, connect_args={"timeout": 60},
+    )
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def turn(i):
+        state = {"user_id": user_id, "conversation_id": conversation_id, "user_input": f"잠이 안 와요 {i}"}
+        async with sem:
+            start = time.perf_counter()
+            if mode == "held":
+                async with session_factory() as db:
+                    await runnable.ainvoke(state, config={"configurable": {"db": db}})
+            else:
+                await runnable.ainvoke(state, config={"configurable": {"read_session": session_factory, "primary_session": session_factory}})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(turn(i) for i in range(args.turns)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    mean_wait_ms, total_wait_s, checkouts = pool_wait(mode)
+    print(
+        f"{mode:<7} pool={args.pool_size} conc={args.concurrency} {args.turns / elapsed:6.1f} turns/s  "
+        f"p50={percentile(latencies, 50):7.1f}ms p95={percentile(latencies, 95):7.1f}ms  "
+        f"checkouts={checkouts} pool_wait mean={mean_wait_ms:7.1f}ms total={total_wait_s:6.1f}s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--llm-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    install_fakes(llm_latency=Latency(args.llm_ms / 1000, 0.2), retrieval_latency=Latency(0.02, 0.2))
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-pool-"), "bench.db")
+    _, user_id, conversation_id = await make_session_factory(path)
+    runnable = compile_mental_graph()
+    for mode in ("held", "scoped"):
+        await run(mode, runnable, path, user_id, conversation_id, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
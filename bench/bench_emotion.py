@@ -0,0 +1,106 @@
+"""감정 분류 백엔드 오프라인 평가: 레이블 일치율과 지연 시간.
+
+기준 레이블은 기본적으로 데이터셋의 정답(label)이고, --with-llm을 주면 현재
+analyze_emotion(gpt-4o-mini) 결과를 기준으로 삼는다 (OPENAI_API_KEY 필요).
+
+    python -m bench.bench_emotion --fake-embeddings
+    python -m bench.bench_emotion --dataset data/emotion_eval.jsonl --with-llm
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.emotion import (
+    EmbeddingEmotionClassifier, FallbackEmotionClassifier, LexiconEmotionClassifier, LLMEmotionClassifier,
+)
+
+SAMPLES = [
+    ("요즘 아무것도 하기 싫고 너무 무기력해요", "우울"),
+    ("매일 우울해서 출근하기가 힘들어요", "우울"),
+    ("살기 싫다는 생각이 자주 들어요", "우울"),
+    ("그냥 모든 게 의미가 없는 것 같아요", "우울"),
+    ("친구가 이사 가서 너무 슬퍼요", "슬픔"),
+    ("할머니 생각에 눈물이 나요", "슬픔"),
+    ("혼자 있으니까 외로워요", "슬픔"),
+    ("시험 때문에 불안해서 잠이 안 와요", "불안"),
+    ("발표가 걱정돼서 가슴이 두근거려요", "불안"),
+    ("공황이 올까 봐 무서워요", "불안"),
+    ("팀장님 때문에 너무 화가 나요", "분노"),
+    ("짜증나서 아무 말도 하기 싫어요", "분노"),
+    ("억울해서 참을 수가 없어요", "분노"),
+    ("오늘 합격 소식을 들어서 정말 행복해요", "행복"),
+    ("여행 갈 생각에 너무 신나요", "행복"),
+    ("상담 받고 나서 많이 나아졌어요", "긍정"),
+    ("조금씩 희망이 생기는 것 같아요", "긍정"),
+    ("도와주셔서 감사해요", "긍정"),
+    ("오늘은 그냥 평범했어요", "중립"),
+    ("별일 없이 지냈어요", "중립"),
+    ("PHQ-9 검사는 어떻게 하나요?", "기타"),
+    ("상담 예약은 어디서 하나요?", "기타"),
+]
+
+
+def load_dataset(path):
+    if not path:
+        return SAMPLES
+    with open(path, encoding="utf-8") as f:
+        return [(row["text"], row["label"]) for row in map(json.loads, f) if row.get("text")]
+
+
+async def evaluate(name, classifier, texts, reference):
+    start = time.perf_counter()
+    single = [await classifier.classify(t) for t in texts]
+    single_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    start = time.perf_counter()
+    batch = await classifier.classify_batch(texts)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    agree = sum(r.label == ref for r, ref in zip(single, reference)) / len(texts)
+    low = sum(r.confidence < 0.5 for r in batch)
+    print(
+        f"{name:<18} agreement={agree:6.1%} per_item={single_ms:8.2f}ms "
+        f"batch({len(texts)})={batch_ms:8.2f}ms low_confidence={low}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", help="{text, label} JSONL")
+    parser.add_argument("--with-llm", action="store_true", help="analyze_emotion 결과를 기준으로 비교")
+    parser.add_argument("--fake-embeddings", action="store_true", help="네트워크 없이 결정적 가짜 임베딩 사용")
+    args = parser.parse_args()
+
+    rows = load_dataset(args.dataset)
+    texts = [t for t, _ in rows]
+    reference = [label for _, label in rows]
+
+    if args.fake_embeddings:
+        from bench.fakes import FakeEmbeddings
+        embedder = FakeEmbeddings()
+    else:
+        from app.mental_agent import get_embedding
+        embedder = get_embedding()
+
+    classifiers = {
+        "lexicon": LexiconEmotionClassifier(),
+        "embedding": EmbeddingEmotionClassifier(embedder),
+    }
+    if args.with_llm:
+        from app.mental_agent import analyze_emotion
+        llm = LLMEmotionClassifier(analyze_emotion)
+        start = time.perf_counter()
+        reference = [r.label for r in await llm.classify_batch(texts)]
+        print(f"reference=analyze_emotion ({(time.perf_counter() - start) * 1000 / len(texts):.1f}ms/item)")
+        classifiers["lexicon+llm"] = FallbackEmotionClassifier(LexiconEmotionClassifier(), llm)
+        classifiers["embedding+llm"] = FallbackEmotionClassifier(EmbeddingEmotionClassifier(embedder), llm)
+    else:
+        print("reference=dataset labels")
+
+    for name, classifier in classifiers.items():
+        await evaluate(name, classifier, texts, reference)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""감정 분석 별도 호출(separate) vs 답변 생성 호출에 합친 경우(fused)의 지연/토큰 비교.
+
+    python -m bench.bench_emotion_mode --turns 30 --llm-ms 1500 --emotion-ms 600
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from bench.fakes import Latency, install_fakes, make_session_factory, percentile
+from app.mental_agent_graph import compile_mental_graph
+from app.write_queue import apply_jobs, turn_jobs
+
+
+async def run_mode(mode, args):
+    fakes = install_fakes(
+        llm_latency=Latency(args.llm_ms / 1000, 0.2, seed=1),
+        emotion_latency=Latency(args.emotion_ms / 1000, 0.2, seed=2),
+        retrieval_latency=Latency(args.retrieval_ms / 1000, 0.2, seed=3),
+    )
+    session_factory, user_id, conversation_id = await make_session_factory()
+    runnable = compile_mental_graph(mode)
+    latencies, emotions = [], []
+    async with session_factory() as db:
+        for i in range(args.turns):
+            text = f"요즘 너무 우울하고 잠이 안 와요 ({i})"
+            state = {"user_id": user_id, "conversation_id": conversation_id, "user_input": text, "phq9_suggested": True}
+            started_at = datetime.now()
+            start = time.perf_counter()
+            result = await runnable.ainvoke(state, config={"configurable": {"db": db}})
+            latencies.append((time.perf_counter() - start) * 1000)
+            emotions.append(result.get("emotion"))
+            await apply_jobs(db, turn_jobs(state, result, started_at))
+            await db.commit()
+
+    calls = sum(f.calls for f in fakes.values())
+    input_tokens = sum(f.input_tokens for f in fakes.values())
+    output_tokens = sum(f.output_tokens for f in fakes.values())
+    print(
+        f"{mode:<9} mean={statistics.mean(latencies):8.1f}ms p95={percentile(latencies, 95):8.1f}ms "
+        f"llm_calls/turn={calls / args.turns:4.1f} in_tokens/turn={input_tokens / args.turns:7.1f} "
+        f"out_tokens/turn={output_tokens / args.turns:6.1f} emotion={emotions[-1]}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--llm-ms", type=float, default=1500)
+    parser.add_argument("--emotion-ms", type=float, default=600)
+    parser.add_argument("--retrieval-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    for mode in ("separate", "fused"):
+        await run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
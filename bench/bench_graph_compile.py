@@ -0,0 +1,56 @@
+"""요청마다 그래프를 컴파일하는 경우와 한 번만 컴파일해 재사용하는 경우의 비교.
+
+    python -m bench.bench_graph_compile --requests 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+from bench.fakes import install_fakes, make_session_factory, percentile
+from app.mental_agent_graph import build_mental_graph, compile_mental_graph
+
+
+async def run(label, get_runnable, session_factory, user_id, conversation_id, n):
+    latencies = []
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    async with session_factory() as db:
+        for i in range(n):
+            start = time.perf_counter()
+            runnable = get_runnable()
+            state = {
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "user_input": f"잠이 안 와요 {i}",
+                "phq9_suggested": False,
+            }
+            await runnable.ainvoke(state, config={"configurable": {"db": db}})
+            latencies.append((time.perf_counter() - start) * 1000)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<18} mean={statistics.mean(latencies):7.2f}ms "
+        f"p50={percentile(latencies, 50):7.2f}ms p95={percentile(latencies, 95):7.2f}ms "
+        f"peak_alloc={(peak - before) / 1024:8.1f}KiB retained={(after - before) / 1024:8.1f}KiB"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    install_fakes()
+    session_factory, user_id, conversation_id = await make_session_factory()
+
+    await run("compile-per-call", lambda: build_mental_graph().compile(),
+              session_factory, user_id, conversation_id, args.requests)
+    compiled = compile_mental_graph()
+    await run("compiled-once", lambda: compiled, session_factory, user_id, conversation_id, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""대화 길이에 따른 get_conversation_history 턴당 비용.
+
+전체 메시지를 ORM으로 읽어 파이썬에서 자르던 방식과 SQL LIMIT 윈도우를 비교한다.
+
+    python -m bench.bench_history_window --sizes 100 1000 10000 20000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from bench.fakes import get_conversation_history, make_session_factory
+from app.models import Conversation, Message
+
+
+async def full_scan_history(db, conversation_id, limit=6):
+    # 이전 구현: 전체 메시지를 ORM 객체로 로드한 뒤 마지막 limit개만 사용
+    result = await db.execute(
+        select(Message).where(Message.conversation_id == conversation_id).order_by(Message.message_id)
+    )
+    messages = result.scalars().all()
+    return "\n".join(
+        f"{'Human' if m.sender_type == 'user' else 'AI'}: {m.content}" for m in messages[-limit:]
+    )
+
+
+async def seed_conversation(db, user_id, size):
+    conv = Conversation(user_id=user_id, started_at=datetime.now())
+    db.add(conv)
+    await db.commit()
+    now = datetime.now()
+    batch = 5000
+    for start in range(0, size, batch):
+        await db.execute(insert(Message), [
+            {
+                "conversation_id": conv.conversation_id,
+                "sender_type": "user" if i % 2 == 0 else "agent",
+                "agent_type": "mental_agent",
+                "content": f"메시지 {i} " + "내용 " * 40,
+                "created_at": now,
+            }
+            for i in range(start, min(size, start + batch))
+        ])
+    await db.commit()
+    return conv.conversation_id
+
+
+async def measure(fn, db, conversation_id, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn(db, conversation_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 20000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    session_factory, user_id, _ = await make_session_factory()
+    async with session_factory() as db:
+        print(f"{'messages':>9} {'full_scan':>11} {'sql_window':>11}")
+        for size in args.sizes:
+            conversation_id = await seed_conversation(db, user_id, size)
+            old = await measure(full_scan_history, db, conversation_id, args.repeat)
+            new = await measure(get_conversation_history, db, conversation_id, args.repeat)
+            print(f"{size:>9} {old:>9.2f}ms {new:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
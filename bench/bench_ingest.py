@@ -0,0 +1,114 @@
+"""오프라인 적재(app.ingest) 처리량 / 증분 재적재 / 중단 후 재개.
+
+가짜 임베딩(요청당 --embed-ms 지연)으로 합성 코퍼스를 적재한다. 문서의 일부는 같은 문단을
+공유하므로 내용 해시 중복 제거가 임베딩 수를 얼마나 줄이는지도 보인다.
+
+    python -m bench.bench_ingest --files 300 --embed-ms 80 --backend numpy
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+
+from bench.fakes import FakeEmbeddings, Latency
+from app.ingest import ingest
+
+SENTENCES = [
+    "요즘 잠들기까지 한 시간 넘게 걸린다고 호소했다.",
+    "상담사는 기상 시간을 먼저 고정해 보자고 제안했다.",
+    "업무 스트레스로 식욕이 줄고 체중이 감소했다.",
+    "가족에게 털어놓기 어렵다는 이야기를 여러 번 반복했다.",
+    "산책과 가벼운 운동 후 기분이 조금 나아졌다고 했다.",
+    "PHQ-9 점수는 지난달보다 세 점 낮아졌다.",
+    "과거의 실수를 계속 떠올리며 스스로를 탓했다.",
+    "주말에도 침대에서 나오기 힘들다고 말했다.",
+]
+# 여러 문서에 그대로 들어가는 안내문 (중복 청크)
+SHARED = "위기 상황에서는 자살예방상담전화 109 또는 정신건강위기상담전화 1577-0199로 연락하세요. " * 8
+
+
+class FailingEmbeddings(FakeEmbeddings):
+    """fail_after번째 요청부터 실패한다. 중단 후 재개를 흉내 낸다."""
+
+    def __init__(self, fail_after, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_after = fail_after
+
+    async def aembed_documents(self, texts):
+        if self.calls >= self.fail_after:
+            raise RuntimeError("embedding API unavailable")
+        return await super().aembed_documents(texts)
+
+
+def write_corpus(root, n_files, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    for i in range(n_files):
+        body = " ".join(rng.choice(SENTENCES) + f" (사례 {i}-{j})" for j in range(rng.randint(20, 60)))
+        with open(os.path.join(root, f"case-{i:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(body + "\n\n" + SHARED)
+
+
+def touch_files(root, fraction, seed=1):
+    names = sorted(os.listdir(root))
+    changed = random.Random(seed).sample(names, max(1, int(len(names) * fraction)))
+    for name in changed:
+        with open(os.path.join(root, name), "a", encoding="utf-8") as f:
+            f.write("\n추가 상담 메모: 이번 주에는 수면 일지를 함께 작성했다.")
+    return len(changed)
+
+
+def line(label, report, embedder):
+    return (
+        f"{label:<22} docs/s={report['docs_per_s']:7.1f} elapsed={report['elapsed_s']:6.2f}s "
+        f"chunks={report['chunks']:5d} embedded={report['embedded_chunks']:5d} dup={report['duplicate_chunks']:5d} "
+        f"requests={embedder.calls:4d} tokens={report['embedding_tokens']:7d}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--embed-ms", type=float, default=80)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--changed", type=float, default=0.05, help="증분 재적재 때 바꿀 파일 비율")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench-ingest-")
+    source = os.path.join(work, "docs")
+    write_corpus(source, args.files)
+
+    def run(name, embedder, concurrency):
+        return ingest(
+            [source], args.backend, os.path.join(work, name), embedder,
+            batch_size=args.batch_size, concurrency=concurrency,
+        )
+
+    latency = Latency(args.embed_ms / 1000, 0.2)
+    for concurrency in (1, args.concurrency):
+        embedder = FakeEmbeddings(latency=latency)
+        report = await run(f"full-c{concurrency}", embedder, concurrency)
+        print(line(f"full concurrency={concurrency}", report, embedder))
+
+    changed = touch_files(source, args.changed)
+    embedder = FakeEmbeddings(latency=latency)
+    report = await run(f"full-c{args.concurrency}", embedder, args.concurrency)
+    print(line(f"incremental ({changed} files)", report, embedder))
+
+    failing = FailingEmbeddings(3, latency=latency)
+    try:
+        await run("resume", failing, 1)
+    except RuntimeError:
+        pass
+    embedder = FakeEmbeddings(latency=latency)
+    report = await run("resume", embedder, args.concurrency)
+    print(line(f"resume after {failing.fail_after} batches", report, embedder))
+    shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
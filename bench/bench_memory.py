@@ -0,0 +1,66 @@
+"""대화 기록 크기: 고정 6개 윈도우 vs 토큰 예산 + 누적 요약(ConversationMemory).
+
+참고자료 목록과 가끔 PHQ-9 설문 전문이 붙은 상담사 답변으로 긴 대화를 흉내 내고,
+턴마다 프롬프트에 들어가는 대화 기록 토큰 수(근사)와 요약 호출 횟수를 비교한다.
+
+    python -m bench.bench_memory --turns 60 --budget 600
+"""
+import argparse
+import asyncio
+import statistics
+
+from bench.fakes import create_message, get_conversation_history, make_session_factory, percentile
+from app.memory import ConversationMemory, estimate_tokens
+
+FOOTER = "\n\n[참고자료]\n" + "\n".join(f"- 상담 사례 {i}.txt" for i in range(4))
+PHQ9_FORM = "\n\n[PHQ-9 설문]\n" + "\n".join(
+    f"{i}. 지난 2주 동안 다음 문제로 얼마나 자주 불편을 겪었습니까? (0~3점)" for i in range(1, 10)
+)
+
+
+async def fake_summarize(previous, lines):
+    # 요약 길이는 대화 길이와 무관하게 일정하다고 본다
+    await asyncio.sleep(0)
+    return "사용자는 수면 문제와 무기력을 호소했고 PHQ-9 점수는 12점이다. " * 4
+
+
+def agent_answer(turn):
+    answer = f"{turn}번째 답변입니다. " + "천천히 이야기해 주셔서 고마워요. " * 8 + FOOTER
+    if turn % 5 == 0:
+        answer += PHQ9_FORM
+    return answer
+
+
+def summarize_sizes(name, sizes):
+    print(
+        f"{name:<10} mean={statistics.mean(sizes):7.1f}  p95={percentile(sizes, 95):7.1f}  "
+        f"max={max(sizes):6d}  stdev={statistics.pstdev(sizes):6.1f} tokens"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--budget", type=int, default=600)
+    parser.add_argument("--trigger", type=int, default=6)
+    args = parser.parse_args()
+
+    session_factory, user_id, conversation_id = await make_session_factory()
+    memory = ConversationMemory(fake_summarize, session_factory, token_budget=args.budget, summary_trigger=args.trigger)
+    fixed_sizes, memory_sizes = [], []
+    async with session_factory() as db:
+        for turn in range(1, args.turns + 1):
+            await create_message(db, conversation_id, "user", "TBD(router)", f"{turn}번째 질문: 요즘 잠을 못 자요")
+            fixed_sizes.append(estimate_tokens(await get_conversation_history(db, conversation_id)))
+            memory_sizes.append(estimate_tokens(await memory.load_history(db, conversation_id)))
+            await create_message(db, conversation_id, "agent", "mental_agent", agent_answer(turn))
+            await memory.drain()  # 실제 서비스에서는 다음 턴과 겹쳐 백그라운드로 진행된다
+
+    print(f"turns={args.turns} budget={args.budget} trigger={args.trigger}")
+    summarize_sizes("window-6", fixed_sizes)
+    summarize_sizes("memory", memory_sizes)
+    print(f"summary updates: {memory.counters['summaries']} (errors {memory.counters['summary_errors']})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""계측 오버헤드: METRICS_ENABLED=0 / 1 / 1 + OTEL_ENABLED=1 에서 그래프 한 턴의 소요 시간.
+
+설정은 import 시점에 읽히므로 모드마다 새 프로세스에서 돈다. LLM/검색/감정 분석은 지연 0인
+가짜라서 측정값의 대부분이 그래프/DB/계측 자체의 비용이다.
+
+    python -m bench.bench_metrics --turns 500 --rounds 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = [
+    ("off", {"METRICS_ENABLED": "0"}),
+    ("metrics", {"METRICS_ENABLED": "1", "OTEL_ENABLED": "0"}),
+    ("metrics+otel", {"METRICS_ENABLED": "1", "OTEL_ENABLED": "1"}),
+]
+
+
+async def child(turns):
+    if os.getenv("OTEL_ENABLED") == "1":
+        # 익스포터 없이 span 생성/종료 비용만 잰다
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+
+        trace.set_tracer_provider(TracerProvider())
+
+    from bench.fakes import install_fakes, make_session_factory
+    from app.mental_agent_graph import compile_mental_graph
+    from app.metrics import metrics
+
+    install_fakes()
+    session_factory, user_id, conversation_id = await make_session_factory()
+    runnable = compile_mental_graph()
+    latencies = []
+    async with session_factory() as db:
+        for i in range(turns + 20):
+            state = {"user_id": user_id, "conversation_id": conversation_id, "user_input": f"잠이 안 와요 {i}"}
+            start = time.perf_counter()
+            await runnable.ainvoke(state, config={"configurable": {"db": db}})
+            if i >= 20:  # 앞의 20턴은 워밍업
+                latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    text = metrics.render()
+    render_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": statistics.median(latencies),
+        "render_ms": render_ms,
+        "series": sum(1 for line in text.splitlines() if line and not line.startswith("#")),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child(args.turns))
+        return
+
+    # 프로세스 간 편차가 크므로 모드를 번갈아 여러 번 돌려 중앙값을 쓴다
+    rows = {name: [] for name, _ in MODES}
+    for _ in range(args.rounds):
+        for name, env in MODES:
+            out = subprocess.run(
+                [sys.executable, "-m", "bench.bench_metrics", "--child", "--turns", str(args.turns)],
+                env={**os.environ, **env}, capture_output=True, text=True,
+            )
+            if out.returncode:
+                sys.exit(out.stderr)
+            rows[name].append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    def med(name, key):
+        return statistics.median(row[key] for row in rows[name])
+
+    baseline = med("off", "p50_ms")
+    for name, _ in MODES:
+        print(
+            f"{name:<13} p50={med(name, 'p50_ms'):7.3f}ms mean={med(name, 'mean_ms'):7.3f}ms "
+            f"overhead/turn={(med(name, 'p50_ms') - baseline) * 1000:7.1f}us  "
+            f"/metrics render={med(name, 'render_ms'):6.2f}ms ({rows[name][0]['series']} lines)"
+        )
+    # 계측 지점별 비용 (한 턴에 노드 7개, 공급자 호출 3개, SQL 몇 개)
+    from app.metrics import Histogram, track_provider
+
+    histogram = Histogram("bench_seconds", "bench", ("node",))
+    n = 100000
+    start = time.perf_counter()
+    for _ in range(n):
+        histogram.observe(0.003, "llm")
+    observe_us = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        with track_provider("bench"):
+            pass
+    print(f"histogram.observe={observe_us:.2f}us  track_provider={(time.perf_counter() - start) / n * 1e6:.2f}us (METRICS_ENABLED={os.getenv('METRICS_ENABLED', '1')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""소셜 로그인 공급자 호출: 호출마다 requests + 스레드풀 vs 공유 httpx.AsyncClient.
+
+로컬 모의 OAuth 서버(POST /token, GET /userinfo)에 지연을 주고
+순차 로그인 지연과 동시 로그인 처리량을 비교한다.
+
+    python -m bench.bench_oauth --logins 200 --concurrency 50 --delay-ms 20
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from starlette.concurrency import run_in_threadpool
+
+from bench.fakes import percentile
+from app.oauth import OAuthClient, PROVIDERS
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive 재사용이 가능하도록
+    disable_nagle_algorithm = True  # 헤더/본문을 나눠 쓰는 핸들러에서 delayed ACK 지연 방지
+    delay = 0.0
+
+    def _reply(self, payload: dict):
+        time.sleep(self.delay)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply({"access_token": "token", "token_type": "bearer"})
+
+    def do_GET(self):
+        self._reply({"id": "1234", "email": "bench@example.com", "name": "bench"})
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_server(delay: float, handler=MockProviderHandler):
+    handler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def legacy_login(provider, code):
+    # 이전 구현: 호출마다 새 커넥션, 타임아웃 없음, 스레드풀에서 블로킹 호출
+    data = provider.token_request_data(code, {})
+    token = (await run_in_threadpool(requests.post, provider.token_url, data=data)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    userinfo = (await run_in_threadpool(requests.get, provider.userinfo_url, headers=headers)).json()
+    return provider.parse_userinfo(userinfo)
+
+
+async def run(name, login, logins, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with sem:
+            start = time.perf_counter()
+            await login(f"code-{i}")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(logins)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<10} conc={concurrency:<4} {logins / elapsed:8.1f} logins/s  "
+        f"p50={percentile(latencies, 50):7.1f}ms  p95={percentile(latencies, 95):7.1f}ms  "
+        f"p99={percentile(latencies, 99):7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server, base = start_mock_server(args.delay_ms / 1000)
+    provider = dataclasses.replace(PROVIDERS["google"], token_url=f"{base}/token", userinfo_url=f"{base}/userinfo")
+    client = OAuthClient()
+    try:
+        for concurrency in (1, args.concurrency):
+            await run("requests", lambda code: legacy_login(provider, code), args.logins, concurrency)
+            await run("httpx", lambda code: client.login(provider, code), args.logins, concurrency)
+    finally:
+        await client.aclose()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
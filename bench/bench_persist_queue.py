@@ -0,0 +1,96 @@
+"""응답 후 쓰기: 요청 안에서 바로 commit(sync) vs 로컬 큐 + 배치 반영(queue).
+
+DB 왕복마다 --db-ms 만큼 지연을 넣어 원격 MySQL을 흉내 내고, 답변이 준비된 뒤
+응답을 돌려주기까지의 시간과 큐의 배치 반영 지연/배치 크기를 비교한다.
+queue 모드의 visible은 응답 뒤 작업이 반영될 때까지의 시간으로, 턴 관문이 대화 락을 더 잡는 시간이다.
+
+    python -m bench.bench_persist_queue --turns 200 --concurrency 20 --db-ms 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import event, func, select
+
+import app.write_queue as wq
+from bench.fakes import install_fakes, make_session_factory, percentile
+from app.models import Message
+from app.mental_agent_graph import compile_mental_graph
+
+
+def add_db_latency(session_factory, db_ms):
+    engine = session_factory.kw["bind"].sync_engine
+
+    def delay(*args, **kwargs):
+        time.sleep(db_ms / 1000)  # aiosqlite 스레드에서 실행되므로 이벤트 루프는 막지 않는다
+
+    event.listen(engine, "before_cursor_execute", delay)
+    event.listen(engine, "commit", delay)
+
+
+async def run_mode(mode, args):
+    install_fakes()
+    session_factory, user_id, conversation_id = await make_session_factory()
+    add_db_latency(session_factory, args.db_ms)
+    runnable = compile_mental_graph()
+    wq.PERSIST_MODE = mode
+    queue = wq.write_queue = wq.WriteQueue(
+        os.path.join(tempfile.mkdtemp(prefix="bench-queue-"), "queue.sqlite3"), session_factory
+    )
+    await queue.start()
+
+    sem = asyncio.Semaphore(args.concurrency)
+    persist_ms, visible_ms = [], []
+
+    async def turn(i):
+        async with sem:
+            state = {"user_id": user_id, "conversation_id": conversation_id, "user_input": f"요즘 힘들어요 PHQ 점수 {i % 28}점"}
+            started_at = datetime.now()
+            async with session_factory() as db:
+                result = await runnable.ainvoke(state, config={"configurable": {"db": db}})
+            # main.finish_chat_turn처럼 조회 세션을 닫은 뒤 저장한다 (queue 모드의 워커도 같은 풀을 쓴다)
+            start = time.perf_counter()  # 답변이 준비된 시점부터 응답을 돌려줄 때까지
+            async with session_factory() as db:
+                ids = await wq.persist_turn(db, state, result, started_at)
+            persist_ms.append((time.perf_counter() - start) * 1000)
+        # 클라이언트는 응답을 받았으므로 반영은 동시성 슬롯 밖에서 기다린다
+        if ids:
+            await queue.wait_applied(ids, wq.WRITE_QUEUE_VISIBLE_TIMEOUT)
+            visible_ms.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(turn(i) for i in range(args.turns)))
+    elapsed = time.perf_counter() - start
+    stats = queue.stats()
+    await queue.stop()
+    async with session_factory() as db:
+        stored = (await db.execute(select(func.count()).select_from(Message))).scalar()
+
+    line = (
+        f"{mode:<6} {args.turns / elapsed:7.1f} turns/s  after-answer p50={percentile(persist_ms, 50):7.2f}ms "
+        f"p95={percentile(persist_ms, 95):7.2f}ms  messages={stored}"
+    )
+    if mode == "queue":
+        line += (
+            f"  batches={stats['batches']} avg_batch={stats['flushed'] / max(1, stats['batches']):.1f} "
+            f"flush_p50={stats['flush_p50_ms']}ms visible_p50={percentile(visible_ms, 50):.1f}ms"
+        )
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--db-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for mode in ("sync", "queue"):
+        await run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""PHQ-9 점수 추출기: 한 번에 훑는 app.phq9.extract vs 이전 추출기(패턴 4개를 차례로 검사).
+
+1. 추출: 합성 사용자 메시지 --messages개(대부분 숫자가 없는 일상 대화, 일부는 "3점", "총 2번", "3시간"처럼
+   점수가 아닌 숫자, 일부는 PHQ-9 총점을 말하는 문장)에 대해 처리량과 정확도(정답 레이블 기준)
+2. 쓰기: 사용자별로 메시지를 차례로 흘려 보낼 때 phq9_result 쓰기 수 (이전: 찾을 때마다 / 지금: 점수가 바뀔 때만)
+3. 일괄 재검증/채우기: SQLite에 --db-messages개를 넣고 backfill(읽기만, 반영)을 청크 단위로 돌린 처리량
+
+    python -m bench.bench_phq9 --messages 200000 --db-messages 100000
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from bench.fakes import make_session_factory
+from app.models import Conversation, Message, PHQ9Result, User
+from app.phq9 import backfill, extract, phq9_level
+
+# 이전 구현 (mental_agent.extract_phq9_score): 패턴마다 전체를 다시 훑고 처음 나온 0~27을 점수로 본다
+LEGACY_PATTERNS = [
+    re.compile(r'PHQ.*?(\d+)점', re.IGNORECASE),
+    re.compile(r'점수.*?(\d+)'),
+    re.compile(r'(\d+)점'),
+    re.compile(r'총.*?(\d+)'),
+]
+
+
+def legacy_extract(text):
+    for pattern in LEGACY_PATTERNS:
+        for match in pattern.findall(text):
+            score = int(match)
+            if 0 <= score <= 27:
+                return (score, phq9_level(score))
+    return (None, None)
+
+
+PLAIN = [
+    "요즘 아무것도 하기 싫고 너무 무기력해요", "회사에서 팀장님 때문에 스트레스를 많이 받아요",
+    "친구들이랑 연락을 안 한 지 꽤 됐어요", "밤에 잠이 잘 안 와서 계속 뒤척여요",
+    "상담 받고 나서 조금 나아진 것 같아요", "그냥 모든 게 의미가 없는 것 같아요",
+]
+NOISE = [
+    "어제 {n}시간밖에 못 잤어요", "이번 주에 총 {n}번 울었어요", "시험에서 {n}점 받았어요",
+    "{n}일째 밖에 안 나갔어요", "수학 점수가 {n}점이라 속상해요", "오늘 {n}시에 일어났어요",
+    "PHQ-9 검사를 {n}번 했어요", "{n}살 때부터 그랬어요",
+]
+SCORED = [
+    "PHQ-9 점수가 {n}점 나왔어요", "phq9 검사 결과 총점 {n}", "우울증 자가진단 해봤는데 {n}점이래요",
+    "설문 결과 27점 만점에 {n}점이에요", "PHQ-9 {n}/27 나왔어요", "{n}점 나왔어요 PHQ-9에서",
+]
+
+
+def corpus(count, rng, scored_rate=0.03, noise_rate=0.15):
+    """(텍스트, 정답 점수 또는 None) 목록."""
+    rows = []
+    for _ in range(count):
+        r = rng.random()
+        n = rng.randint(0, 27)
+        if r < scored_rate:
+            rows.append((f"{rng.choice(PLAIN)}. {rng.choice(SCORED).format(n=n)}", n))
+        elif r < scored_rate + noise_rate:
+            rows.append((f"{rng.choice(PLAIN)}. {rng.choice(NOISE).format(n=rng.randint(1, 12))}", None))
+        else:
+            rows.append((rng.choice(PLAIN), None))
+    return rows
+
+
+def measure(name, fn, rows):
+    start = time.perf_counter()
+    results = [fn(text) for text, _ in rows]
+    elapsed = time.perf_counter() - start
+    found = [(got, want) for got, (_, want) in zip(results, rows) if got is not None]
+    correct = sum(got == want for got, want in found)
+    truth = sum(want is not None for _, want in rows)
+    print(
+        f"{name:<8} {len(rows) / elapsed:10.0f} msg/s  {elapsed / len(rows) * 1e6:6.2f}us/msg  "
+        f"found={len(found):<6} precision={correct / max(1, len(found)):6.1%} recall={correct / max(1, truth):6.1%} "
+        f"false_positives={len(found) - correct}"
+    )
+    return results
+
+
+def write_counts(rows, users, rng, results_by_name):
+    """메시지를 사용자에게 무작위로 나눠 차례로 흘릴 때 phq9_result 쓰기 수."""
+    owners = [rng.randrange(users) for _ in rows]
+    for name, (results, on_change) in results_by_name.items():
+        stored, writes = {}, 0
+        for owner, score in zip(owners, results):
+            if score is None or (on_change and stored.get(owner) == score):
+                continue
+            stored[owner] = score
+            writes += 1
+        print(f"{name:<8} phq9_result writes={writes}")
+
+
+async def seed(session_factory, rows, users, stale_rate, rng):
+    """--db-messages개 메시지와, 일부 사용자에게 이전 추출기가 남긴 것 같은 점수를 넣는다."""
+    async with session_factory() as db:
+        user_rows = [User(email=f"p{i}-{rng.getrandbits(32):x}@example.com", password="-") for i in range(users)]
+        db.add_all(user_rows)
+        await db.commit()
+        conversations = [Conversation(user_id=u.user_id, started_at=datetime.now()) for u in user_rows]
+        db.add_all(conversations)
+        await db.commit()
+        conversation_ids = [c.conversation_id for c in conversations]
+        start = datetime.now() - timedelta(days=90)
+        for i in range(0, len(rows), 5000):
+            await db.execute(insert(Message), [
+                {
+                    "conversation_id": rng.choice(conversation_ids), "sender_type": "user", "agent_type": "TBD(router)",
+                    "content": text, "created_at": start + timedelta(seconds=(i + j) * 30),
+                }
+                for j, (text, _) in enumerate(rows[i:i + 5000])
+            ])
+        stale = [
+            {"user_id": u.user_id, "score": rng.randint(0, 27), "level": "-", "updated_at": datetime.now()}
+            for u in user_rows if rng.random() < stale_rate
+        ]
+        if stale:
+            await db.execute(insert(PHQ9Result), stale)
+        await db.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--db-messages", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--chunk", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    # 1. 추출
+    rows = corpus(args.messages, rng)
+    legacy = measure("legacy", lambda text: legacy_extract(text)[0], rows)
+    current = measure("extract", lambda text: (lambda m: m.score if m else None)(extract(text)), rows)
+
+    digits = [row for row in rows if re.search(r"\d", row[0])]
+    print(f"-- 숫자가 있는 메시지 {len(digits)}개만")
+    measure("legacy", lambda text: legacy_extract(text)[0], digits)
+    measure("extract", lambda text: (lambda m: m.score if m else None)(extract(text)), digits)
+
+    # 2. 쓰기 수
+    write_counts(rows, args.users, rng, {"legacy": (legacy, False), "extract": (current, True)})
+
+    # 3. 일괄 재검증/채우기
+    session_factory, _, _ = await make_session_factory()
+    await seed(session_factory, corpus(args.db_messages, rng), args.users, 0.3, rng)
+    for apply in (False, True, False):
+        report = await backfill(
+            session_factory, session_factory, apply=apply, prune=apply,
+            history_before=datetime.now() if apply else None, chunk=args.chunk,
+        )
+        print(
+            f"backfill apply={apply!s:<5} messages={report['messages']} matches={report['matches']} "
+            f"changed={report['changed']} missing={report['missing']} unsupported={report['unsupported']} "
+            f"history_rows={report['history_rows']} {report['messages_per_s']} msg/s ({report['elapsed_s']}s)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
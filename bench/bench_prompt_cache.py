@@ -0,0 +1,154 @@
+"""답변 프롬프트 구성: 이전 단일 f-string vs 고정 시스템 메시지 + 요청별 사람 메시지.
+
+공급자 측 prefix 캐시를 흉내 내는 가짜 모델로 그래프를 돌린다.
+- 최근 요청과 공유하는 prefix가 min_prefix(1024) 토큰 이상이면 block(128) 단위로 캐시 적중
+- 캐시된 토큰은 prefill 시간이 들지 않고, cache_discount 비율만큼 싸게 과금
+토큰 수는 app.memory.estimate_tokens 근사치다.
+
+    python -m bench.bench_prompt_cache --conversations 5 --turns 8 --cache-discount 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime
+
+from langchain_core.messages import AIMessage
+
+from bench.fakes import FakeVectorStore, install_fakes, make_session_factory, percentile
+from app.crud import create_conversation
+from app.llm_router import LLMRouter
+from app.memory import estimate_tokens
+from app.mental_agent_graph import compile_mental_graph
+from app.write_queue import apply_jobs, turn_jobs
+
+
+def legacy_prompt(state, fused_emotion=False):
+    # 이전 구현: 지시문과 요청별 내용을 한 문자열(사람 메시지 하나)로 보냈다
+    from app.mental_agent import FUSED_EMOTION_INSTRUCTION
+
+    emotion_instruction = f"\n{FUSED_EMOTION_INSTRUCTION}\n" if fused_emotion else ""
+    return f"""
+당신은 친절하고 공감하는 멘탈 건강 상담사입니다.
+항상 같은 인사말(예: '안녕하세요')로 시작하지 말고,
+질문에 바로 상담 답변을 해주세요.
+
+아래 이전 대화 내용, 상담 기록, 참고 내용을 종합적으로 고려하여 사용자 질문에 대해 친절하고 이해하기 쉽게 답변해 주세요.
+특히 이전 대화에서 언급된 PHQ-9 점수, 감정 상태, 개인적 상황 등을 기억하고 연속성 있는 상담을 제공하세요.
+상담자가 우울함을 표시하고 있다면 공감을 표하고 PHQ-9 설문을 제안하세요. PHQ-9 설문 점수가 존재한다면 PHQ-9 점수에 따라 적절한 조치를 안내하세요.
+상담 기록 및 참고 내용에 실명이 들어가 있다면 무시해줘.
+{emotion_instruction}
+=== 사용자 세션 정보 ===
+{state.get('user_context','')}
+
+=== 최근 대화 내용 ===
+{state.get('chat_history','')}
+
+=== 상담 기록 및 참고 내용 ===
+{state.get('context','')}
+
+=== 현재 질문 ===
+{state['user_input']}
+
+답변:
+"""
+
+
+def serialize(prompt):
+    # 공급자는 역할 구분자를 포함한 토큰열의 prefix로 캐시를 찾는다
+    if isinstance(prompt, str):
+        return f"<user>{prompt}"
+    return "".join(f"<{m.type}>{m.content}" for m in prompt)
+
+
+class PrefixCachingLLM:
+    def __init__(self, prefill_ms_per_token=0.4, base_ms=300, min_prefix=1024, block=128, remember=64):
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.base_ms = base_ms
+        self.min_prefix = min_prefix
+        self.block = block
+        self.remember = remember
+        self.recent = []
+
+    def cached_tokens(self, text):
+        shared = max((len(os.path.commonprefix([text, seen])) for seen in self.recent), default=0)
+        tokens = estimate_tokens(text[:shared]) if shared else 0
+        return (tokens // self.block) * self.block if tokens >= self.min_prefix else 0
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        text = serialize(prompt)
+        input_tokens = estimate_tokens(text)
+        cached = min(self.cached_tokens(text), input_tokens)
+        self.recent = (self.recent + [text])[-self.remember:]
+        await asyncio.sleep((self.base_ms + self.prefill_ms_per_token * (input_tokens - cached)) / 1000)
+        answer = "요즘 많이 힘드셨겠어요. 잠들기 전에 휴대폰을 멀리 두는 것부터 해보면 어떨까요?"
+        return AIMessage(content=answer, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": estimate_tokens(answer),
+            "total_tokens": input_tokens + estimate_tokens(answer),
+            "input_token_details": {"cache_read": cached},
+        })
+
+
+async def run_layout(layout, args):
+    import app.mental_agent as agent
+    import app.mental_agent_nodes as nodes
+
+    install_fakes()
+    store = FakeVectorStore()
+    for i, doc in enumerate(store.docs):
+        doc.page_content = f"상담 사례 {i}: " + "내담자는 수면 문제와 무기력을 호소했고 상담사는 생활 리듬을 함께 점검했다. " * 6
+    agent.providers.override("vectorstore", store)
+    llm = PrefixCachingLLM(args.prefill_ms_per_token)
+    agent.providers.override("llm_pool", {"openai": llm})
+    agent.providers.override("llm_router", LLMRouter({"openai": llm}))
+    original = nodes.build_answer_messages
+    if layout == "legacy":
+        nodes.build_answer_messages = legacy_prompt
+
+    session_factory, user_id, _ = await make_session_factory()
+    runnable = compile_mental_graph("separate")
+    latencies, usages = [], []
+    try:
+        async with session_factory() as db:
+            for c in range(args.conversations):
+                conversation_id = (await create_conversation(db, user_id)).conversation_id
+                for t in range(args.turns):
+                    text = f"요즘 잠을 잘 못 자고 아무것도 하기 싫어요 ({c}-{t})"
+                    state = {"user_id": user_id, "conversation_id": conversation_id, "user_input": text, "phq9_suggested": True}
+                    started_at = datetime.now()
+                    start = time.perf_counter()
+                    result = await runnable.ainvoke(state, config={"configurable": {"db": db}})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    usages.append(result["usage"])  # 백그라운드 요약 호출은 제외하고 답변 호출만 센다
+                    await apply_jobs(db, turn_jobs(state, result, started_at))
+                    await db.commit()
+    finally:
+        nodes.build_answer_messages = original
+        await agent.conversation_memory.drain()
+
+    input_tokens = [u["input_tokens"] for u in usages]
+    cached = [u["cached_tokens"] for u in usages]
+    billed = [i - c * args.cache_discount for i, c in zip(input_tokens, cached)]
+    print(
+        f"{layout:<8} in_tokens/turn={statistics.mean(input_tokens):7.1f} cached/turn={statistics.mean(cached):7.1f} "
+        f"billed/turn={statistics.mean(billed):7.1f}  latency mean={statistics.mean(latencies):6.1f}ms "
+        f"p95={percentile(latencies, 95):6.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.4)
+    parser.add_argument("--cache-discount", type=float, default=0.5, help="캐시 토큰 할인율 (gpt-4o-mini 0.5, gemini 0.75)")
+    args = parser.parse_args()
+
+    for layout in ("legacy", "messages"):
+        await run_layout(layout, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""재시도 폭주에서 /chat 턴 관문(app.turn_gate)이 아끼는 LLM 호출과 저장 중복.
+
+대화마다 턴을 순서대로 보내되, 턴마다 클라이언트가 응답을 기다리지 못하고 --retry-after-ms 간격으로
+--retries번 같은 요청을 다시 보낸다 (먼저 보낸 요청은 서버에서 계속 실행된다). 모드별로:
+
+- off: 관문 없음 (이전 동작)
+- gate: 대화별 직렬화 + 같은 입력의 진행 중 요청 합치기
+- gate+key: 위와 같고 Idempotency-Key를 보내 이미 끝난 턴의 재시도도 저장된 답으로 돌려준다
+
+끝난 뒤 대화별 저장 메시지가 [질문1, 답1, 질문2, 답2 ...]인지 확인한다. 기본 PERSIST_MODE=queue에서도
+턴이 저장 반영까지 대화 락을 잡으므로 순서가 맞아야 한다 (--persist-mode sync로 비교).
+
+    python -m bench.bench_retry_storm --conversations 20 --turns 5 --retries 3 --llm-ms 300
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ["PROVIDER_WARMUP"] = "0"
+os.environ.setdefault("WRITE_QUEUE_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-retry-"), "queue.sqlite3"))
+
+import httpx
+from sqlalchemy import select
+
+from bench.fakes import Latency, install_fakes, make_session_factory, percentile
+import app.main as main
+import app.write_queue as wq
+from app.crud import create_conversation
+from app.models import Message
+
+
+async def client_turn(client, user_id, conversation_id, turn, args, use_key):
+    """한 턴: 처음 요청과 재시도들을 보내고 가장 먼저 온 성공 응답까지의 시간을 잰다."""
+    payload = {"user_id": user_id, "conversation_id": conversation_id, "user_input": f"질문 {turn}: 요즘 잠을 못 자요"}
+    headers = {"Idempotency-Key": f"{conversation_id}-{turn}"} if use_key else {}
+    start = time.perf_counter()
+    first = asyncio.get_running_loop().create_future()
+
+    async def attempt(i):
+        await asyncio.sleep(i * args.retry_after_ms / 1000)
+        response = await client.post("/chat", json=payload, headers=headers)
+        if response.status_code == 200 and not first.done():
+            first.set_result((time.perf_counter() - start) * 1000)
+
+    attempts = [asyncio.create_task(attempt(i)) for i in range(args.retries + 1)]
+    latency = await first
+    return latency, attempts
+
+
+async def check_order(session_factory, conversations, turns):
+    """대화별 저장 메시지가 질문/답이 번갈아 턴 순서대로 한 번씩인지 센다."""
+    expected = []
+    for turn in range(turns):
+        expected += [("user", f"질문 {turn}: 요즘 잠을 못 자요"), ("agent", None)]
+    messages = bad = 0
+    async with session_factory() as db:
+        for conversation_id in conversations:
+            rows = (await db.execute(
+                select(Message.sender_type, Message.content)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.message_id)
+            )).all()
+            messages += len(rows)
+            if [(sender, content if sender == "user" else None) for sender, content in rows] != expected:
+                bad += 1
+    return messages, bad
+
+
+async def run_mode(name, client, session_factory, user_id, llms, args):
+    main.turn_gate.enabled = name != "off"
+    main.turn_gate.counters = dict.fromkeys(main.turn_gate.counters, 0)
+    async with session_factory() as db:
+        conversations = [(await create_conversation(db, user_id)).conversation_id for _ in range(args.conversations)]
+    calls_before = sum(llm.calls for llm in llms.values())
+    latencies, stragglers = [], []
+
+    async def conversation(conversation_id):
+        for turn in range(args.turns):
+            latency, attempts = await client_turn(client, user_id, conversation_id, turn, args, name == "gate+key")
+            latencies.append(latency)
+            stragglers.extend(attempts)
+            await asyncio.sleep(args.think_ms / 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(c) for c in conversations))
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*stragglers)  # 늦게 도착한 재시도까지 끝난 뒤 센다
+    llm_calls = sum(llm.calls for llm in llms.values()) - calls_before
+    messages, bad = await check_order(session_factory, conversations, args.turns)
+    turns = args.conversations * args.turns
+    stats = main.turn_gate.stats()
+    print(
+        f"{name:<9} requests={turns * (args.retries + 1):<5} turns={turns:<4} llm_calls={llm_calls:<5} "
+        f"({llm_calls / turns:4.2f}/turn) messages={messages:<5} (expected {turns * 2}) bad_conversations={bad:<3} "
+        f"turn p50={percentile(latencies, 50):6.1f}ms p95={percentile(latencies, 95):6.1f}ms  "
+        f"coalesced={stats['coalesced']} replayed={stats['replayed']} queued={stats['queued']}  {elapsed:5.1f}s"
+    )
+    return llm_calls
+
+
+async def main_async():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--retry-after-ms", type=float, default=150)
+    parser.add_argument("--think-ms", type=float, default=50, help="턴 사이 사용자 대기")
+    parser.add_argument("--llm-ms", type=float, default=300)
+    parser.add_argument("--persist-mode", choices=["queue", "sync"], default="queue")
+    args = parser.parse_args()
+
+    llms = install_fakes(llm_latency=Latency(args.llm_ms / 1000, 0.2))
+    llms.pop("emotion")
+    session_factory, user_id, _ = await make_session_factory()
+    main.SessionLocal = main.ReadSessionLocal = session_factory
+    main.write_queue.session_factory = session_factory
+    wq.PERSIST_MODE = args.persist_mode
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            calls = {}
+            for name in ("off", "gate", "gate+key"):
+                calls[name] = await run_mode(name, client, session_factory, user_id, llms, args)
+            print(
+                f"LLM calls saved vs off: gate {1 - calls['gate'] / calls['off']:.0%}, "
+                f"gate+key {1 - calls['gate+key'] / calls['off']:.0%}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,109 @@
+"""워커 시작 비용: `import app.main` 시간(-X importtime), lifespan 시작, 첫 요청(/signup)까지의 시간.
+
+매 회 새 파이썬 프로세스에서 잰다. DB는 sqlite 메모리 DB로 바꾸고, 외부 API는 호출하지 않는다
+(첫 요청은 LLM/임베딩 클라이언트가 필요 없는 /signup).
+
+    python -m bench.bench_startup --runs 5
+    PROVIDER_WARMUP=0 python -m bench.bench_startup   # 클라이언트를 첫 사용 때 만든다
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CHILD = r"""
+import time
+started = time.perf_counter()
+import app.main as main
+imported = time.perf_counter()
+
+import asyncio, json, sys
+import httpx
+from bench.fakes import make_session_factory
+
+async def run():
+    session_factory, _, _ = await make_session_factory()
+    main.SessionLocal = session_factory
+    ready = time.perf_counter()
+    async with main.lifespan(main.app):
+        up = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+            response = await client.post("/signup", json={"email": "a@b.c", "password": "pw", "nickname": "n", "business_type": "x"})
+            response.raise_for_status()
+        first = time.perf_counter()
+    return ready, up, first
+
+ready, up, first = asyncio.run(run())
+modules = sorted(m for m in sys.modules if m.split(".")[0] in ("langchain_openai", "langchain_google_genai", "openai", "chromadb", "google"))
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (up - ready) * 1000,
+    "first_request_ms": (first - up) * 1000,
+    "heavy_modules": len(modules),
+}))
+"""
+
+WATCH = ["app.main", "app.mental_agent", "langchain_openai", "langchain_google_genai", "openai", "chromadb", "langgraph.graph", "fastapi"]
+
+
+def importtime(env):
+    """-X importtime 출력에서 관심 모듈의 누적 import 시간(ms)."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], env=env, capture_output=True, text=True
+    ).stderr
+    cumulative = {}
+    for line in out.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)", line)
+        if match and match.group(2) in WATCH:
+            cumulative[match.group(2)] = int(match.group(1)) / 1000
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench-startup-")
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "bench"),
+        "WRITE_QUEUE_PATH": os.path.join(work, "queue.sqlite3"),
+        "VECTOR_BACKEND": os.getenv("VECTOR_BACKEND", "numpy"),
+        "VECTOR_DB_PATH": os.getenv("VECTOR_DB_PATH", os.path.join(work, "vector_index")),
+        "PYTHONPATH": os.getcwd(),
+    }
+
+    cumulative = importtime(env)
+    print("import app.main (-X importtime, 누적):")
+    for name in WATCH:
+        value = cumulative.get(name)
+        print(f"  {name:<24} {'(import 안 됨)' if value is None else f'{value:8.1f}ms'}")
+
+    rows, walls = [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", CHILD], env=env, capture_output=True, text=True)
+        walls.append((time.perf_counter() - start) * 1000)
+        if out.returncode:
+            sys.exit(out.stderr)
+        rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    def med(key):
+        return statistics.median(row[key] for row in rows)
+
+    print(
+        f"runs={args.runs} PROVIDER_WARMUP={os.getenv('PROVIDER_WARMUP', '1')}  "
+        f"import={med('import_ms'):7.1f}ms startup={med('startup_ms'):7.1f}ms first_request={med('first_request_ms'):7.1f}ms  "
+        f"process_to_first_response={statistics.median(walls):7.1f}ms  heavy_modules_loaded={int(med('heavy_modules'))}"
+    )
+
+
+if __name__ == "__main__":
+    main()
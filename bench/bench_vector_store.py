@@ -0,0 +1,91 @@
+"""벡터 저장소 백엔드별 recall@k / 검색 지연 / 콜드 스타트 비교.
+
+--chroma-path를 주면 global-documents 컬렉션을 그대로 내보내 쓰고, 없으면 군집이 있는
+합성 벡터를 만든다. 정답은 전수 비교(numpy) 결과다.
+
+    python -m bench.bench_vector_store --docs 20000 --dim 384 --queries 300
+    python -m bench.bench_vector_store --chroma-path data/vector_db --backends numpy faiss hnswlib chroma
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from bench.fakes import percentile
+from app.vector_store import (
+    RetrieverSettings, build_vector_index, export_chroma, write_chroma, write_local_index, _normalize,
+)
+
+
+def synthetic_corpus(n, dim, clusters=50, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.normal(size=(n, dim))
+    documents = [Document(page_content=f"문서 {i}", metadata={"doc_id": i}) for i in range(n)]
+    return [str(i) for i in range(n)], _normalize(vectors), documents
+
+
+def doc_key(doc):
+    return doc.metadata.get("doc_id", doc.id)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["numpy", "faiss", "hnswlib", "chroma"])
+    parser.add_argument("--chroma-path")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--ef", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.chroma_path:
+        ids, vectors, documents = export_chroma(args.chroma_path)
+        vectors = _normalize(vectors)
+        for i, doc in enumerate(documents):
+            doc.metadata = {**doc.metadata, "doc_id": i}
+    else:
+        ids, vectors, documents = synthetic_corpus(args.docs, args.dim)
+    rng = np.random.default_rng(1)
+    queries = _normalize(vectors[rng.integers(0, len(ids), args.queries)] + 0.3 * rng.normal(size=(args.queries, vectors.shape[1])))
+    truth = [set(np.argsort(-(vectors @ q))[:args.k].tolist()) for q in queries]
+    settings = RetrieverSettings(k=args.k, hnsw_ef=args.ef)
+    print(f"docs={len(ids)} dim={vectors.shape[1]} queries={args.queries} k={args.k} ef={args.ef}")
+
+    for backend in args.backends:
+        path = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+        start = time.perf_counter()
+        try:
+            if backend == "chroma":
+                write_chroma(path, [(ids, vectors, documents)], hnsw_ef=args.ef)
+            else:
+                write_local_index(path, backend, ids, vectors, documents)
+        except ImportError as e:
+            print(f"{backend:<8} 건너뜀 ({e})")
+            continue
+        build_s = time.perf_counter() - start
+
+        index = build_vector_index(backend, path, settings=settings)
+        start = time.perf_counter()
+        index.search(queries[0])  # 콜드: 인덱스 열기 + 첫 검색
+        cold_ms = (time.perf_counter() - start) * 1000
+        index.warmup()
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            docs = index.search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {doc_key(d) for d in docs})
+        print(
+            f"{backend:<8} recall@{args.k}={hits / (args.k * len(queries)):.3f}  "
+            f"p50={percentile(latencies, 50):7.3f}ms p95={percentile(latencies, 95):7.3f}ms  "
+            f"cold_first_query={cold_ms:8.1f}ms build={build_s:6.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""벤치마크용 가짜 LLM / 검색기 / DB.
+
+네트워크 없이 그래프를 돌리기 위해 app.mental_agent.providers 의 외부 클라이언트를 교체한다.
+"""
+import asyncio
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from uuid import uuid4
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.messages import AIMessage
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.models import Base, User, Conversation, Message
+
+
+class Latency:
+    """평균 mean 초의 지연.
+
+    distribution="uniform": ±jitter 비율의 균등분포
+    distribution="lognormal": 평균이 mean이고 로그 표준편차가 jitter인 로그정규분포 (긴 꼬리)
+    """
+
+    def __init__(self, mean=0.0, jitter=0.0, seed=0, distribution="uniform"):
+        self.mean = mean
+        self.jitter = jitter
+        self.distribution = distribution
+        self.rng = random.Random(seed)
+
+    def sample(self):
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "lognormal":
+            return self.rng.lognormvariate(math.log(self.mean) - self.jitter ** 2 / 2, self.jitter)
+        return self.mean * (1 + self.rng.uniform(-self.jitter, self.jitter))
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def estimate_tokens(text):
+    """토큰 수 근사치 (한국어 기준 2자당 1토큰). 오프라인에서도 결정적이다."""
+    return max(1, len(text) // 2)
+
+
+def prompt_text(prompt):
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(getattr(m, "content", None) or m.get("content", "") for m in prompt)
+
+
+class FakeLLM:
+    """고정 답변을 돌려주는 채팅 모델. 지시문에 감정 머리줄 요청이 있으면 따른다."""
+
+    def __init__(self, name, latency=None, answer="요즘 많이 힘드셨겠어요. 천천히 이야기해 주세요.", emotion="우울"):
+        self.name = name
+        self.latency = latency or Latency()
+        self.answer = answer
+        self.emotion = emotion
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def _respond(self, prompt):
+        from app.mental_agent import FUSED_EMOTION_INSTRUCTION
+
+        text = prompt_text(prompt)
+        answer = self.answer
+        if FUSED_EMOTION_INSTRUCTION in text:
+            answer = f"[감정: {self.emotion}]\n{answer}"
+        usage = {"input_tokens": estimate_tokens(text), "output_tokens": estimate_tokens(answer)}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        self.calls += 1
+        self.input_tokens += usage["input_tokens"]
+        self.output_tokens += usage["output_tokens"]
+        return AIMessage(content=answer, usage_metadata=usage)
+
+    def invoke(self, prompt, config=None, **kwargs):
+        self.latency.sleep()
+        return self._respond(prompt)
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        await self.latency.asleep()
+        return self._respond(prompt)
+
+
+class FakeRetriever:
+    def __init__(self, docs, latency=None):
+        self.docs = docs
+        self.latency = latency or Latency()
+
+    def invoke(self, query, config=None, **kwargs):
+        self.latency.sleep()
+        return list(self.docs)
+
+    async def ainvoke(self, query, config=None, **kwargs):
+        await self.latency.asleep()
+        return list(self.docs)
+
+
+class FakeVectorStore:
+    def __init__(self, n_docs=4, latency=None):
+        self.docs = [
+            Document(page_content=f"참고 문서 {i} 내용", metadata={"source": f"doc-{i}.txt"})
+            for i in range(n_docs)
+        ]
+        self.latency = latency or Latency()
+
+    def as_retriever(self, **kwargs):
+        return FakeRetriever(self.docs, self.latency)
+
+    async def asearch(self, vector, settings=None):
+        await self.latency.asleep()
+        return list(self.docs[:settings.k if settings else 4])
+
+    def warmup(self):
+        pass
+
+
+class FakeEmbeddings(Embeddings):
+    """텍스트별로 결정적인 벡터를 돌려주는 임베딩. 호출 수를 센다."""
+
+    def __init__(self, size=64, latency=None):
+        self.inner = DeterministicFakeEmbedding(size=size)
+        self.latency = latency or Latency()
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.latency.sleep()
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.latency.sleep()
+        return self.inner.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        await self.latency.asleep()
+        return self.inner.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        await self.latency.asleep()
+        return self.inner.embed_query(text)
+
+
+class FakeEmotion:
+    """analyze_emotion 대역. 실제 감정 분석 프롬프트 기준으로 토큰 수를 센다."""
+
+    def __init__(self, label="우울", latency=None):
+        self.label = label
+        self.latency = latency or Latency()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    async def __call__(self, text):
+        from app.mental_agent import build_emotion_messages
+
+        self.calls += 1
+        self.input_tokens += estimate_tokens(prompt_text(build_emotion_messages(text)))
+        self.output_tokens += estimate_tokens(self.label)
+        await self.latency.asleep()
+        return self.label
+
+
+def install_fakes(llm_latency=None, retrieval_latency=None, emotion_latency=None, embedding_latency=None):
+    """공급자 레지스트리의 LLM / 임베딩 / 벡터스토어 / 감정분석을 가짜로 교체한다.
+
+    감정 분석은 기존 LLM 경로(analyze_emotion 한 번 호출)를 흉내 낸다.
+    """
+    import app.mental_agent as agent
+    from app.cache import CachedEmbeddings
+    from app.emotion import FallbackEmotionClassifier, LLMEmotionClassifier
+    from app.llm_router import LLMRouter
+
+    llms = {
+        "openai": FakeLLM("openai", llm_latency),
+        "gemini": FakeLLM("gemini", llm_latency),
+    }
+    agent.providers.override("llm_pool", llms)
+    agent.providers.override("llm_router", LLMRouter(llms))
+    agent.providers.override("summary_router", LLMRouter(llms, hedge_enabled=False))
+    agent.providers.override("embedding", CachedEmbeddings(FakeEmbeddings(latency=embedding_latency)))
+    agent.retrieval_cache.cache.clear()
+    agent.providers.override("vectorstore", FakeVectorStore(latency=retrieval_latency))
+    emotion = FakeEmotion(latency=emotion_latency)
+    agent.providers.override("emotion_classifier", FallbackEmotionClassifier(LLMEmotionClassifier(emotion), None))
+    return {**llms, "emotion": emotion}
+
+
+async def make_session_factory(path=None, url=None, **engine_kwargs):
+    """테이블과 user/conversation 1건이 준비된 세션 팩토리.
+
+    기본은 SQLite(aiosqlite) 임시 파일 DB라서 동시 요청마다 별도 커넥션을 쓴다.
+    url을 주면 그 DB(예: 로컬 MySQL mysql+aiomysql://...)에 테이블을 만들어 쓴다.
+    """
+    if url is None:
+        if path is None:
+            path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+        url = f"sqlite+aiosqlite:///{path}"
+        engine_kwargs.setdefault("connect_args", {"timeout": 60})
+    engine = create_async_engine(url, **engine_kwargs)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    # 백그라운드 대화 요약도 같은 DB를 쓰도록 한다
+    import app.mental_agent as agent
+    agent.conversation_memory.session_factory = session_factory
+    async with session_factory() as db:
+        user = User(email=f"bench-{uuid4().hex[:8]}@example.com", password="bench", nickname="bench")
+        db.add(user)
+        await db.commit()
+        conv = Conversation(user_id=user.user_id, started_at=datetime.now())
+        db.add(conv)
+        await db.commit()
+        return session_factory, user.user_id, conv.conversation_id
+
+
+async def create_message(db, conversation_id, sender_type, agent_type, content, commit=True):
+    """메시지 한 건 저장 (턴마다 한 건씩 commit하던 이전 쓰기 경로, 시드/비교용)."""
+    msg = Message(
+        conversation_id=conversation_id,
+        sender_type=sender_type,
+        agent_type=agent_type,
+        content=content,
+        created_at=datetime.now(),
+    )
+    db.add(msg)
+    if commit:
+        await db.commit()
+    return msg
+
+
+async def get_conversation_history(db, conversation_id, limit=6):
+    """최근 limit개 메시지를 "Human: ..." / "AI: ..." 줄로 (ConversationMemory 이전의 고정 윈도우, 비교용)."""
+    # 마지막 limit개만 역순으로 가져온 뒤 뒤집는다 (ix_message_conversation_message 사용)
+    result = await db.execute(
+        select(Message.sender_type, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.message_id.desc())
+        .limit(limit)
+    )
+    return "\n".join(
+        f"{'Human' if sender_type == 'user' else 'AI'}: {content}" for sender_type, content in reversed(result.all())
+    )
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
@@ -0,0 +1,3 @@
+-- 대화 기록은 대화별 최근 메시지 몇 개만 읽는다 (ORDER BY message_id DESC LIMIT n).
+-- 이 인덱스가 없으면 대화의 메시지를 모두 훑어 정렬한다.
+CREATE INDEX ix_message_conversation_message ON message (conversation_id, message_id);
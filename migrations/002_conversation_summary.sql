@@ -0,0 +1,10 @@
+-- 토큰 예산을 넘는 오래된 대화를 누적 요약으로 바꿔 저장한다 (app/memory.py ConversationMemory).
+-- last_message_id까지의 메시지가 summary에 반영되어 있다.
+CREATE TABLE conversation_summary (
+    conversation_id INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    last_message_id INTEGER NOT NULL,
+    updated_at DATETIME,
+    PRIMARY KEY (conversation_id),
+    FOREIGN KEY (conversation_id) REFERENCES conversation (conversation_id)
+);
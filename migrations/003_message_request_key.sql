@@ -0,0 +1,6 @@
+-- 쓰기 큐(app/write_queue.py)가 재시도할 때 같은 메시지를 두 번 넣지 않도록 작업마다 request_key를 기록한다.
+-- 이 컬럼이 없으면 큐가 메시지를 반영하지 못하므로 서버는 시작할 때 확인하고 멈춘다 (WriteQueue.start).
+-- 기존 행은 NULL로 남는다 (UNIQUE 인덱스는 NULL을 여러 개 허용한다).
+ALTER TABLE message
+    ADD COLUMN request_key VARCHAR(64) NULL,
+    ADD UNIQUE INDEX request_key (request_key);
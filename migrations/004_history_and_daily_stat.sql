@@ -0,0 +1,41 @@
+-- 추가만 하는 PHQ-9/감정 기록과, 기록을 넣는 트랜잭션에서 함께 더하는 일별 집계 (app/analytics.py).
+-- 과거 메시지의 PHQ-9 점수는 python -m app.phq9 --apply --history-before <날짜>로 채운다.
+CREATE TABLE phq9_history (
+    phq9_history_id INTEGER NOT NULL AUTO_INCREMENT,
+    user_id INTEGER NOT NULL,
+    conversation_id INTEGER,
+    score INTEGER NOT NULL,
+    level VARCHAR(50),
+    created_at DATETIME,
+    request_key VARCHAR(64),
+    PRIMARY KEY (phq9_history_id),
+    FOREIGN KEY (user_id) REFERENCES user (user_id),
+    FOREIGN KEY (conversation_id) REFERENCES conversation (conversation_id),
+    UNIQUE (request_key)
+);
+CREATE INDEX ix_phq9_history_user_id ON phq9_history (user_id, phq9_history_id);
+
+CREATE TABLE emotion_history (
+    emotion_history_id INTEGER NOT NULL AUTO_INCREMENT,
+    user_id INTEGER NOT NULL,
+    conversation_id INTEGER,
+    emotion VARCHAR(20) NOT NULL,
+    depressed BOOL,
+    created_at DATETIME,
+    request_key VARCHAR(64),
+    PRIMARY KEY (emotion_history_id),
+    FOREIGN KEY (user_id) REFERENCES user (user_id),
+    FOREIGN KEY (conversation_id) REFERENCES conversation (conversation_id),
+    UNIQUE (request_key)
+);
+CREATE INDEX ix_emotion_history_user_id ON emotion_history (user_id, emotion_history_id);
+
+CREATE TABLE daily_stat (
+    scope VARCHAR(16) NOT NULL,
+    scope_key VARCHAR(100) NOT NULL,
+    day DATE NOT NULL,
+    metric VARCHAR(40) NOT NULL,
+    count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (scope, scope_key, day, metric)
+);
@@ -0,0 +1,56 @@
+"""app.phq9.extract 표 기반 테스트. 기대값 None은 점수로 저장하면 안 되는 문장.
+
+    python -m pytest tests
+"""
+import pytest
+
+from app.phq9 import extract, phq9_level
+
+CASES = [
+    # 총점을 말하는 문장
+    ("PHQ-9 점수가 12점 나왔어요", 12),
+    ("phq9 검사 결과 총점 15", 15),
+    ("우울증 자가진단 해봤는데 7점이래요", 7),
+    ("설문 결과 27점 만점에 21점이에요", 21),
+    ("PHQ-9 9/27 나왔어요", 9),
+    ("3점 나왔어요 PHQ-9에서", 3),
+    ("PHQ-9 0점이에요", 0),
+    # 점수가 바뀐 문장은 나중 점수
+    ("PHQ-9 점수가 12점에서 7점으로 떨어졌어요", 7),
+    ("PHQ-9 지난달 18점이었는데 오늘 다시 하니 11점", 11),
+    ("PHQ-9 5점부터 시작해서 지금은 14점이에요", 14),
+    # 기준이나 범위를 묻는 문장
+    ("PHQ-9 검사 결과 10점 이상이면 위험한가요?", None),
+    ("PHQ-9 결과 25점 이상이면 병원 가야하나요", None),
+    ("PHQ-9 5점 이하면 정상인가요", None),
+    ("PHQ-9 20점 넘으면 어떡해요", None),
+    ("PHQ-9 10점 미만이면 괜찮은 거죠?", None),
+    # 총점이 아닌 숫자
+    ("PHQ-9 3번 문항 2점이에요", None),
+    ("PHQ-9 검사를 3번 했어요", None),
+    ("PHQ-9 하느라 20분 걸렸어요", None),
+    ("PHQ-9 27점 만점이래요", None),
+    ("PHQ-9 30점 나왔어요", None),
+    # PHQ-9 언급이 없는 숫자
+    ("시험에서 12점 받았어요", None),
+    ("수학 점수가 8점이라 속상해요", None),
+    ("어제 4시간밖에 못 잤어요", None),
+    ("요즘 아무것도 하기 싫어요", None),
+    ("", None),
+]
+
+
+@pytest.mark.parametrize("text, expected", CASES)
+def test_extract(text, expected):
+    match = extract(text)
+    assert (match.score if match else None) == expected
+    if match:
+        assert match.level == phq9_level(expected)
+
+
+@pytest.mark.parametrize("score, level", [
+    (0, "정상"), (4, "정상"), (5, "경미한 우울"), (9, "경미한 우울"), (10, "중등도 우울"),
+    (14, "중등도 우울"), (15, "중증 우울"), (19, "중증 우울"), (20, "매우 심한 우울"), (27, "매우 심한 우울"),
+])
+def test_phq9_level(score, level):
+    assert phq9_level(score) == level